@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file, stream_with_context
 from flask_cors import CORS
 import sys
 import os
 from datetime import datetime, timedelta
 import jwt
+import json
+import math
+import pstats
+import time
 from functools import wraps
 
 # Add parent directory to path
@@ -11,7 +15,24 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit_app'
 
 from user_management.manager import UserManager
 from document_management.manager import DocumentManager
+from document_management.scrubber import StorageScrubber
+from payment_system.gateway import PaymentGateway
+from payment_system.providers import SimulatedProvider, verify_webhook_signature, webhook_secret_usable
+from payment_system.receipt import ReceiptGenerator
+from payment_system.receipt_signing import ReceiptSigner
+from payment_system.receipt_queue import ReceiptQueue
+from database import pool as db_pool
+from database.projection import parse_fields
 from config import config
+from json_provider import OrjsonProvider
+from payment_events import PaymentStatusBroker
+import metrics
+import query_profiler
+from profiling import RequestProfiler
+import tracing
+import compression
+import health
+import batch
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -20,9 +41,24 @@ app = Flask(__name__)
 env = os.getenv('FLASK_ENV', 'development')
 app.config.from_object(config[env])
 
+# orjson for jsonify / get_json (ISO 8601 datetimes, Decimal as numbers)
+app.json = OrjsonProvider(app)
+
 # Enable CORS
 CORS(app, origins=app.config['CORS_ORIGINS'])
 
+# gzip/brotli for JSON and text bodies over COMPRESSION_MIN_BYTES
+if app.config['COMPRESSION_ENABLED']:
+    compression.init_app(app)
+
+# Pool connections; created lazily, so each forked worker opens its own
+if app.config['DB_POOL_ENABLED']:
+    db_pool.configure(
+        minconn=app.config['DB_POOL_MIN_CONN'],
+        maxconn=app.config['DB_POOL_MAX_CONN'],
+        timeout=app.config['DB_POOL_TIMEOUT_SECONDS']
+    )
+
 # Initialize managers
 user_manager = UserManager(
     db_host=app.config['DB_HOST'],
@@ -39,9 +75,81 @@ doc_manager = DocumentManager(
     storage_path=app.config['FILE_STORAGE_PATH']
 )
 
+storage_scrubber = StorageScrubber(doc_manager)
+
+receipt_queue = ReceiptQueue(
+    db_host=app.config['DB_HOST'],
+    db_name=app.config['DB_NAME'],
+    db_user=app.config['DB_USER'],
+    db_pass=app.config['DB_PASS']
+)
+
+# A webhook URL without a real secret would mean unsigned (or trivially forged) settlements
+if (app.config['PAYMENT_WEBHOOK_URL'] and env != 'development'
+        and not webhook_secret_usable(app.config['PAYMENT_WEBHOOK_SECRET'])):
+    raise RuntimeError("PAYMENT_WEBHOOK_SECRET must be set to a private value of 16+ characters")
+
+payment_gateway = PaymentGateway(
+    db_host=app.config['DB_HOST'],
+    db_name=app.config['DB_NAME'],
+    db_user=app.config['DB_USER'],
+    db_pass=app.config['DB_PASS'],
+    provider=SimulatedProvider(
+        failure_rate=app.config['SIMULATED_PROVIDER_FAILURE_RATE'],
+        webhook_url=app.config['PAYMENT_WEBHOOK_URL'],
+        webhook_secret=app.config['PAYMENT_WEBHOOK_SECRET']
+    ),
+    receipt_queue=receipt_queue
+)
+
+receipt_signer = ReceiptSigner.from_files(
+    app.config['RECEIPT_SIGNING_KEY_PATH'],
+    app.config['RECEIPT_VERIFY_KEY_PATH']
+)
+receipt_generator = ReceiptGenerator(output_dir=app.config['RECEIPT_OUTPUT_DIR'], signer=receipt_signer)
+payment_broker = PaymentStatusBroker(payment_gateway)
+
 # Create upload folder
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Prometheus scrape endpoint plus request, DB, bcrypt, upload and cache metrics
+if app.config['METRICS_ENABLED']:
+    metrics.init_app(app, caches={
+        'payment_idempotency': payment_gateway._idempotency_cache,
+        'payment_stats': payment_gateway._stats_cache
+    })
+
+# Opt-in per-request SQL profile and slow-query log
+if app.config['QUERY_PROFILER_ENABLED']:
+    query_profiler.init_app(app)
+
+# Request spans (continuing the client's traceparent) around managers, SQL, bcrypt and file IO
+if app.config['TRACING_ENABLED']:
+    tracing.init_app(app)
+    tracing.trace_methods(user_manager, 'UserManager')
+    tracing.trace_methods(doc_manager, 'DocumentManager')
+    tracing.trace_methods(payment_gateway, 'PaymentGateway')
+
+# Readiness signals for /api/health/ready; sheds low-priority routes under load
+health_monitor = health.HealthMonitor(
+    connect=user_manager.get_connection,
+    storage_path=app.config['FILE_STORAGE_PATH'],
+    receipt_queue=receipt_queue,
+    concurrency=app.config['DB_POOL_MAX_CONN'],
+    db_latency_warn_ms=app.config['HEALTH_DB_LATENCY_WARN_MS'],
+    db_latency_critical_ms=app.config['HEALTH_DB_LATENCY_CRITICAL_MS'],
+    pool_saturation_warn=app.config['HEALTH_POOL_SATURATION_WARN'],
+    disk_min_free_mb=app.config['HEALTH_DISK_MIN_FREE_MB'],
+    bcrypt_max_active=app.config['HEALTH_BCRYPT_MAX_ACTIVE'],
+    backlog_warn=app.config['HEALTH_BACKLOG_WARN'],
+    retry_after_seconds=app.config['LOAD_SHED_RETRY_AFTER_SECONDS']
+)
+health.init_app(app, health_monitor)
+
+# Sampled cProfile of live requests, switched on by admins
+request_profiler = RequestProfiler(output_dir=app.config['PROFILE_OUTPUT_DIR'])
+request_profiler.init_app(app, authenticate=user_manager.verify_token)
+
 # ===========================
 # Authentication Middleware
 # ===========================
@@ -50,6 +158,13 @@ def token_required(f):
     """Decorator to require valid token"""
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Sub-requests of /api/batch reuse the user the batch itself authenticated
+        batch_user = request.environ.get(batch.BATCH_USER_ENVIRON)
+        if batch_user is not None:
+            request.user = batch_user
+            request.token = request.environ[batch.BATCH_TOKEN_ENVIRON]
+            return f(*args, **kwargs)
+        
         token = None
         
         # Get token from headers
@@ -64,7 +179,8 @@ def token_required(f):
             return jsonify({'success': False, 'message': 'Token is missing'}), 401
         
         # Verify token
-        user_info = user_manager.verify_token(token)
+        with tracing.span('token_required'):
+            user_info = user_manager.verify_token(token)
         if not user_info:
             return jsonify({'success': False, 'message': 'Token is invalid or expired'}), 401
         
@@ -109,6 +225,15 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness for load balancers: 503 when this node should be taken out of rotation"""
+    try:
+        report = health_monitor.readiness()
+        return jsonify(dict(report, timestamp=datetime.now().isoformat())), 200 if report['ready'] else 503
+    except Exception as e:
+        return jsonify({'status': 'error', 'ready': False, 'message': str(e)}), 503
+
 # ===========================
 # Authentication Endpoints
 # ===========================
@@ -214,12 +339,15 @@ def get_user(user_id):
         if request.user['user_id'] != user_id and request.user['user_type'] != 'admin':
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
-        profile = user_manager.get_user_profile(user_id)
+        # ?fields=full_name,email selects only those columns (id is always returned)
+        profile = user_manager.get_user_profile(user_id, fields=parse_fields(request.args.get('fields')))
         if profile:
             return jsonify({'success': True, 'user': profile}), 200
         else:
             return jsonify({'success': False, 'message': 'User not found'}), 404
     
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -287,7 +415,8 @@ def upload_document():
         # Save file temporarily
         temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(temp_path)
+        with tracing.span('upload.save_temp', file_name=file.filename):
+            file.save(temp_path)
         
         # Validate file
         is_valid, error_msg = doc_manager.validate_file(temp_path)
@@ -318,13 +447,15 @@ def upload_document():
 def get_documents(request_id):
     """Get documents for request"""
     try:
-        documents = doc_manager.get_request_documents(request_id)
+        documents = doc_manager.get_request_documents(request_id, fields=parse_fields(request.args.get('fields')))
         return jsonify({
             'success': True,
             'documents': documents,
             'count': len(documents)
         }), 200
     
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -369,6 +500,315 @@ def verify_document(doc_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# ===========================
+# Service Request Endpoints
+# ===========================
+
+REQUEST_INCLUDES = {'documents', 'payments'}
+
+@app.route('/api/requests/<int:request_id>', methods=['GET'])
+@token_required
+def get_service_request(request_id):
+    """Get a service request, optionally with its documents and payments embedded
+    
+    ?fields=reference_number,status limits the request's columns,
+    ?include=documents,payments embeds related resources in the same response
+    and ?fields[documents]=file_name,status limits the embedded documents.
+    """
+    try:
+        includes = parse_fields(request.args.get('include')) or set()
+        unknown = includes - REQUEST_INCLUDES
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown include(s): {', '.join(sorted(unknown))}"}), 400
+        
+        service_request = payment_gateway.get_service_request(
+            request_id, fields=parse_fields(request.args.get('fields'))
+        )
+        if not service_request:
+            return jsonify({'success': False, 'message': 'Request not found'}), 404
+        
+        # Citizens can only view their own requests; staff and admins can view any
+        if service_request['user_id'] != request.user['user_id'] and request.user['user_type'] not in ['staff', 'admin']:
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+        
+        if 'documents' in includes:
+            service_request['documents'] = doc_manager.get_request_documents(
+                request_id, fields=parse_fields(request.args.get('fields[documents]'))
+            )
+        if 'payments' in includes:
+            service_request['payments'] = payment_gateway.get_payment_history(
+                request_id=request_id, limit=app.config['ITEMS_PER_PAGE']
+            )['payments']
+        
+        return jsonify({'success': True, 'request': service_request}), 200
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ===========================
+# Payment Endpoints
+# ===========================
+
+FINAL_PAYMENT_STATUSES = ('Completed', 'Failed', 'Refunded')
+
+def can_access_request(request_id):
+    """Citizens may only act on their own requests; staff and admins on any"""
+    if request.user['user_type'] in ['staff', 'admin']:
+        return True
+    return payment_gateway.get_request_owner(request_id) == request.user['user_id']
+
+def payment_payload(payment):
+    """Shape a verify_payment result for API responses"""
+    return {
+        'transaction_id': payment['transaction_id'],
+        'request_id': payment['request_id'],
+        'amount': float(payment['amount']),
+        'method': payment['method'],
+        'status': payment['status'],
+        'paid_at': payment['paid_at'].isoformat() if payment['paid_at'] else None
+    }
+
+def load_accessible_payment(transaction_id):
+    """Fetch a payment the current user may see; returns (payment, error_response)"""
+    payment = payment_gateway.verify_payment(transaction_id)
+    if not payment.get('found'):
+        return None, (jsonify({'success': False, 'message': 'Payment not found'}), 404)
+    if not can_access_request(payment['request_id']):
+        return None, (jsonify({'success': False, 'message': 'Unauthorized'}), 403)
+    return payment, None
+
+@app.route('/api/payments', methods=['POST'])
+@token_required
+def create_payment():
+    """Submit a payment; the final status arrives asynchronously"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'message': 'No JSON data received'}), 400
+        
+        required = ['request_id', 'amount', 'payment_method']
+        missing = [field for field in required if field not in data]
+        if missing:
+            return jsonify({'success': False, 'message': f'Missing required fields: {", ".join(missing)}'}), 400
+        
+        request_id = int(data['request_id'])
+        amount = float(data['amount'])
+        if isinstance(data['amount'], bool) or not math.isfinite(amount) or amount <= 0:
+            return jsonify({'success': False, 'message': 'amount must be a positive number'}), 400
+        
+        payment_method = data['payment_method']
+        if not isinstance(payment_method, str) or payment_method.lower() not in payment_gateway.PAYMENT_METHODS:
+            methods = ', '.join(payment_gateway.PAYMENT_METHODS)
+            return jsonify({'success': False, 'message': f'payment_method must be one of: {methods}'}), 400
+        
+        if not can_access_request(request_id):
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+        
+        # The charge is always the service's fee; the client's amount only has to agree with it
+        service_request = payment_gateway.get_service_request(request_id, fields={'fee'})
+        fee = service_request.get('fee') if service_request else None
+        if not fee:
+            return jsonify({'success': False, 'message': 'This request has no fee to pay'}), 400
+        if round(amount, 2) != round(float(fee), 2):
+            return jsonify({'success': False, 'message': f'amount must equal the service fee ({fee:.2f})'}), 400
+        
+        result = payment_gateway.process_payment(
+            request_id=request_id,
+            amount=float(fee),
+            payment_method=payment_method.lower(),
+            citizen_name=request.user['full_name'],
+            email=request.user['email'],
+            idempotency_key=request.headers.get('Idempotency-Key'),
+            user_id=request.user['user_id']
+        )
+        
+        if not result['success']:
+            status_code = {'Completed': 409, 'Pending': 409, 'Failed': 502}.get(result.get('status'), 400)
+            return jsonify(result), status_code
+        
+        response = jsonify(result)
+        if result.get('replayed'):
+            response.headers['Idempotent-Replayed'] = 'true'
+        response.headers['Location'] = f"/api/payments/{result['transaction_id']}"
+        return response, 202
+    
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid request_id or amount'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/history', methods=['GET'])
+@token_required
+def payment_history():
+    """Keyset-paginated payment history (citizens see only their own)"""
+    try:
+        user_id = request.args.get('user_id', type=int)
+        if request.user['user_type'] not in ['staff', 'admin']:
+            user_id = request.user['user_id']
+        
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        
+        history = payment_gateway.get_payment_history(
+            user_id=user_id,
+            request_id=request.args.get('request_id', type=int),
+            status=request.args.get('status'),
+            payment_method=request.args.get('method'),
+            date_from=datetime.fromisoformat(date_from).date() if date_from else None,
+            date_to=datetime.fromisoformat(date_to).date() if date_to else None,
+            limit=min(request.args.get('limit', app.config['ITEMS_PER_PAGE'], type=int), 100),
+            cursor=request.args.get('cursor')
+        )
+        
+        return jsonify({
+            'success': True,
+            'payments': history['payments'],
+            'next_cursor': history['next_cursor'],
+            'count': len(history['payments'])
+        }), 200
+    
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date or cursor'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/<transaction_id>', methods=['GET'])
+@token_required
+def payment_status(transaction_id):
+    """Get payment status; ?wait=N long-polls until it leaves ?status"""
+    try:
+        payment, error = load_accessible_payment(transaction_id)
+        if error:
+            return error
+        
+        wait = min(request.args.get('wait', 0, type=int), app.config['PAYMENT_LONG_POLL_MAX_SECONDS'])
+        known_status = request.args.get('status', payment['status'])
+        
+        if wait > 0 and payment['status'] == known_status:
+            payment_broker.start()
+            if payment_broker.wait_for_change(transaction_id, known_status, wait):
+                payment = payment_gateway.verify_payment(transaction_id)
+        
+        return jsonify({'success': True, 'payment': payment_payload(payment)}), 200
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/<transaction_id>/events', methods=['GET'])
+@token_required
+def payment_events(transaction_id):
+    """Server-Sent Events stream of a payment's status until it is final
+    
+    The stream closes after PAYMENT_SSE_MAX_SECONDS so a payment stuck in
+    Pending can't hold a worker thread forever; the "retry:" field tells the
+    client how long to wait before reconnecting.
+    """
+    payment, error = load_accessible_payment(transaction_id)
+    if error:
+        return error
+    
+    heartbeat = app.config['PAYMENT_SSE_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['PAYMENT_SSE_MAX_SECONDS']
+    payment_broker.start()
+    
+    def stream():
+        current = payment
+        yield f"retry: {app.config['PAYMENT_SSE_RETRY_MS']}\n"
+        yield f"event: status\ndata: {app.json.dumps(payment_payload(current))}\n\n"
+        
+        while current['status'] not in FINAL_PAYMENT_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = payment_broker.wait_for_change(transaction_id, current['status'], min(heartbeat, remaining))
+            
+            # Re-read on every wakeup, so a notification missed while connecting is recovered
+            latest = payment_gateway.verify_payment(transaction_id)
+            if latest.get('found') and latest['status'] != current['status']:
+                current = latest
+                yield f"event: status\ndata: {app.json.dumps(payment_payload(current))}\n\n"
+            elif not changed:
+                yield ": keep-alive\n\n"
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/payments/<transaction_id>/receipt', methods=['GET'])
+@token_required
+def payment_receipt(transaction_id):
+    """Download the receipt PDF, or report that it is still being rendered"""
+    try:
+        payment, error = load_accessible_payment(transaction_id)
+        if error:
+            return error
+        
+        receipt_path = receipt_generator.get_receipt(transaction_id)
+        if receipt_path:
+            return send_file(receipt_path, mimetype='application/pdf', as_attachment=True,
+                             download_name=f"{transaction_id}.pdf")
+        
+        job = receipt_queue.get_job(transaction_id)
+        if job and job['status'] == 'failed':
+            return jsonify({'success': False, 'status': 'failed', 'message': job['error']}), 500
+        if job:
+            return jsonify({'success': True, 'status': job['status'], 'message': 'Receipt is being generated'}), 202
+        return jsonify({'success': False, 'message': 'No receipt for this payment'}), 404
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/receipts/verify', methods=['GET', 'POST'])
+def verify_receipt_code():
+    """Verify a scanned receipt QR code by signature alone (no database lookup)"""
+    if receipt_signer is None:
+        return jsonify({'success': False, 'message': 'Receipt verification key is not configured'}), 503
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    code = data.get('code') or request.args.get('code')
+    if not code:
+        return jsonify({'success': False, 'message': 'Missing receipt code'}), 400
+    if not isinstance(code, str):
+        return jsonify({'success': False, 'message': 'Receipt code must be a string'}), 400
+    
+    try:
+        result = receipt_signer.verify(code)
+        
+        # Optional online check, e.g. to catch receipts refunded after printing
+        check_status = data.get('check_status') or request.args.get('check_status') == 'true'
+        if result['valid'] and check_status:
+            payment = payment_gateway.verify_payment(result['transaction_id'])
+            result['status'] = payment['status'] if payment.get('found') else None
+        
+        return jsonify({'success': result['valid'], **result}), 200 if result['valid'] else 400
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/webhook', methods=['POST'])
+def payment_webhook():
+    """Receive provider settlement webhooks (HMAC-signed)"""
+    if not webhook_secret_usable(app.config['PAYMENT_WEBHOOK_SECRET']):
+        return jsonify({'success': False, 'message': 'Payment webhooks are not configured'}), 503
+    
+    body = request.get_data()
+    if not verify_webhook_signature(body, request.headers.get('X-Webhook-Signature'),
+                                    app.config['PAYMENT_WEBHOOK_SECRET']):
+        return jsonify({'success': False, 'message': 'Invalid signature'}), 401
+    
+    try:
+        result = payment_gateway.handle_webhook(json.loads(body))
+        return jsonify(result), 200 if result['success'] else 400
+    except (ValueError, KeyError):
+        return jsonify({'success': False, 'message': 'Malformed webhook payload'}), 400
+
 # ===========================
 # Admin Endpoints
 # ===========================
@@ -399,6 +839,110 @@ def admin_cleanup_documents():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/admin/documents/scrub', methods=['POST'])
+@admin_required
+def admin_scrub_documents():
+    """Run one incremental storage integrity scrub (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = storage_scrubber.run(
+            max_rows=int(data.get('max_rows', 10000)),
+            max_directories=int(data.get('max_directories', 500)),
+            verify_checksums=bool(data.get('verify_checksums', False)),
+            apply=bool(data.get('apply', False))
+        )
+        return jsonify(result), 200 if result['success'] else 500
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/payments/<transaction_id>/refund', methods=['POST'])
+@admin_required
+def admin_refund_payment(transaction_id):
+    """Refund a completed payment (admin only)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = payment_gateway.refund_payment(
+            transaction_id,
+            reason=data.get('reason'),
+            refunded_by=request.user['username']
+        )
+        return jsonify(result), 200 if result['success'] else 409
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/payments/ledger', methods=['GET'])
+@admin_required
+def admin_ledger_balances():
+    """Per-service ledger balances for a date range (admin only)"""
+    try:
+        date_to = request.args.get('date_to')
+        date_to = datetime.fromisoformat(date_to).date() if date_to else datetime.now().date()
+        date_from = request.args.get('date_from')
+        date_from = datetime.fromisoformat(date_from).date() if date_from else date_to.replace(day=1)
+    
+        result = payment_gateway.ledger.get_balances(date_from, date_to)
+        return jsonify({'success': True, **result}), 200
+    
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def admin_profiling():
+    """Show or change CPU profiling sampling for all workers (admin only)"""
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, 'profiling': request_profiler.settings()}), 200
+        
+        data = request.get_json(silent=True) or {}
+        control = request_profiler.configure(
+            enabled=data.get('enabled', False),
+            sample_rate=data.get('sample_rate', 0.01),
+            route_prefix=data.get('route_prefix'),
+            duration_seconds=data.get('duration_seconds')
+        )
+        return jsonify({'success': True, 'profiling': control}), 200
+    
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid sample_rate or duration_seconds'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def admin_list_profiles():
+    """List captured CPU profiles, newest first (admin only)"""
+    try:
+        profiles = request_profiler.list_profiles(
+            route=request.args.get('route'),
+            limit=min(request.args.get('limit', 50, type=int), 500)
+        )
+        return jsonify({'success': True, 'profiles': profiles, 'count': len(profiles)}), 200
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+@admin_required
+def admin_download_profile(name):
+    """Download a pstats file, or ?format=text for the top functions (admin only)"""
+    path = request_profiler.profile_path(name)
+    if path is None:
+        return jsonify({'success': False, 'message': 'Profile not found'}), 404
+    
+    if request.args.get('format') == 'text':
+        try:
+            text = request_profiler.render_text(name, sort=request.args.get('sort', 'cumulative'))
+        except ValueError:
+            sort_keys = ', '.join(key.value for key in pstats.SortKey)
+            return jsonify({'success': False, 'message': f'sort must be one of: {sort_keys}'}), 400
+        return Response(text, mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
 @app.route('/api/admin/statistics', methods=['GET'])
 @admin_required
 def admin_statistics():
@@ -417,6 +961,38 @@ def admin_statistics():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# ===========================
+# Batch Endpoint
+# ===========================
+
+# Sub-requests skip the request hooks, so shedding is applied to each one here
+batch_runner = batch.BatchRunner(
+    app,
+    max_concurrency=app.config['BATCH_MAX_CONCURRENCY'],
+    admit=health_monitor.shed_reason if app.config['LOAD_SHED_ENABLED'] else None
+)
+
+@app.route('/api/batch', methods=['POST'])
+@token_required
+def batch_requests():
+    """Run several API calls in one round trip, authenticated once
+    
+    Body: {"requests": [{"id": "...", "method": "GET", "path": "/api/...", "body": {...}}]}
+    Returns each sub-request's status and JSON body, in request order.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('requests')
+        error = batch.validate(items, app.config['BATCH_MAX_REQUESTS'])
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        
+        responses = batch_runner.run(items, request.user, request.token)
+        return jsonify({'success': True, 'responses': responses}), 200
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # ===========================
 # Error Handlers
 # ===========================
@@ -436,11 +1012,38 @@ def forbidden(error):
     """Handle 403 errors"""
     return jsonify({'success': False, 'message': 'Forbidden'}), 403
 
+# ===========================
+# Worker Lifecycle
+# ===========================
+
+def init_worker(pool_size=None, concurrency=None):
+    """Per-process setup after fork (called from gunicorn.conf.py post_fork)
+    
+    Drops pools and cached state inherited from the preloaded master and
+    opens this worker's own pool, sized to its thread count.
+    """
+    health_monitor.reset(concurrency=concurrency or pool_size)
+    
+    if app.config['DB_POOL_ENABLED']:
+        db_pool.init_worker(maxconn=pool_size)
+        db_pool.warm(app.config['DB_HOST'], app.config['DB_NAME'],
+                     app.config['DB_USER'], app.config['DB_PASS'])
+    
+    # Caches are per process; start each worker empty
+    payment_gateway._idempotency_cache.clear()
+    payment_gateway._stats_cache.clear()
+
+def shutdown_worker():
+    """Release per-process resources when a worker exits"""
+    payment_gateway.provider.shutdown()
+    db_pool.close_all()
+
 # ===========================
 # Main
 # ===========================
 
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
     app.run(
         host='0.0.0.0',
         port=5000,
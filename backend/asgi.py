@@ -0,0 +1,885 @@
+"""
+ASGI variant of the CanConnect API (Quart on an asyncio event loop)
+
+Serves the citizen-facing API of app.py (auth, users, requests, documents,
+payments, receipts, the admin listings) with the same payloads and status
+codes, using the async managers on a psycopg 3 connection pool. Suited to
+many concurrent, mostly waiting clients (long-polls, SSE, slow mobile
+uploads):
+
+    hypercorn asgi:app --bind 0.0.0.0:5000 --workers 2
+
+Not ported yet; these are only served by app.py:
+
+- GET /api/health/ready and priority load shedding (health.py)
+- POST /api/batch (batch.py)
+- GET /metrics, query timing and request tracing (metrics.py, query_profiler.py, tracing.py)
+- the /api/admin/profiling and /api/admin/profiles endpoints (profiling.py)
+- gzip/brotli response compression (compression.py); put it in the proxy
+"""
+
+from quart import Quart, request, jsonify, make_response, send_file
+from quart_cors import cors
+import asyncio
+import sys
+import os
+from datetime import datetime
+import json
+import math
+import time
+from functools import wraps
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'streamlit_app'))
+
+from user_management.async_manager import AsyncUserManager
+from document_management.async_manager import AsyncDocumentManager
+from document_management.scrubber import StorageScrubber
+from payment_system.async_gateway import AsyncPaymentGateway
+from payment_system.providers import SimulatedProvider, verify_webhook_signature, webhook_secret_usable
+from payment_system.receipt import ReceiptGenerator
+from payment_system.receipt_signing import ReceiptSigner
+from payment_system.receipt_queue import ReceiptQueue
+from database.async_pool import create_pool
+from database.projection import parse_fields
+from config import config
+from json_provider import OrjsonProvider
+from payment_events import AsyncPaymentStatusBroker
+
+# Initialize Quart app
+app = Quart(__name__)
+
+# Load configuration
+env = os.getenv('FLASK_ENV', 'development')
+app.config.from_object(config[env])
+
+# orjson for jsonify / get_json (ISO 8601 datetimes, Decimal as numbers)
+app.json = OrjsonProvider(app)
+
+# Enable CORS
+app = cors(app, allow_origin=app.config['CORS_ORIGINS'])
+
+# Opened in the serving event loop (see Lifecycle below)
+db_pool = create_pool(
+    host=app.config['DB_HOST'],
+    database=app.config['DB_NAME'],
+    user=app.config['DB_USER'],
+    password=app.config['DB_PASS'],
+    min_size=app.config['DB_POOL_MIN_CONN'],
+    max_size=app.config['DB_POOL_MAX_CONN'],
+    timeout=app.config['DB_POOL_TIMEOUT_SECONDS']
+)
+
+# Initialize managers
+user_manager = AsyncUserManager(db_pool)
+
+doc_manager = AsyncDocumentManager(
+    db_pool,
+    db_host=app.config['DB_HOST'],
+    db_name=app.config['DB_NAME'],
+    db_user=app.config['DB_USER'],
+    db_pass=app.config['DB_PASS'],
+    storage_path=app.config['FILE_STORAGE_PATH']
+)
+
+storage_scrubber = StorageScrubber(doc_manager)
+
+receipt_queue = ReceiptQueue(
+    db_host=app.config['DB_HOST'],
+    db_name=app.config['DB_NAME'],
+    db_user=app.config['DB_USER'],
+    db_pass=app.config['DB_PASS']
+)
+
+# A webhook URL without a real secret would mean unsigned (or trivially forged) settlements
+if (app.config['PAYMENT_WEBHOOK_URL'] and env != 'development'
+        and not webhook_secret_usable(app.config['PAYMENT_WEBHOOK_SECRET'])):
+    raise RuntimeError("PAYMENT_WEBHOOK_SECRET must be set to a private value of 16+ characters")
+
+payment_gateway = AsyncPaymentGateway(
+    db_pool,
+    db_host=app.config['DB_HOST'],
+    db_name=app.config['DB_NAME'],
+    db_user=app.config['DB_USER'],
+    db_pass=app.config['DB_PASS'],
+    provider=SimulatedProvider(
+        failure_rate=app.config['SIMULATED_PROVIDER_FAILURE_RATE'],
+        webhook_url=app.config['PAYMENT_WEBHOOK_URL'],
+        webhook_secret=app.config['PAYMENT_WEBHOOK_SECRET']
+    ),
+    receipt_queue=receipt_queue
+)
+
+receipt_signer = ReceiptSigner.from_files(
+    app.config['RECEIPT_SIGNING_KEY_PATH'],
+    app.config['RECEIPT_VERIFY_KEY_PATH']
+)
+receipt_generator = ReceiptGenerator(output_dir=app.config['RECEIPT_OUTPUT_DIR'], signer=receipt_signer)
+payment_broker = AsyncPaymentStatusBroker(payment_gateway)
+
+# ===========================
+# Lifecycle
+# ===========================
+
+@app.before_serving
+async def startup():
+    """Open the pool and status listener inside the serving event loop"""
+    await db_pool.open(wait=True)
+    payment_broker.start()
+
+@app.after_serving
+async def shutdown():
+    """Release per-process resources"""
+    await payment_broker.stop()
+    payment_gateway.provider.shutdown()
+    user_manager.executor.shutdown(wait=False)
+    await db_pool.close()
+
+# ===========================
+# Authentication Middleware
+# ===========================
+
+def token_required(f):
+    """Decorator to require valid token"""
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = None
+
+        # Get token from headers
+        if 'Authorization' in request.headers:
+            auth_header = request.headers['Authorization']
+            try:
+                token = auth_header.split(' ')[1]  # Bearer <token>
+            except IndexError:
+                return jsonify({'success': False, 'message': 'Invalid token format'}), 401
+
+        if not token:
+            return jsonify({'success': False, 'message': 'Token is missing'}), 401
+
+        # Verify token
+        user_info = await user_manager.verify_token(token)
+        if not user_info:
+            return jsonify({'success': False, 'message': 'Token is invalid or expired'}), 401
+
+        # Store user info in request context
+        request.user = user_info
+        request.token = token
+
+        return await f(*args, **kwargs)
+
+    return decorated
+
+def admin_required(f):
+    """Decorator to require admin role"""
+    @wraps(f)
+    @token_required
+    async def decorated(*args, **kwargs):
+        if request.user['user_type'] != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        return await f(*args, **kwargs)
+    return decorated
+
+def staff_or_admin_required(f):
+    """Decorator to require staff or admin role"""
+    @wraps(f)
+    @token_required
+    async def decorated(*args, **kwargs):
+        if request.user['user_type'] not in ['staff', 'admin']:
+            return jsonify({'success': False, 'message': 'Staff access required'}), 403
+        return await f(*args, **kwargs)
+    return decorated
+
+# ===========================
+# Health Check
+# ===========================
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'ok',
+        'message': 'CanConnect API is running',
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+# ===========================
+# Authentication Endpoints
+# ===========================
+
+@app.route('/api/auth/register', methods=['POST', 'OPTIONS'])
+async def register():
+    """Register new user"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'success': False, 'message': 'No JSON data received'}), 400
+
+        # Validate required fields
+        required = ['first_name', 'last_name', 'email', 'password', 'phone']
+        missing = [field for field in required if field not in data]
+        if missing:
+            return jsonify({'success': False, 'message': f'Missing required fields: {", ".join(missing)}'}), 400
+
+        result = await user_manager.create_user(
+            username=data['email'].split('@')[0],
+            email=data['email'],
+            password=data['password'],
+            full_name=f"{data['first_name']} {data['last_name']}",
+            phone=data.get('phone'),
+            user_type=data.get('user_type', 'citizen')
+        )
+
+        return jsonify(result), 201 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
+async def login():
+    """Login user"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'success': False, 'message': 'No JSON data received'}), 400
+
+        if not data.get('email') or not data.get('password'):
+            return jsonify({'success': False, 'message': 'Email and password required'}), 400
+
+        result = await user_manager.login(
+            username_or_email=data['email'],
+            password=data['password'],
+            ip_address=request.remote_addr
+        )
+
+        return jsonify(result), 200 if result['success'] else 401
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+@token_required
+async def logout():
+    """Logout user"""
+    try:
+        result = await user_manager.logout(request.token)
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/auth/verify', methods=['GET'])
+@token_required
+async def verify_token():
+    """Verify current token"""
+    return jsonify({
+        'success': True,
+        'user': request.user
+    }), 200
+
+# ===========================
+# User Endpoints
+# ===========================
+
+@app.route('/api/users/<int:user_id>', methods=['GET'])
+@token_required
+async def get_user(user_id):
+    """Get user profile"""
+    try:
+        if request.user['user_id'] != user_id and request.user['user_type'] != 'admin':
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+        profile = await user_manager.get_user_profile(user_id, fields=parse_fields(request.args.get('fields')))
+        if profile:
+            return jsonify({'success': True, 'user': profile}), 200
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/users/<int:user_id>', methods=['PUT'])
+@token_required
+async def update_user(user_id):
+    """Update user profile"""
+    try:
+        if request.user['user_id'] != user_id and request.user['user_type'] != 'admin':
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+        data = await request.get_json()
+        result = await user_manager.update_user_profile(user_id, data)
+
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/users/<int:user_id>/password', methods=['POST'])
+@token_required
+async def change_password(user_id):
+    """Change user password"""
+    try:
+        if request.user['user_id'] != user_id:
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+        data = await request.get_json()
+
+        if not data.get('old_password') or not data.get('new_password'):
+            return jsonify({'success': False, 'message': 'Old and new passwords required'}), 400
+
+        result = await user_manager.change_password(
+            user_id=user_id,
+            old_password=data['old_password'],
+            new_password=data['new_password']
+        )
+
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ===========================
+# Document Endpoints
+# ===========================
+
+@app.route('/api/documents/upload', methods=['POST'])
+@token_required
+async def upload_document():
+    """Upload document"""
+    try:
+        files = await request.files
+        if 'file' not in files:
+            return jsonify({'success': False, 'message': 'No file provided'}), 400
+
+        file = files['file']
+        form = await request.form
+        request_id = form.get('request_id', type=int)
+        document_type_id = form.get('document_type_id', type=int)
+
+        if not request_id or not document_type_id:
+            return jsonify({'success': False, 'message': 'Request ID and document type required'}), 400
+
+        # Stream straight into storage; no temporary copy
+        result = await doc_manager.upload_document_stream(
+            request_id=request_id,
+            user_id=request.user['user_id'],
+            file_obj=file.stream,
+            file_name=file.filename,
+            document_type_id=document_type_id,
+            expiry_days=365
+        )
+
+        return jsonify(result), 201 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/documents/<int:request_id>', methods=['GET'])
+@token_required
+async def get_documents(request_id):
+    """Get documents for request"""
+    try:
+        documents = await doc_manager.get_request_documents(
+            request_id, fields=parse_fields(request.args.get('fields'))
+        )
+        return jsonify({
+            'success': True,
+            'documents': documents,
+            'count': len(documents)
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/documents/<int:doc_id>/download', methods=['GET'])
+@token_required
+async def download_document(doc_id):
+    """Download document"""
+    try:
+        file_path = await doc_manager.download_document(doc_id)
+
+        if not file_path:
+            return jsonify({'success': False, 'message': 'Document not found'}), 404
+
+        return {
+            'success': True,
+            'file_path': file_path,
+            'file_name': os.path.basename(file_path)
+        }, 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/documents/<int:doc_id>', methods=['DELETE'])
+@token_required
+async def delete_document(doc_id):
+    """Delete document"""
+    try:
+        result = await doc_manager.delete_document(doc_id)
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/documents/<int:doc_id>/verify', methods=['POST'])
+@staff_or_admin_required
+async def verify_document(doc_id):
+    """Verify document (staff only)"""
+    try:
+        result = await doc_manager.verify_document(doc_id, request.user['user_id'])
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ===========================
+# Service Request Endpoints
+# ===========================
+
+REQUEST_INCLUDES = {'documents', 'payments'}
+
+@app.route('/api/requests/<int:request_id>', methods=['GET'])
+@token_required
+async def get_service_request(request_id):
+    """Get a service request, optionally with its documents and payments embedded"""
+    try:
+        includes = parse_fields(request.args.get('include')) or set()
+        unknown = includes - REQUEST_INCLUDES
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown include(s): {', '.join(sorted(unknown))}"}), 400
+        document_fields = parse_fields(request.args.get('fields[documents]'))
+
+        service_request = await payment_gateway.get_service_request(
+            request_id, fields=parse_fields(request.args.get('fields'))
+        )
+        if not service_request:
+            return jsonify({'success': False, 'message': 'Request not found'}), 404
+
+        if service_request['user_id'] != request.user['user_id'] and request.user['user_type'] not in ['staff', 'admin']:
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+        # Embedded resources are independent, so fetch them concurrently
+        embeds = {}
+        if 'documents' in includes:
+            embeds['documents'] = doc_manager.get_request_documents(request_id, fields=document_fields)
+        if 'payments' in includes:
+            embeds['payments'] = payment_gateway.get_payment_history(
+                request_id=request_id, limit=app.config['ITEMS_PER_PAGE']
+            )
+        results = dict(zip(embeds, await asyncio.gather(*embeds.values())))
+        if 'documents' in results:
+            service_request['documents'] = results['documents']
+        if 'payments' in results:
+            service_request['payments'] = results['payments']['payments']
+
+        return jsonify({'success': True, 'request': service_request}), 200
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ===========================
+# Payment Endpoints
+# ===========================
+
+FINAL_PAYMENT_STATUSES = ('Completed', 'Failed', 'Refunded')
+
+async def can_access_request(request_id):
+    """Citizens may only act on their own requests; staff and admins on any"""
+    if request.user['user_type'] in ['staff', 'admin']:
+        return True
+    return await payment_gateway.get_request_owner(request_id) == request.user['user_id']
+
+def payment_payload(payment):
+    """Shape a verify_payment result for API responses"""
+    return {
+        'transaction_id': payment['transaction_id'],
+        'request_id': payment['request_id'],
+        'amount': float(payment['amount']),
+        'method': payment['method'],
+        'status': payment['status'],
+        'paid_at': payment['paid_at'].isoformat() if payment['paid_at'] else None
+    }
+
+async def load_accessible_payment(transaction_id):
+    """Fetch a payment the current user may see; returns (payment, error_response)"""
+    payment = await payment_gateway.verify_payment(transaction_id)
+    if not payment.get('found'):
+        return None, (jsonify({'success': False, 'message': 'Payment not found'}), 404)
+    if not await can_access_request(payment['request_id']):
+        return None, (jsonify({'success': False, 'message': 'Unauthorized'}), 403)
+    return payment, None
+
+@app.route('/api/payments', methods=['POST'])
+@token_required
+async def create_payment():
+    """Submit a payment; the final status arrives asynchronously"""
+    try:
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'success': False, 'message': 'No JSON data received'}), 400
+
+        required = ['request_id', 'amount', 'payment_method']
+        missing = [field for field in required if field not in data]
+        if missing:
+            return jsonify({'success': False, 'message': f'Missing required fields: {", ".join(missing)}'}), 400
+
+        request_id = int(data['request_id'])
+        amount = float(data['amount'])
+        if isinstance(data['amount'], bool) or not math.isfinite(amount) or amount <= 0:
+            return jsonify({'success': False, 'message': 'amount must be a positive number'}), 400
+
+        payment_method = data['payment_method']
+        if not isinstance(payment_method, str) or payment_method.lower() not in payment_gateway.PAYMENT_METHODS:
+            methods = ', '.join(payment_gateway.PAYMENT_METHODS)
+            return jsonify({'success': False, 'message': f'payment_method must be one of: {methods}'}), 400
+
+        if not await can_access_request(request_id):
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+        # The charge is always the service's fee; the client's amount only has to agree with it
+        service_request = await payment_gateway.get_service_request(request_id, fields={'fee'})
+        fee = service_request.get('fee') if service_request else None
+        if not fee:
+            return jsonify({'success': False, 'message': 'This request has no fee to pay'}), 400
+        if round(amount, 2) != round(float(fee), 2):
+            return jsonify({'success': False, 'message': f'amount must equal the service fee ({fee:.2f})'}), 400
+
+        result = await payment_gateway.process_payment(
+            request_id=request_id,
+            amount=float(fee),
+            payment_method=payment_method.lower(),
+            citizen_name=request.user['full_name'],
+            email=request.user['email'],
+            idempotency_key=request.headers.get('Idempotency-Key'),
+            user_id=request.user['user_id']
+        )
+
+        if not result['success']:
+            status_code = {'Completed': 409, 'Pending': 409, 'Failed': 502}.get(result.get('status'), 400)
+            return jsonify(result), status_code
+
+        response = jsonify(result)
+        if result.get('replayed'):
+            response.headers['Idempotent-Replayed'] = 'true'
+        response.headers['Location'] = f"/api/payments/{result['transaction_id']}"
+        return response, 202
+
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid request_id or amount'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/history', methods=['GET'])
+@token_required
+async def payment_history():
+    """Keyset-paginated payment history (citizens see only their own)"""
+    try:
+        user_id = request.args.get('user_id', type=int)
+        if request.user['user_type'] not in ['staff', 'admin']:
+            user_id = request.user['user_id']
+
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+
+        history = await payment_gateway.get_payment_history(
+            user_id=user_id,
+            request_id=request.args.get('request_id', type=int),
+            status=request.args.get('status'),
+            payment_method=request.args.get('method'),
+            date_from=datetime.fromisoformat(date_from).date() if date_from else None,
+            date_to=datetime.fromisoformat(date_to).date() if date_to else None,
+            limit=min(request.args.get('limit', app.config['ITEMS_PER_PAGE'], type=int), 100),
+            cursor=request.args.get('cursor')
+        )
+
+        return jsonify({
+            'success': True,
+            'payments': history['payments'],
+            'next_cursor': history['next_cursor'],
+            'count': len(history['payments'])
+        }), 200
+
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date or cursor'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/<transaction_id>', methods=['GET'])
+@token_required
+async def payment_status(transaction_id):
+    """Get payment status; ?wait=N long-polls until it leaves ?status"""
+    try:
+        payment, error = await load_accessible_payment(transaction_id)
+        if error:
+            return error
+
+        wait = min(request.args.get('wait', 0, type=int), app.config['PAYMENT_LONG_POLL_MAX_SECONDS'])
+        known_status = request.args.get('status', payment['status'])
+
+        # Waiting costs a coroutine, not a thread or a pooled connection
+        if wait > 0 and payment['status'] == known_status:
+            if await payment_broker.wait_for_change(transaction_id, known_status, wait):
+                payment = await payment_gateway.verify_payment(transaction_id)
+
+        return jsonify({'success': True, 'payment': payment_payload(payment)}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/<transaction_id>/events', methods=['GET'])
+@token_required
+async def payment_events(transaction_id):
+    """Server-Sent Events stream of a payment's status until it is final (or PAYMENT_SSE_MAX_SECONDS)"""
+    payment, error = await load_accessible_payment(transaction_id)
+    if error:
+        return error
+
+    heartbeat = app.config['PAYMENT_SSE_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['PAYMENT_SSE_MAX_SECONDS']
+
+    async def stream():
+        current = payment
+        yield f"retry: {app.config['PAYMENT_SSE_RETRY_MS']}\n".encode('utf-8')
+        yield f"event: status\ndata: {app.json.dumps(payment_payload(current))}\n\n".encode('utf-8')
+
+        while current['status'] not in FINAL_PAYMENT_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = await payment_broker.wait_for_change(
+                transaction_id, current['status'], min(heartbeat, remaining)
+            )
+
+            # Re-read on every wakeup, so a notification missed while connecting is recovered
+            latest = await payment_gateway.verify_payment(transaction_id)
+            if latest.get('found') and latest['status'] != current['status']:
+                current = latest
+                yield f"event: status\ndata: {app.json.dumps(payment_payload(current))}\n\n".encode('utf-8')
+            elif not changed:
+                yield b": keep-alive\n\n"
+
+    response = await make_response(
+        stream(),
+        200,
+        {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The stream ends on its own deadline, not on Quart's default response timeout
+    response.timeout = None
+    return response
+
+@app.route('/api/payments/<transaction_id>/receipt', methods=['GET'])
+@token_required
+async def payment_receipt(transaction_id):
+    """Download the receipt PDF, or report that it is still being rendered"""
+    try:
+        payment, error = await load_accessible_payment(transaction_id)
+        if error:
+            return error
+
+        receipt_path = await asyncio.to_thread(receipt_generator.get_receipt, transaction_id)
+        if receipt_path:
+            return await send_file(receipt_path, mimetype='application/pdf', as_attachment=True,
+                                   download_name=f"{transaction_id}.pdf")
+
+        job = await asyncio.to_thread(receipt_queue.get_job, transaction_id)
+        if job and job['status'] == 'failed':
+            return jsonify({'success': False, 'status': 'failed', 'message': job['error']}), 500
+        if job:
+            return jsonify({'success': True, 'status': job['status'], 'message': 'Receipt is being generated'}), 202
+        return jsonify({'success': False, 'message': 'No receipt for this payment'}), 404
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/receipts/verify', methods=['GET', 'POST'])
+async def verify_receipt_code():
+    """Verify a scanned receipt QR code by signature alone (no database lookup)"""
+    if receipt_signer is None:
+        return jsonify({'success': False, 'message': 'Receipt verification key is not configured'}), 503
+
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    code = data.get('code') or request.args.get('code')
+    if not code:
+        return jsonify({'success': False, 'message': 'Missing receipt code'}), 400
+    if not isinstance(code, str):
+        return jsonify({'success': False, 'message': 'Receipt code must be a string'}), 400
+
+    try:
+        result = receipt_signer.verify(code)
+
+        # Optional online check, e.g. to catch receipts refunded after printing
+        check_status = data.get('check_status') or request.args.get('check_status') == 'true'
+        if result['valid'] and check_status:
+            payment = await payment_gateway.verify_payment(result['transaction_id'])
+            result['status'] = payment['status'] if payment.get('found') else None
+
+        return jsonify({'success': result['valid'], **result}), 200 if result['valid'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/payments/webhook', methods=['POST'])
+async def payment_webhook():
+    """Receive provider settlement webhooks (HMAC-signed)"""
+    if not webhook_secret_usable(app.config['PAYMENT_WEBHOOK_SECRET']):
+        return jsonify({'success': False, 'message': 'Payment webhooks are not configured'}), 503
+
+    body = await request.get_data()
+    if not verify_webhook_signature(body, request.headers.get('X-Webhook-Signature'),
+                                    app.config['PAYMENT_WEBHOOK_SECRET']):
+        return jsonify({'success': False, 'message': 'Invalid signature'}), 401
+
+    try:
+        result = await payment_gateway.handle_webhook(json.loads(body))
+        return jsonify(result), 200 if result['success'] else 400
+    except (ValueError, KeyError):
+        return jsonify({'success': False, 'message': 'Malformed webhook payload'}), 400
+
+# ===========================
+# Admin Endpoints
+# ===========================
+
+@app.route('/api/admin/users', methods=['GET'])
+@admin_required
+async def admin_list_users():
+    """List all users (admin only)"""
+    try:
+        users = await user_manager.list_staff()
+        return jsonify({
+            'success': True,
+            'users': users,
+            'count': len(users)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/documents/cleanup', methods=['POST'])
+@admin_required
+async def admin_cleanup_documents():
+    """Run document cleanup (admin only)"""
+    try:
+        result = await doc_manager.cleanup_expired_documents()
+        return jsonify(result), 200 if result['success'] else 400
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/documents/scrub', methods=['POST'])
+@admin_required
+async def admin_scrub_documents():
+    """Run one incremental storage integrity scrub (admin only)"""
+    try:
+        data = await request.get_json(silent=True) or {}
+        # The scrubber is thread-pooled and synchronous; run it beside the loop
+        result = await asyncio.to_thread(
+            storage_scrubber.run,
+            max_rows=int(data.get('max_rows', 10000)),
+            max_directories=int(data.get('max_directories', 500)),
+            verify_checksums=bool(data.get('verify_checksums', False)),
+            apply=bool(data.get('apply', False))
+        )
+        return jsonify(result), 200 if result['success'] else 500
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/payments/<transaction_id>/refund', methods=['POST'])
+@admin_required
+async def admin_refund_payment(transaction_id):
+    """Refund a completed payment (admin only)"""
+    try:
+        data = await request.get_json(silent=True) or {}
+        result = await payment_gateway.refund_payment(
+            transaction_id,
+            reason=data.get('reason'),
+            refunded_by=request.user['username']
+        )
+        return jsonify(result), 200 if result['success'] else 409
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/payments/ledger', methods=['GET'])
+@admin_required
+async def admin_ledger_balances():
+    """Per-service ledger balances for a date range (admin only)"""
+    try:
+        date_to = request.args.get('date_to')
+        date_to = datetime.fromisoformat(date_to).date() if date_to else datetime.now().date()
+        date_from = request.args.get('date_from')
+        date_from = datetime.fromisoformat(date_from).date() if date_from else date_to.replace(day=1)
+
+        result = await asyncio.to_thread(payment_gateway.ledger.get_balances, date_from, date_to)
+        return jsonify({'success': True, **result}), 200
+
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/statistics', methods=['GET'])
+@admin_required
+async def admin_statistics():
+    """Get system statistics (admin only)"""
+    try:
+        user_stats, doc_stats = await asyncio.gather(
+            user_manager.get_user_statistics(),
+            doc_manager.get_storage_stats()
+        )
+
+        return jsonify({
+            'success': True,
+            'users': user_stats,
+            'documents': doc_stats,
+            'timestamp': datetime.now().isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# ===========================
+# Error Handlers
+# ===========================
+
+@app.errorhandler(404)
+async def not_found(error):
+    """Handle 404 errors"""
+    return jsonify({'success': False, 'message': 'Endpoint not found'}), 404
+
+@app.errorhandler(500)
+async def internal_error(error):
+    """Handle 500 errors"""
+    return jsonify({'success': False, 'message': 'Internal server error'}), 500
+
+@app.errorhandler(403)
+async def forbidden(error):
+    """Handle 403 errors"""
+    return jsonify({'success': False, 'message': 'Forbidden'}), 403
+
+# ===========================
+# Main
+# ===========================
+
+if __name__ == '__main__':
+    # Development server only; production runs hypercorn asgi:app
+    app.run(
+        host='0.0.0.0',
+        port=5000,
+        debug=app.config['DEBUG']
+    )
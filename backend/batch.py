@@ -0,0 +1,159 @@
+"""
+Batch endpoint support: run several API calls in one round trip
+
+    POST /api/batch
+    {"requests": [
+        {"id": "me",   "method": "GET", "path": "/api/users/7?fields=full_name"},
+        {"id": "docs", "method": "GET", "path": "/api/documents/12"},
+        {"id": "pay",  "method": "POST", "path": "/api/payments", "body": {...}}
+    ]}
+
+The batch is authenticated once; each sub-request runs the target view with
+that user (token_required reads it from the sub-request's WSGI environ, which
+clients cannot set) instead of looking the session up again. Consecutive
+GETs run concurrently, each on its own pooled connection, at most
+max_concurrency at a time so one batch can't drain the worker's pool.
+Any other method is a barrier: it runs alone, in order, after the reads
+before it. Streaming and file-download endpoints are not batchable.
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+import tracing
+
+# Set on sub-request environs; never derived from client headers
+BATCH_USER_ENVIRON = 'canconnect.batch_user'
+BATCH_TOKEN_ENVIRON = 'canconnect.batch_token'
+
+# SSE streams and file downloads can't be returned inside a JSON envelope
+EXCLUDED_ENDPOINTS = {
+    'batch_requests', 'payment_events', 'payment_receipt', 'download_document',
+    'admin_download_profile', 'upload_document', 'payment_webhook'
+}
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+
+
+def validate(items, max_requests):
+    """Error message for a malformed batch, or None"""
+    if not isinstance(items, list) or not items:
+        return "'requests' must be a non-empty list"
+    if len(items) > max_requests:
+        return f"At most {max_requests} requests per batch"
+    ids = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            return f"Request {index} needs a 'path'"
+        if not item['path'].startswith('/api/'):
+            return f"Request {index}: path must start with /api/"
+        if str(item.get('method', 'GET')).upper() not in ALLOWED_METHODS:
+            return f"Request {index}: unsupported method"
+        item_id = item.get('id', index)
+        if not isinstance(item_id, (str, int)):
+            return f"Request {index}: 'id' must be a string or number"
+        if item_id in ids:
+            return f"Duplicate request id {item_id!r}"
+        ids.add(item_id)
+    return None
+
+
+class BatchRunner:
+    """Dispatch sub-requests through the app's own views"""
+
+    def __init__(self, app, max_concurrency=4, admit=None):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        # admit(method, rule) -> refusal reason or None, e.g. HealthMonitor.shed_reason
+        self.admit = admit
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created lazily and per process; threads don't survive a fork
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='batch')
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, items, user, token):
+        """Results in request order: [{"id", "status", "body"}]"""
+        results = [None] * len(items)
+        reads = []
+
+        def flush_reads():
+            if len(reads) == 1:
+                index = reads[0]
+                results[index] = self.run_one(items[index], index, user, token)
+            elif reads:
+                # Each task runs in a copy of the caller's context, so its spans join the batch's trace
+                futures = {
+                    index: self._pool().submit(
+                        contextvars.copy_context().run, self.run_one, items[index], index, user, token
+                    )
+                    for index in reads
+                }
+                for index, future in futures.items():
+                    results[index] = future.result()
+            reads.clear()
+
+        for index, item in enumerate(items):
+            if str(item.get('method', 'GET')).upper() == 'GET':
+                reads.append(index)
+            else:
+                flush_reads()
+                results[index] = self.run_one(item, index, user, token)
+        flush_reads()
+        return results
+
+    def run_one(self, item, index, user, token):
+        method = str(item.get('method', 'GET')).upper()
+        item_id = item.get('id', index)
+        # A fresh app context gives the sub-request its own g, so the per-request
+        # hooks' teardown doesn't touch the batch request's state
+        app_context = self.app.app_context()
+        context = self.app.test_request_context(
+            item['path'],
+            method=method,
+            json=item.get('body'),
+            headers=item.get('headers') if isinstance(item.get('headers'), dict) else None,
+            environ_overrides={BATCH_USER_ENVIRON: user, BATCH_TOKEN_ENVIRON: token}
+        )
+        with app_context, context:
+            request = context.request
+            if request.url_rule is not None and request.url_rule.endpoint in EXCLUDED_ENDPOINTS:
+                return {'id': item_id, 'status': 400,
+                        'body': {'success': False, 'message': f"{request.url_rule.rule} can't be batched"}}
+
+            matched_rule = request.url_rule.rule if request.url_rule is not None else None
+            if self.admit is not None:
+                reason = self.admit(method, matched_rule)
+                if reason is not None:
+                    return {'id': item_id, 'status': 503, 'body': {'success': False, 'message': reason}}
+
+            rule = matched_rule or item['path']
+            with tracing.span(f"batch {method} {rule}"):
+                try:
+                    response = self.app.make_response(self.app.dispatch_request())
+                except HTTPException as e:
+                    response = self.app.make_response(self.app.handle_user_exception(e))
+                except Exception as e:
+                    response = self.app.make_response(({'success': False, 'message': str(e)}, 500))
+
+            if response.is_streamed or response.direct_passthrough:
+                response.close()
+                return {'id': item_id, 'status': 400,
+                        'body': {'success': False, 'message': f"{rule} can't be batched"}}
+
+            body = response.get_json(silent=True)
+            return {
+                'id': item_id,
+                'status': response.status_code,
+                'body': body if body is not None else response.get_data(as_text=True)
+            }
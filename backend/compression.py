@@ -0,0 +1,73 @@
+"""
+gzip / brotli response compression negotiated through Accept-Encoding
+
+    compression.init_app(app)   # when COMPRESSION_ENABLED is set
+
+Buffered JSON and text responses of at least COMPRESSION_MIN_BYTES are
+compressed with brotli when the client accepts "br" (and the Brotli package
+is installed), otherwise gzip. Streamed responses (the payment SSE feed),
+file downloads and already-encoded bodies are left alone.
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'text/plain',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/xml',
+}
+
+
+def init_app(app, min_size=None, gzip_level=None, brotli_quality=None):
+    """Compress eligible responses after every other after_request hook has run"""
+    min_size = app.config['COMPRESSION_MIN_BYTES'] if min_size is None else min_size
+    gzip_level = app.config['COMPRESSION_GZIP_LEVEL'] if gzip_level is None else gzip_level
+    brotli_quality = app.config['COMPRESSION_BROTLI_QUALITY'] if brotli_quality is None else brotli_quality
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    # after_request hooks run in reverse order, so register this one before the others
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 206, 304)):
+            return response
+
+        # Caches must key on Accept-Encoding even when this response stays uncompressed
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(offered)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The bytes changed, so a strong validator no longer matches them
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
@@ -13,6 +13,52 @@ class Config:
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASS = os.getenv('DB_PASS', 'password')
     
+    # Connection pool (per process; gunicorn workers size theirs in post_fork)
+    DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'true').lower() == 'true'
+    DB_POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN_CONN', '1'))
+    DB_POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX_CONN', '10'))
+    DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '10'))
+    
+    # Metrics (GET /metrics; keep it off the public load balancer)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # Query profiler (X-Debug-Queries: 1 returns the summary to admins)
+    QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+    QUERY_SLOW_MS = float(os.getenv('QUERY_SLOW_MS', '100'))
+    QUERY_REPEAT_WARN = int(os.getenv('QUERY_REPEAT_WARN', '5'))
+    QUERY_EXPLAIN_SLOW = os.getenv('QUERY_EXPLAIN_SLOW', 'false').lower() == 'true'
+    
+    # Sampled CPU profiles (toggled via POST /api/admin/profiling)
+    PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', 'profiles')
+    
+    # Tracing (OTLP/HTTP collector, else spans are appended to TRACE_JSONL_PATH when it is set)
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+    OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')  # e.g. http://localhost:4318
+    OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'canconnect-api')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+    TRACE_JSONL_PATH = os.getenv('TRACE_JSONL_PATH')  # e.g. traces/spans.jsonl
+    TRACE_JSONL_MAX_MB = int(os.getenv('TRACE_JSONL_MAX_MB', '100'))  # rotated to <path>.1 past this
+    
+    # Readiness (/api/health/ready) and load shedding thresholds, per worker
+    LOAD_SHED_ENABLED = os.getenv('LOAD_SHED_ENABLED', 'true').lower() == 'true'
+    LOAD_SHED_RETRY_AFTER_SECONDS = int(os.getenv('LOAD_SHED_RETRY_AFTER_SECONDS', '5'))
+    HEALTH_DB_LATENCY_WARN_MS = float(os.getenv('HEALTH_DB_LATENCY_WARN_MS', '50'))
+    HEALTH_DB_LATENCY_CRITICAL_MS = float(os.getenv('HEALTH_DB_LATENCY_CRITICAL_MS', '250'))
+    HEALTH_POOL_SATURATION_WARN = float(os.getenv('HEALTH_POOL_SATURATION_WARN', '0.8'))
+    HEALTH_DISK_MIN_FREE_MB = int(os.getenv('HEALTH_DISK_MIN_FREE_MB', '500'))
+    HEALTH_BCRYPT_MAX_ACTIVE = int(os.getenv('HEALTH_BCRYPT_MAX_ACTIVE', '4'))
+    HEALTH_BACKLOG_WARN = float(os.getenv('HEALTH_BACKLOG_WARN', '0.75'))
+    
+    # Response compression (Accept-Encoding: br or gzip; streamed responses are skipped)
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    
+    # POST /api/batch (concurrent GETs per batch; keep below the worker's pool size)
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '3'))
+    
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=7)
@@ -30,6 +76,19 @@ class Config:
     
     # File Storage
     FILE_STORAGE_PATH = os.getenv('FILE_STORAGE_PATH', 'documents/local')
+    
+    # Payments
+    RECEIPT_OUTPUT_DIR = os.getenv('RECEIPT_OUTPUT_DIR', 'receipts')
+    PAYMENT_WEBHOOK_URL = os.getenv('PAYMENT_WEBHOOK_URL')  # e.g. http://localhost:5000/api/payments/webhook
+    PAYMENT_WEBHOOK_SECRET = os.getenv('PAYMENT_WEBHOOK_SECRET')  # no default: webhooks are refused until set
+    SIMULATED_PROVIDER_FAILURE_RATE = float(os.getenv('SIMULATED_PROVIDER_FAILURE_RATE', '0.1'))
+    PAYMENT_LONG_POLL_MAX_SECONDS = 30
+    PAYMENT_SSE_HEARTBEAT_SECONDS = 15
+    # Each SSE stream holds a worker thread; close it after this long and let the client reconnect
+    PAYMENT_SSE_MAX_SECONDS = int(os.getenv('PAYMENT_SSE_MAX_SECONDS', '60'))
+    PAYMENT_SSE_RETRY_MS = 3000
+    RECEIPT_SIGNING_KEY_PATH = os.getenv('RECEIPT_SIGNING_KEY_PATH')  # python -m payment_system.receipt_signing keygen
+    RECEIPT_VERIFY_KEY_PATH = os.getenv('RECEIPT_VERIFY_KEY_PATH')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -0,0 +1,82 @@
+"""
+Gunicorn configuration for the CanConnect API
+
+    cd backend && gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden with an environment variable of the same
+name prefixed by GUNICORN_ (e.g. GUNICORN_WORKERS=4).
+"""
+
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# "gthread" (default) or "gevent" (requires: pip install gevent psycogreen)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded, so every lock and socket it creates is cooperative
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+    # One process per core; each serves many concurrent greenlets
+    workers = int(os.getenv('GUNICORN_WORKERS', cpu_count))
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+    threads = 1
+    db_pool_size = int(os.getenv('DB_POOL_MAX_CONN', '20'))
+else:
+    # Requests spend most of their time waiting on Postgres, so threads overlap that I/O
+    workers = int(os.getenv('GUNICORN_WORKERS', cpu_count * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+    # One connection per thread, so a request never waits on the pool
+    db_pool_size = int(os.getenv('DB_POOL_MAX_CONN', threads))
+
+# Import the app once in the master; workers fork from it with the code already loaded
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Recycle workers gradually to bound memory growth; jitter avoids restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Long-poll and SSE payment endpoints hold requests open up to PAYMENT_LONG_POLL_MAX_SECONDS
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Start every run with an empty Prometheus multiprocess directory"""
+    metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.db'):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    """Give each worker its own DB pool and empty caches"""
+    from wsgi import init_worker
+    init_worker(pool_size=db_pool_size, concurrency=worker_connections if worker_class == 'gevent' else threads)
+    server.log.info("Worker %s initialized (pool size %s)", worker.pid, db_pool_size)
+
+
+def worker_exit(server, worker):
+    """Close the worker's pooled connections and provider threads"""
+    from wsgi import shutdown_worker
+    shutdown_worker()
+
+
+def child_exit(server, worker):
+    """Drop the dead worker's live gauges from the metrics scrape"""
+    from metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
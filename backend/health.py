@@ -0,0 +1,325 @@
+"""
+Readiness checks and priority-based load shedding
+
+    health_monitor = HealthMonitor(connect=user_manager.get_connection, storage_path=...)
+    health.init_app(app, health_monitor)   # sheds only when LOAD_SHED_ENABLED is set
+
+GET /api/health/ready runs the deep check: a SELECT 1 round trip through
+the pool, pool saturation, free disk under FILE_STORAGE_PATH, bcrypt calls
+in progress, requests in flight against the worker's capacity (SSE streams
+and ?wait= long polls excluded) and the receipt job backlog. It answers 503 when the node should be taken out of
+rotation. Results are cached for a second so load balancer probes stay cheap.
+
+The shedding hook never touches the database: it uses the in-process
+signals plus the last database probe (while still fresh). When the node is
+degraded it refuses low-priority requests (admin statistics, listings);
+when it is overloaded it also refuses normal ones. Logins, uploads,
+payments, webhooks and health checks are always let through, except that
+uploads are refused while the disk is below its free-space floor.
+"""
+
+import os
+import shutil
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from database import pool as db_pool
+from database.instrumentation import active
+
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3
+
+STATUS_OK = "ok"
+STATUS_DEGRADED = "degraded"
+STATUS_OVERLOADED = "overloaded"
+
+# Lowest priority still served at each status
+_SERVED_UP_TO = {STATUS_OK: PRIORITY_LOW, STATUS_DEGRADED: PRIORITY_NORMAL, STATUS_OVERLOADED: PRIORITY_HIGH}
+
+ROUTE_PRIORITIES = {
+    ("GET", "/api/health"): PRIORITY_CRITICAL,
+    ("GET", "/api/health/ready"): PRIORITY_CRITICAL,
+    ("GET", "/metrics"): PRIORITY_CRITICAL,
+    ("POST", "/api/payments/webhook"): PRIORITY_CRITICAL,
+    ("POST", "/api/auth/login"): PRIORITY_HIGH,
+    ("POST", "/api/auth/logout"): PRIORITY_HIGH,
+    ("POST", "/api/auth/register"): PRIORITY_HIGH,
+    ("GET", "/api/auth/verify"): PRIORITY_HIGH,
+    ("POST", "/api/documents/upload"): PRIORITY_HIGH,
+    ("POST", "/api/payments"): PRIORITY_HIGH,
+    ("GET", "/api/payments/<transaction_id>"): PRIORITY_HIGH,
+    ("GET", "/api/payments/<transaction_id>/events"): PRIORITY_HIGH,
+    ("POST", "/api/admin/payments/<transaction_id>/refund"): PRIORITY_HIGH,
+    ("GET", "/api/payments/history"): PRIORITY_LOW,
+    ("GET", "/api/documents/<int:request_id>"): PRIORITY_LOW,
+}
+
+# Everything else under /api/admin/ (statistics, user and ledger listings, profiles)
+LOW_PRIORITY_PREFIXES = ("/api/admin/",)
+
+# Routes that write to FILE_STORAGE_PATH
+DISK_WRITING_ROUTES = {("POST", "/api/documents/upload")}
+
+# Routes that mostly sleep waiting for a payment status change: the SSE stream
+# always, the status lookup when it long-polls with ?wait=. They are left out
+# of the in-flight count so a few idle watchers don't mark the worker degraded.
+WAITING_ROUTES = {("GET", "/api/payments/<transaction_id>/events")}
+LONG_POLL_ROUTES = {("GET", "/api/payments/<transaction_id>")}
+
+
+def route_priority(method, rule):
+    """Shedding priority of a route (lower numbers are shed last)"""
+    if method == "OPTIONS":
+        return PRIORITY_CRITICAL
+    if rule is None:
+        return PRIORITY_NORMAL
+    priority = ROUTE_PRIORITIES.get((method, rule))
+    if priority is not None:
+        return priority
+    if rule.startswith(LOW_PRIORITY_PREFIXES):
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+def is_waiting(method, rule, args):
+    """True for requests that hold a thread idle rather than doing work"""
+    if (method, rule) in WAITING_ROUTES:
+        return True
+    if (method, rule) in LONG_POLL_ROUTES:
+        return args.get("wait", 0, type=int) > 0
+    return False
+
+
+class HealthMonitor:
+    """Collect readiness signals for this worker and decide what to shed"""
+
+    def __init__(self, connect, storage_path, receipt_queue=None, concurrency=None,
+                 db_latency_warn_ms=50, db_latency_critical_ms=250, pool_saturation_warn=0.8,
+                 disk_min_free_mb=500, bcrypt_max_active=4, backlog_warn=0.75,
+                 cache_seconds=1.0, probe_max_age_seconds=15.0, retry_after_seconds=5):
+        self.connect = connect
+        self.storage_path = storage_path
+        self.receipt_queue = receipt_queue
+        self.concurrency = concurrency
+        self.db_latency_warn_ms = db_latency_warn_ms
+        self.db_latency_critical_ms = db_latency_critical_ms
+        self.pool_saturation_warn = pool_saturation_warn
+        self.disk_min_free_mb = disk_min_free_mb
+        self.bcrypt_max_active = bcrypt_max_active
+        self.backlog_warn = backlog_warn
+        self.cache_seconds = cache_seconds
+        self.probe_max_age_seconds = probe_max_age_seconds
+        self.retry_after_seconds = retry_after_seconds
+
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self.in_flight = 0
+        self._database = None
+        self._database_at = 0.0
+        self._disk = None
+        self._disk_at = 0.0
+        self._report = None
+        self._report_at = 0.0
+
+    def reset(self, concurrency=None):
+        """Forget state inherited from the preloaded master (called per worker)"""
+        with self._lock:
+            self.in_flight = 0
+            if concurrency:
+                self.concurrency = concurrency
+            self._database = self._disk = self._report = None
+            self._database_at = self._disk_at = self._report_at = 0.0
+
+    # Signals
+
+    def probe_database(self):
+        """SELECT 1 round trip through the pool; skipped while the pool has no free connection"""
+        if self._pool_exhausted(db_pool.pool_stats()):
+            return {"ok": None, "skipped": "no free pooled connection"}
+
+        started = time.perf_counter()
+        try:
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                finally:
+                    cursor.close()
+            finally:
+                conn.close()
+        except Exception as e:
+            return {"ok": False, "error": str(e).strip()[:200]}
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def disk(self):
+        """Free space under the storage path, re-read at most once per cache period"""
+        now = time.monotonic()
+        if self._disk is None or now - self._disk_at >= self.cache_seconds:
+            try:
+                usage = shutil.disk_usage(self.storage_path)
+                self._disk = {
+                    "path": os.path.abspath(self.storage_path),
+                    "free_mb": usage.free // (1024 * 1024),
+                    "total_mb": usage.total // (1024 * 1024),
+                    "ok": usage.free // (1024 * 1024) >= self.disk_min_free_mb
+                }
+            except OSError as e:
+                self._disk = {"path": os.path.abspath(self.storage_path), "ok": False, "error": str(e)}
+            self._disk_at = now
+        return self._disk
+
+    def pools(self):
+        pools = {}
+        for name, stats in db_pool.pool_stats().items():
+            pools[name] = dict(stats, saturation=round(stats["in_use"] / stats["size"], 2) if stats["size"] else 0.0)
+        return pools
+
+    @staticmethod
+    def _pool_exhausted(stats):
+        return any(pool["waiting"] > 0 or pool["in_use"] >= pool["size"] for pool in stats.values())
+
+    def receipts(self):
+        if self.receipt_queue is None:
+            return None
+        try:
+            return self.receipt_queue.backlog()
+        except Exception as e:
+            return {"error": str(e).strip()[:200]}
+
+    def signals(self, database=None):
+        """In-process signals, plus the given (or last fresh) database probe"""
+        if database is None and time.monotonic() - self._database_at < self.probe_max_age_seconds:
+            database = self._database
+        return {
+            "database": database,
+            "pool": self.pools(),
+            "disk": self.disk(),
+            "bcrypt": {"active": active("bcrypt_seconds"), "max": self.bcrypt_max_active},
+            "requests": {"in_flight": self.in_flight, "capacity": self.concurrency}
+        }
+
+    def evaluate(self, checks):
+        """(status, reasons) for a set of signals"""
+        status, reasons = STATUS_OK, []
+
+        def flag(level, reason):
+            nonlocal status
+            reasons.append(reason)
+            if level == STATUS_OVERLOADED or status == STATUS_OK:
+                status = level
+
+        database = checks.get("database")
+        if database is not None:
+            if database["ok"] is False:
+                flag(STATUS_OVERLOADED, "database unreachable")
+            elif database["ok"] and database["latency_ms"] >= self.db_latency_critical_ms:
+                flag(STATUS_OVERLOADED, f"database round trip {database['latency_ms']}ms")
+            elif database["ok"] and database["latency_ms"] >= self.db_latency_warn_ms:
+                flag(STATUS_DEGRADED, f"database round trip {database['latency_ms']}ms")
+
+        for name, pool in checks["pool"].items():
+            if pool["waiting"] >= pool["size"]:
+                flag(STATUS_OVERLOADED, f"pool {name}: {pool['waiting']} waiting")
+            elif pool["waiting"] > 0 or pool["saturation"] >= self.pool_saturation_warn:
+                flag(STATUS_DEGRADED, f"pool {name} {int(pool['saturation'] * 100)}% in use")
+
+        if not checks["disk"]["ok"]:
+            flag(STATUS_DEGRADED, f"disk below {self.disk_min_free_mb}MB free")
+
+        bcrypt = checks["bcrypt"]
+        if bcrypt["active"] >= bcrypt["max"]:
+            flag(STATUS_DEGRADED, f"{bcrypt['active']} bcrypt calls in progress")
+
+        requests = checks["requests"]
+        if requests["capacity"] and requests["in_flight"] >= requests["capacity"] * self.backlog_warn:
+            flag(STATUS_DEGRADED, f"{requests['in_flight']}/{requests['capacity']} requests in flight")
+
+        return status, reasons
+
+    # Readiness
+
+    def readiness(self):
+        """Deep check for GET /api/health/ready, cached for cache_seconds"""
+        now = time.monotonic()
+        if self._report is not None and now - self._report_at < self.cache_seconds:
+            return self._report
+
+        # One probe at a time; concurrent callers get the previous report
+        if not self._probe_lock.acquire(blocking=False):
+            if self._report is not None:
+                return self._report
+            self._probe_lock.acquire()
+        try:
+            database = self.probe_database()
+            self._database, self._database_at = database, time.monotonic()
+
+            checks = self.signals(database)
+            checks["receipts"] = self.receipts() if database["ok"] else None
+            status, reasons = self.evaluate(checks)
+            self._report = {
+                "status": status,
+                "ready": status != STATUS_OVERLOADED and database["ok"] is not False and checks["disk"]["ok"],
+                "reasons": reasons,
+                "checks": checks,
+                "pid": os.getpid()
+            }
+            self._report_at = time.monotonic()
+            return self._report
+        finally:
+            self._probe_lock.release()
+
+    # Shedding
+
+    def shed_reason(self, method, rule):
+        """Why this request should be refused right now, or None to serve it"""
+        priority = route_priority(method, rule)
+        if priority == PRIORITY_CRITICAL:
+            return None
+
+        checks = self.signals()
+        if (method, rule) in DISK_WRITING_ROUTES and not checks["disk"]["ok"]:
+            return "Not enough free disk space"
+
+        status, reasons = self.evaluate(checks)
+        if priority > _SERVED_UP_TO[status]:
+            return f"Server is {status}: {'; '.join(reasons)}"
+        return None
+
+    def init_app(self, app, shed=True):
+        """Count requests in flight and, with shed, refuse them by priority under load"""
+        @app.before_request
+        def shed_load():
+            rule = request.url_rule.rule if request.url_rule is not None else None
+            if not is_waiting(request.method, rule, request.args):
+                with self._lock:
+                    self.in_flight += 1
+                g.load_counted = True
+            if not shed:
+                return None
+
+            reason = self.shed_reason(request.method, rule)
+            if reason is None:
+                return None
+            response = jsonify({"success": False, "message": "Service temporarily overloaded, please retry",
+                                "reason": reason})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(self.retry_after_seconds)
+            return response
+
+        @app.teardown_request
+        def release_load(exc):
+            if g.pop("load_counted", False):
+                with self._lock:
+                    self.in_flight -= 1
+
+
+def init_app(app, monitor):
+    """Install the request hooks, shedding only when LOAD_SHED_ENABLED is set"""
+    monitor.init_app(app, shed=app.config["LOAD_SHED_ENABLED"])
+    return monitor
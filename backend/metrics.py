@@ -0,0 +1,185 @@
+"""
+Prometheus metrics for the CanConnect API
+
+    metrics.init_app(app, caches={...})   # then scrape GET /metrics
+
+Covers request latency per route and status, in-flight requests, database
+statements (count and time, overall and per request), bcrypt time, upload
+bytes, cache hits/misses and connection pool checkouts.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory so the
+scrape sums every worker instead of whichever one answered.
+"""
+
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+from database import pool as db_pool
+from database.instrumentation import add_event_observer, add_query_observer
+
+REQUEST_LATENCY = Histogram(
+    'canconnect_http_request_duration_seconds',
+    'Time to produce the response (headers, for streamed responses)',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'canconnect_http_requests_in_flight',
+    'Requests currently being handled',
+    multiprocess_mode='livesum'
+)
+
+DB_QUERY_SECONDS = Histogram(
+    'canconnect_db_query_duration_seconds',
+    'Duration of each SQL statement',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'canconnect_db_queries_per_request',
+    'SQL statements issued while handling one request',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+DB_SECONDS_PER_REQUEST = Histogram(
+    'canconnect_db_seconds_per_request',
+    'Total SQL time spent while handling one request',
+    ['route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'canconnect_db_pool_connections',
+    'Pooled connections by state (size, in_use, waiting)',
+    ['database', 'state'],
+    multiprocess_mode='livesum'
+)
+
+BCRYPT_SECONDS = Histogram(
+    'canconnect_bcrypt_duration_seconds',
+    'Time spent hashing or checking a password',
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2)
+)
+UPLOAD_BYTES = Counter(
+    'canconnect_upload_bytes_total',
+    'Bytes written to document storage'
+)
+UPLOAD_SIZE = Histogram(
+    'canconnect_upload_size_bytes',
+    'Size of each stored upload',
+    buckets=(16 * 1024, 128 * 1024, 512 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)
+)
+CACHE_LOOKUPS = Counter(
+    'canconnect_cache_lookups_total',
+    'In-process cache lookups by result (hit or miss)',
+    ['cache', 'result']
+)
+
+SQL_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'LISTEN', 'BEGIN', 'COMMIT')
+
+# Last hit/miss totals seen per cache, so the counters only grow by the difference
+_cache_totals = {}
+
+
+def _operation(query):
+    if isinstance(query, bytes):
+        query = query[:16].decode('utf-8', 'replace')
+    words = query.split(None, 1)
+    verb = words[0].upper() if words else ''
+    return verb if verb in SQL_OPERATIONS else 'OTHER'
+
+
+def _observe_query(query, params, duration, rowcount, cursor):
+    DB_QUERY_SECONDS.labels(_operation(query)).observe(duration)
+    if has_request_context() and 'metrics_db_queries' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_seconds += duration
+
+
+def _observe_event(name, value):
+    if name == 'bcrypt_seconds':
+        BCRYPT_SECONDS.observe(value)
+    elif name == 'upload_bytes':
+        UPLOAD_BYTES.inc(value)
+        UPLOAD_SIZE.observe(value)
+
+
+def _sync_cache_counters(caches):
+    for name, cache in caches.items():
+        hits, misses = cache.hits, cache.misses
+        seen_hits, seen_misses = _cache_totals.get(name, (0, 0))
+        if hits > seen_hits:
+            CACHE_LOOKUPS.labels(name, 'hit').inc(hits - seen_hits)
+        if misses > seen_misses:
+            CACHE_LOOKUPS.labels(name, 'miss').inc(misses - seen_misses)
+        _cache_totals[name] = (hits, misses)
+
+
+def _sync_pool_gauges():
+    for database, stats in db_pool.pool_stats().items():
+        for state in ('size', 'in_use', 'waiting'):
+            DB_POOL_CONNECTIONS.labels(database, state).set(stats[state])
+
+
+def route_label():
+    """The matched URL rule (e.g. /api/users/<int:user_id>), never the raw path"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_app(app, caches=None, path='/metrics'):
+    """Install request hooks and the scrape endpoint
+
+    caches maps a label to any object with hits/misses counters (TTLCache).
+    """
+    caches = caches or {}
+    add_query_observer(_observe_query)
+    add_event_observer(_observe_event)
+
+    @app.before_request
+    def start_request_metrics():
+        if request.path == path:
+            return
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_seconds = 0.0
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            route = route_label()
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started
+            )
+            DB_QUERIES_PER_REQUEST.labels(route).observe(g.metrics_db_queries)
+            DB_SECONDS_PER_REQUEST.labels(route).observe(g.metrics_db_seconds)
+            _sync_cache_counters(caches)
+            _sync_pool_gauges()
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_started', None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
+
+    @app.route(path, methods=['GET'])
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            _sync_cache_counters(caches)
+            _sync_pool_gauges()
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead(pid):
+    """Drop a dead gunicorn worker's live gauges (call from child_exit)"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
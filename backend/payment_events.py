@@ -0,0 +1,180 @@
+import asyncio
+import select
+import threading
+import time
+
+import psycopg2
+
+
+class PaymentStatusBroker:
+    """Wake HTTP waiters when a payment's status changes
+
+    A single background thread per process LISTENs on the gateway's status
+    channel; long-poll and SSE handlers block on a condition variable instead
+    of polling the database. The thread starts lazily so it is created inside
+    each worker process rather than inherited across a fork.
+    """
+
+    def __init__(self, gateway, retention_seconds=300):
+        self.gateway = gateway
+        self.retention_seconds = retention_seconds
+        self._condition = threading.Condition()
+        self._latest = {}  # transaction_id -> (status, received_at)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def start(self):
+        """Start the listener thread in this process if it is not running"""
+        self._ensure_listener()
+
+    def _ensure_listener(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name="payment-status-listener", daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                # A dedicated connection: LISTEN would otherwise pin a pooled one forever
+                conn = psycopg2.connect(host=self.gateway.db_host, database=self.gateway.db_name,
+                                        user=self.gateway.db_user, password=self.gateway.db_pass)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.gateway.STATUS_CHANNEL}")
+                backoff = 1
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        self._expire()
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        transaction_id, _, status = notify.payload.rpartition(":")
+                        self.publish(transaction_id, status)
+            except (psycopg2.Error, OSError):
+                pass
+            finally:
+                # Close the dead connection before backing off, or every retry leaks one
+                if conn is not None:
+                    conn.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.retention_seconds
+        with self._condition:
+            for transaction_id in [t for t, (_, at) in self._latest.items() if at < cutoff]:
+                del self._latest[transaction_id]
+
+    def publish(self, transaction_id, status):
+        """Record a status change and wake every waiter"""
+        with self._condition:
+            self._latest[transaction_id] = (status, time.monotonic())
+            self._condition.notify_all()
+
+    def wait_for_change(self, transaction_id, current_status, timeout):
+        """Block until the transaction's status differs from current_status
+
+        Returns the new status, or None on timeout.
+        """
+        self._ensure_listener()
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                latest = self._latest.get(transaction_id)
+                if latest and latest[0] != current_status:
+                    return latest[0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+
+class AsyncPaymentStatusBroker:
+    """asyncio counterpart of PaymentStatusBroker for the ASGI app
+
+    One listener task per event loop LISTENs on the gateway's status channel
+    through psycopg 3 and wakes coroutines waiting in wait_for_change.
+    """
+
+    def __init__(self, gateway, retention_seconds=300):
+        self.gateway = gateway
+        self.retention_seconds = retention_seconds
+        self._latest = {}  # transaction_id -> (status, received_at)
+        self._condition = None
+        self._task = None
+
+    def start(self):
+        """Start the listener task on the running loop if it is not running"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # psycopg 3 is only a dependency of the ASGI app
+        import psycopg
+
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                # A dedicated connection: LISTEN would otherwise pin a pooled one forever
+                conn = await psycopg.AsyncConnection.connect(
+                    host=self.gateway.db_host, dbname=self.gateway.db_name,
+                    user=self.gateway.db_user, password=self.gateway.db_pass, autocommit=True
+                )
+                await conn.execute(f"LISTEN {self.gateway.STATUS_CHANNEL}")
+                backoff = 1
+                async for notify in conn.notifies():
+                    transaction_id, _, status = notify.payload.rpartition(":")
+                    await self.publish(transaction_id, status)
+            except (psycopg.Error, OSError):
+                pass
+            finally:
+                # Also runs on cancellation from stop()
+                if conn is not None:
+                    await conn.close()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def publish(self, transaction_id, status):
+        """Record a status change and wake every waiter"""
+        now = time.monotonic()
+        async with self._condition:
+            cutoff = now - self.retention_seconds
+            for stale in [t for t, (_, at) in self._latest.items() if at < cutoff]:
+                del self._latest[stale]
+            self._latest[transaction_id] = (status, now)
+            self._condition.notify_all()
+
+    async def wait_for_change(self, transaction_id, current_status, timeout):
+        """Wait until the transaction's status differs from current_status
+
+        Returns the new status, or None on timeout.
+        """
+        self.start()
+
+        def changed():
+            latest = self._latest.get(transaction_id)
+            return latest[0] if latest and latest[0] != current_status else None
+
+        try:
+            async with self._condition:
+                return await asyncio.wait_for(self._condition.wait_for(changed), timeout)
+        except asyncio.TimeoutError:
+            return None
@@ -0,0 +1,206 @@
+"""
+Sampled per-request CPU profiling
+
+    request_profiler = RequestProfiler(output_dir='profiles')
+    request_profiler.init_app(app)
+
+Profiling is off until an admin turns it on (POST /api/admin/profiling),
+which writes a small control file shared by every worker. While on, a
+sample_rate fraction of requests (optionally only routes matching a
+prefix) run under cProfile; an admin can also force one request with the
+header "X-Profile: 1" (honoured only when the request's bearer token
+belongs to an admin). Each profile is dumped as a pstats file named
+<timestamp>_<route>_<method>_<ms>ms.prof, loadable with pstats or snakeviz.
+
+cProfile allows one active profiler per process, so a request that would
+overlap another profiled request in the same worker is simply not sampled.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.prof$")
+CONTROL_FILE = "profiling.json"
+
+
+def route_slug(rule):
+    """/api/users/<int:user_id> -> api_users_user_id"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", re.sub(r"<(?:[^:>]+:)?([^>]+)>", r"\1", rule)).strip("_") or "root"
+
+
+class RequestProfiler:
+    """Profile a sampled fraction of requests to pstats files"""
+
+    def __init__(self, output_dir="profiles", max_files=200, control_refresh_seconds=2.0):
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self.control_refresh_seconds = control_refresh_seconds
+        self._active = threading.Lock()
+        self._control = {"enabled": False}
+        self._control_checked = 0.0
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Control (shared across workers through a file)
+
+    def settings(self):
+        """Current switch state, re-read from disk every few seconds"""
+        now = time.monotonic()
+        if now - self._control_checked >= self.control_refresh_seconds:
+            self._control_checked = now
+            try:
+                with open(os.path.join(self.output_dir, CONTROL_FILE)) as f:
+                    self._control = json.load(f)
+            except (OSError, ValueError):
+                self._control = {"enabled": False}
+
+        control = self._control
+        if control.get("enabled") and control.get("until") and time.time() > control["until"]:
+            return {"enabled": False}
+        return control
+
+    def configure(self, enabled, sample_rate=0.01, route_prefix=None, duration_seconds=None):
+        """Turn sampling on or off for every worker"""
+        control = {
+            "enabled": bool(enabled),
+            "sample_rate": min(max(float(sample_rate), 0.0), 1.0),
+            "route_prefix": route_prefix or None,
+            "until": time.time() + duration_seconds if duration_seconds else None
+        }
+        path = os.path.join(self.output_dir, CONTROL_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(control, f)
+        os.replace(path + ".tmp", path)
+
+        self._control = control
+        self._control_checked = time.monotonic()
+        return control
+
+    # Request hooks
+
+    def init_app(self, app, authenticate=None):
+        """Install the hooks; authenticate(token) -> user enables X-Profile for admins"""
+        @app.before_request
+        def start_profile():
+            forced = request.headers.get("X-Profile") == "1" and self._admin_request(authenticate)
+            if not forced and not self._sampled():
+                return
+            if not self._active.acquire(blocking=False):
+                return
+            profiler = cProfile.Profile()
+            g.cpu_profile = {"profiler": profiler, "started": time.perf_counter()}
+            profiler.enable()
+
+        @app.after_request
+        def stop_profile(response):
+            self._finish(save=True)
+            return response
+
+        @app.teardown_request
+        def release_profile(exc):
+            # Only reached with a live profile when after_request didn't run
+            self._finish(save=False)
+
+    def _admin_request(self, authenticate):
+        """Whether the request's bearer token is an admin's (views authenticate later)"""
+        if authenticate is None:
+            return False
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer" or not token:
+            return False
+        return self._is_admin(authenticate(token))
+
+    def _sampled(self):
+        control = self.settings()
+        if not control.get("enabled"):
+            return False
+        prefix = control.get("route_prefix")
+        if prefix and not request.path.startswith(prefix):
+            return False
+        return random.random() < control.get("sample_rate", 0.0)
+
+    def _finish(self, save):
+        profile = g.pop("cpu_profile", None)
+        if profile is None:
+            return
+        try:
+            profile["profiler"].disable()
+            elapsed_ms = (time.perf_counter() - profile["started"]) * 1000
+            if save:
+                self._save(profile["profiler"], elapsed_ms)
+        finally:
+            self._active.release()
+
+    @staticmethod
+    def _is_admin(user):
+        return user is not None and user["user_type"] == "admin"
+
+    def _save(self, profiler, elapsed_ms):
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        name = "{}_{}_{}_{}ms.prof".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S%f"), route_slug(rule), request.method, int(elapsed_ms)
+        )
+        profiler.dump_stats(os.path.join(self.output_dir, name))
+        self._prune()
+
+    def _prune(self):
+        profiles = sorted(n for n in os.listdir(self.output_dir) if PROFILE_NAME.match(n))
+        for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+    # Listing and download
+
+    def list_profiles(self, route=None, limit=50):
+        """Newest profiles first, optionally only those whose route slug contains route"""
+        profiles = []
+        for name in sorted(os.listdir(self.output_dir), reverse=True):
+            if not PROFILE_NAME.match(name):
+                continue
+            timestamp, rest = name.split("_", 1)
+            route_part, method, duration = rest[:-len(".prof")].rsplit("_", 2)
+            if route and route not in route_part:
+                continue
+            profiles.append({
+                "name": name,
+                "route": route_part,
+                "method": method,
+                "duration_ms": int(duration.rstrip("ms")),
+                "created_at": datetime.strptime(timestamp, "%Y%m%dT%H%M%S%f").isoformat(),
+                "size_bytes": os.path.getsize(os.path.join(self.output_dir, name))
+            })
+            if len(profiles) >= limit:
+                break
+        return profiles
+
+    def profile_path(self, name):
+        """Path of a stored profile, or None for unknown or unsafe names"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.output_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def render_text(self, name, sort="cumulative", limit=40):
+        """Top functions of a stored profile as pstats text
+
+        Raises ValueError when sort is not a pstats.SortKey value.
+        """
+        sort_key = pstats.SortKey(sort)
+        path = self.profile_path(name)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort_key).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,187 @@
+"""
+Per-request SQL profiler and slow-query log
+
+    query_profiler.init_app(app)   # when QUERY_PROFILER_ENABLED is set
+
+Every statement run through the managers' cursors is recorded for the
+current request: normalized text, parameter shape, duration and row count.
+Statements slower than QUERY_SLOW_MS go to the "canconnect.slow_queries"
+logger (optionally with EXPLAIN (ANALYZE, BUFFERS) for slow SELECTs), and
+statements repeated QUERY_REPEAT_WARN times in one request are logged as
+likely N+1 loops. Send "X-Debug-Queries: 1" as an admin (or with DEBUG on)
+to get the request's summary back in X-Query-Profile / Server-Timing headers.
+"""
+
+import logging
+import re
+from collections import Counter
+
+import psycopg2
+from psycopg2 import extensions
+from flask import g, has_request_context, request
+
+from database.instrumentation import add_query_observer
+
+logger = logging.getLogger('canconnect.slow_queries')
+
+# Statements kept per request; later ones still count towards the totals
+MAX_RECORDED_STATEMENTS = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUES_LIST = re.compile(r"VALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    """Collapse whitespace and inlined literals so equal statements compare equal"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    query = _WHITESPACE.sub(' ', query).strip()
+    # execute_values inlines every row; keep one
+    return _VALUES_LIST.sub(r"VALUES \1, ...", query)
+
+
+def params_shape(params):
+    """Types of the bound parameters, never their values"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if isinstance(params, (list, tuple)) and params and isinstance(params[0], (list, tuple, dict)):
+        # executemany: row count plus the first row's shape
+        return f"{len(params)} x {params_shape(params[0])}"
+    if isinstance(params, (list, tuple)):
+        return [type(value).__name__ for value in params]
+    return type(params).__name__
+
+
+def _is_read_only(normalized):
+    head = normalized[:6].upper()
+    return head == 'SELECT' or (head.startswith('WITH') and not re.search(
+        r"\b(INSERT|UPDATE|DELETE)\b", normalized, re.IGNORECASE))
+
+
+class QueryProfiler:
+    """Collect statements per request and report slow or repeated ones"""
+
+    def __init__(self, slow_ms=100, repeat_warn=5, explain_slow=False):
+        self.slow_ms = slow_ms
+        self.repeat_warn = repeat_warn
+        self.explain_slow = explain_slow
+
+    def init_app(self, app):
+        add_query_observer(self.observe)
+
+        @app.before_request
+        def start_query_profile():
+            g.query_profile = {'statements': [], 'count': 0, 'total_ms': 0.0}
+
+        @app.after_request
+        def finish_query_profile(response):
+            profile = g.pop('query_profile', None)
+            if profile is None or profile['count'] == 0:
+                return response
+
+            repeated = self._log_repeats(profile)
+            if self._wants_debug_header(app):
+                response.headers['X-Query-Profile'] = self.summary(profile, repeated)
+                response.headers.add(
+                    'Server-Timing', f'db;dur={profile["total_ms"]:.1f};desc="{profile["count"]} queries"'
+                )
+            return response
+
+    def observe(self, query, params, duration, rowcount, cursor):
+        """Query observer: record the statement on the current request"""
+        if not has_request_context():
+            return
+        profile = g.get('query_profile')
+        if profile is None:
+            return
+
+        duration_ms = duration * 1000
+        normalized = normalize_sql(query)
+        profile['count'] += 1
+        profile['total_ms'] += duration_ms
+        if len(profile['statements']) < MAX_RECORDED_STATEMENTS:
+            profile['statements'].append({
+                'sql': normalized,
+                'params': params_shape(params),
+                'duration_ms': round(duration_ms, 2),
+                'rows': rowcount
+            })
+
+        if duration_ms >= self.slow_ms:
+            plan = self._explain(cursor, query, params) if self.explain_slow and _is_read_only(normalized) else None
+            logger.warning(
+                "Slow query %.1fms on %s %s rows=%s params=%s sql=%s%s",
+                duration_ms, request.method, request.path, rowcount, params_shape(params), normalized,
+                f"\n{plan}" if plan else ""
+            )
+
+    def _explain(self, cursor, query, params):
+        """EXPLAIN (ANALYZE, BUFFERS) a slow SELECT in the caller's transaction, inside a savepoint"""
+        conn = cursor.connection
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_INTRANS:
+            return None
+
+        try:
+            statement = cursor.mogrify(query, params)
+        except (psycopg2.Error, TypeError, ValueError):
+            return None
+
+        # A plain cursor, so the EXPLAIN itself is not observed
+        explain_cursor = conn.cursor(cursor_factory=extensions.cursor)
+        try:
+            explain_cursor.execute("SAVEPOINT query_profiler_explain")
+            try:
+                explain_cursor.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+                explain_cursor.execute("RELEASE SAVEPOINT query_profiler_explain")
+                return plan
+            except psycopg2.Error:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT query_profiler_explain")
+                return None
+        except psycopg2.Error:
+            return None
+        finally:
+            explain_cursor.close()
+
+    def _log_repeats(self, profile):
+        """Log statements run repeat_warn+ times in one request; returns the highest repeat count"""
+        counts = Counter(statement['sql'] for statement in profile['statements'])
+        if not counts:
+            return 0
+        sql, repeated = counts.most_common(1)[0]
+        if repeated >= self.repeat_warn:
+            logger.warning("Statement repeated %d times in %s %s (possible N+1): %s",
+                           repeated, request.method, request.path, sql)
+        return repeated
+
+    def summary(self, profile, repeated):
+        statements = profile['statements']
+        slowest = max(statements, key=lambda statement: statement['duration_ms'])
+        return (
+            f"count={profile['count']}; total_ms={profile['total_ms']:.1f}; "
+            f"slowest_ms={slowest['duration_ms']:.1f}; max_repeat={repeated}; "
+            f"slowest_sql={slowest['sql'][:200]}"
+        ).encode('ascii', 'replace').decode('ascii')
+
+    def _wants_debug_header(self, app):
+        if request.headers.get('X-Debug-Queries') != '1':
+            return False
+        user = getattr(request, 'user', None)
+        return app.debug or (user is not None and user['user_type'] == 'admin')
+
+
+def init_app(app):
+    """Install the profiler with the app's QUERY_* settings"""
+    profiler = QueryProfiler(
+        slow_ms=app.config['QUERY_SLOW_MS'],
+        repeat_warn=app.config['QUERY_REPEAT_WARN'],
+        explain_slow=app.config['QUERY_EXPLAIN_SLOW']
+    )
+    profiler.init_app(app)
+    return profiler
@@ -0,0 +1,344 @@
+"""
+Request tracing with W3C traceparent propagation
+
+    tracing.init_app(app)                          # one server span per request
+    tracing.trace_methods(user_manager, 'UserManager')
+    with tracing.span('upload.save_temp'): ...
+
+A server span is opened per request, continuing the caller's trace when a
+valid "traceparent" header is sent (the React client sends one). Manager
+methods, SQL statements, bcrypt calls and timed filesystem steps become
+child spans: SQL and bcrypt through the database.instrumentation observers,
+manager methods through trace_methods.
+
+Finished spans are batched by a background thread and sent as OTLP/HTTP JSON
+to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. http://localhost:4318). With no
+collector configured, or when it can't be reached, they are appended to
+TRACE_JSONL_PATH if set (rotated to a single ".1" backup once it passes
+TRACE_JSONL_MAX_MB) and dropped otherwise.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+
+from flask import g, request
+
+from database.instrumentation import add_event_observer, add_query_observer
+from query_profiler import normalize_sql
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar('canconnect_current_span', default=None)
+_exporter = None
+_sample_rate = 1.0
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'sampled',
+                 'start_ns', 'end_ns', 'attributes', 'status', 'status_message')
+
+    def __init__(self, name, trace_id, parent_id=None, kind=SPAN_KIND_INTERNAL, sampled=True,
+                 start_ns=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, exc):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            if self.sampled and _exporter is not None:
+                _exporter.export(self)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, parent=None, start_ns=None, attributes=None):
+    """Create a span under parent (default: the current span), or a new root trace"""
+    parent = parent or _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, kind, parent.sampled, start_ns, attributes)
+    return Span(name, '%032x' % random.getrandbits(128), None, kind,
+                random.random() < _sample_rate, start_ns, attributes)
+
+
+class span:
+    """Context manager running its block inside a new child span"""
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = start_span(self.name, attributes=self.attributes)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.record_error(exc)
+        _current_span.reset(self._token)
+        self.span.end()
+        return False
+
+
+def traced(name):
+    """Decorator form of span()"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(obj, prefix, exclude=('get_connection',)):
+    """Wrap an object's public methods so each call is a span named prefix.method"""
+    for name in dir(type(obj)):
+        if name.startswith('_') or name in exclude:
+            continue
+        method = getattr(obj, name)
+        if callable(method):
+            setattr(obj, name, traced(f"{prefix}.{name}")(method))
+    return obj
+
+
+def parse_traceparent(header):
+    """(trace_id, parent_span_id, sampled) from a traceparent header, or None if invalid"""
+    match = TRACEPARENT.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+def _record_finished(name, duration_seconds, kind=SPAN_KIND_INTERNAL, attributes=None):
+    """Add a span for work that has just finished and took duration_seconds"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    end_ns = time.time_ns()
+    child = start_span(name, kind, parent, end_ns - int(duration_seconds * 1e9), attributes)
+    child.end(end_ns)
+
+
+def _on_query(query, params, duration, rowcount, cursor):
+    normalized = normalize_sql(query)
+    _record_finished(f"SQL {normalized.split(' ', 1)[0].upper()}", duration, SPAN_KIND_CLIENT, {
+        'db.system': 'postgresql',
+        'db.statement': normalized[:2000],
+        'db.rows_affected': rowcount
+    })
+
+
+def _on_event(name, value):
+    # Timed measurements (bcrypt_seconds, fs_copy_seconds, ...) become spans
+    if name.endswith('_seconds'):
+        _record_finished(name[:-len('_seconds')].replace('_', '.'), value)
+
+
+class SpanExporter:
+    """Batch finished spans to an OTLP/HTTP collector, falling back to a JSONL file"""
+
+    def __init__(self, endpoint=None, jsonl_path=None, service_name='canconnect-api',
+                 batch_size=256, flush_interval=2.0, max_queue=10000, jsonl_max_bytes=100 * 1024 * 1024):
+        self.endpoint = endpoint.rstrip('/') + '/v1/traces' if endpoint else None
+        self.jsonl_path = jsonl_path
+        self.jsonl_max_bytes = jsonl_max_bytes
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, finished):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            # Tracing is best effort; never block a request on it
+            pass
+
+    def _ensure_thread(self):
+        # Started lazily so each forked worker runs its own flusher
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.flush(batch)
+
+    def flush(self, batch):
+        if self.endpoint:
+            try:
+                body = json.dumps(self._otlp(batch)).encode('utf-8')
+                otlp_request = urllib.request.Request(
+                    self.endpoint, data=body, headers={'Content-Type': 'application/json'}, method='POST'
+                )
+                with urllib.request.urlopen(otlp_request, timeout=5):
+                    return
+            except OSError:
+                pass
+        self._write_jsonl(batch)
+
+    def _write_jsonl(self, batch):
+        if not self.jsonl_path:
+            return
+        os.makedirs(os.path.dirname(self.jsonl_path) or '.', exist_ok=True)
+        try:
+            if os.path.getsize(self.jsonl_path) >= self.jsonl_max_bytes:
+                os.replace(self.jsonl_path, self.jsonl_path + '.1')
+        except OSError:
+            pass
+        with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+            for finished in batch:
+                f.write(json.dumps({
+                    'service': self.service_name,
+                    'trace_id': finished.trace_id,
+                    'span_id': finished.span_id,
+                    'parent_id': finished.parent_id,
+                    'name': finished.name,
+                    'kind': finished.kind,
+                    'start_ns': finished.start_ns,
+                    'duration_ms': round((finished.end_ns - finished.start_ns) / 1e6, 3),
+                    'status': 'error' if finished.status == STATUS_ERROR else 'ok',
+                    'status_message': finished.status_message,
+                    'attributes': finished.attributes
+                }, default=str) + '\n')
+
+    def _otlp(self, batch):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'canconnect'},
+                'spans': [
+                    {
+                        'traceId': finished.trace_id,
+                        'spanId': finished.span_id,
+                        'parentSpanId': finished.parent_id or '',
+                        'name': finished.name,
+                        'kind': finished.kind,
+                        'startTimeUnixNano': str(finished.start_ns),
+                        'endTimeUnixNano': str(finished.end_ns),
+                        'attributes': [_otlp_attribute(k, v) for k, v in finished.attributes.items()],
+                        'status': {'code': finished.status, 'message': finished.status_message or ''}
+                    }
+                    for finished in batch
+                ]
+            }]
+        }]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def init_app(app, exporter=None, sample_rate=None):
+    """Open a server span per request and install the SQL/bcrypt/filesystem observers"""
+    global _exporter, _sample_rate
+    _exporter = exporter or SpanExporter(
+        endpoint=app.config['OTEL_EXPORTER_OTLP_ENDPOINT'],
+        jsonl_path=app.config['TRACE_JSONL_PATH'],
+        jsonl_max_bytes=app.config['TRACE_JSONL_MAX_MB'] * 1024 * 1024,
+        service_name=app.config['OTEL_SERVICE_NAME']
+    )
+    _sample_rate = app.config['TRACE_SAMPLE_RATE'] if sample_rate is None else sample_rate
+    add_query_observer(_on_query)
+    add_event_observer(_on_event)
+
+    @app.before_request
+    def start_request_span():
+        incoming = parse_traceparent(request.headers.get('traceparent'))
+        name = f"{request.method} {request.url_rule.rule if request.url_rule is not None else 'unmatched'}"
+        attributes = {'http.method': request.method, 'http.target': request.path}
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+            server_span = Span(name, trace_id, parent_id, SPAN_KIND_SERVER, sampled, attributes=attributes)
+        else:
+            server_span = start_span(name, SPAN_KIND_SERVER, attributes=attributes)
+        g.trace_span = server_span
+        g.trace_token = _current_span.set(server_span)
+
+    @app.after_request
+    def tag_request_span(response):
+        server_span = g.get('trace_span')
+        if server_span is not None:
+            server_span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                server_span.status = STATUS_ERROR
+            response.headers['X-Trace-Id'] = server_span.trace_id
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        server_span = g.pop('trace_span', None)
+        if server_span is None:
+            return
+        if exc is not None:
+            server_span.record_error(exc)
+        user = getattr(request, 'user', None)
+        if user:
+            server_span.set_attribute('enduser.id', user['user_id'])
+        _current_span.reset(g.pop('trace_token'))
+        server_span.end()
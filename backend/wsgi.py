@@ -0,0 +1,9 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import app, init_worker, shutdown_worker
+
+__all__ = ['app', 'init_worker', 'shutdown_worker']
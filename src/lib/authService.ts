@@ -1,4 +1,6 @@
 // Authentication Service - Handles all API calls to backend
+import { traceHeaders } from "./tracing";
+
 const API_BASE_URL = import.meta.env.VITE_API_URL || "http://localhost:5000/api";
 
 interface LoginResponse {
@@ -76,8 +78,9 @@ class AuthService {
   }
 
   private getHeaders(includeAuth: boolean = true): HeadersInit {
-    const headers: HeadersInit = {
+    const headers: Record<string, string> = {
       "Content-Type": "application/json",
+      ...traceHeaders(),
     };
 
     if (includeAuth && this.token) {
@@ -1,5 +1,6 @@
 // Payment Service - Handles payment processing with Stripe
 // In production, use a real Stripe API endpoint
+import { traceHeaders } from "./tracing";
 
 export interface PaymentDetails {
   amount: number;
@@ -117,3 +118,154 @@ Status: COMPLETED
 ====================
   `.trim();
 };
+
+// ---------------------------------------------------------------------------
+// Backend payment API (/api/payments)
+// ---------------------------------------------------------------------------
+
+const API_BASE_URL = import.meta.env.VITE_API_URL || "http://localhost:5000/api";
+
+export type ApiPaymentStatus = "Pending" | "Completed" | "Failed";
+
+export interface ApiPayment {
+  transaction_id: string;
+  request_id: number;
+  amount: number;
+  method: string;
+  status: ApiPaymentStatus;
+  paid_at: string | null;
+}
+
+export interface ApiPaymentResult {
+  success: boolean;
+  message: string;
+  transaction_id?: string;
+  status?: ApiPaymentStatus;
+  replayed?: boolean;
+}
+
+const authHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem("auth_token");
+  return { ...traceHeaders(), ...(token ? { Authorization: `Bearer ${token}` } : {}) };
+};
+
+// Submit a payment. Reuse the same idempotencyKey when retrying so a
+// dropped response never charges twice.
+export const createPayment = async (
+  requestId: number,
+  amount: number,
+  paymentMethod: string,
+  idempotencyKey: string = crypto.randomUUID()
+): Promise<ApiPaymentResult> => {
+  const response = await fetch(`${API_BASE_URL}/payments`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Idempotency-Key": idempotencyKey,
+      ...authHeaders(),
+    },
+    body: JSON.stringify({ request_id: requestId, amount, payment_method: paymentMethod }),
+  });
+  return response.json();
+};
+
+// Get a payment's status. With waitSeconds, the server holds the request
+// until the status differs from knownStatus (long polling).
+export const getPaymentStatus = async (
+  transactionId: string,
+  waitSeconds = 0,
+  knownStatus?: ApiPaymentStatus
+): Promise<ApiPayment> => {
+  const params = new URLSearchParams();
+  if (waitSeconds > 0) params.set("wait", String(waitSeconds));
+  if (knownStatus) params.set("status", knownStatus);
+
+  const response = await fetch(`${API_BASE_URL}/payments/${transactionId}?${params}`, {
+    headers: authHeaders(),
+  });
+  const data = await response.json();
+  if (!data.success) throw new Error(data.message);
+  return data.payment;
+};
+
+// Stream status changes over Server-Sent Events until the payment is final.
+// EventSource cannot send an Authorization header, so the stream is read
+// with fetch. The server closes each stream after a while; it is reopened
+// after the advertised retry delay until the payment is final. Returns a
+// function that stops watching.
+export const watchPaymentStatus = (
+  transactionId: string,
+  onStatus: (payment: ApiPayment) => void,
+  onError?: (error: Error) => void
+): (() => void) => {
+  const controller = new AbortController();
+  let retryMs = 3000;
+  let final = false;
+
+  const readStream = async () => {
+    const response = await fetch(`${API_BASE_URL}/payments/${transactionId}/events`, {
+      headers: { Accept: "text/event-stream", ...authHeaders() },
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Status stream failed (${response.status})`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+        const message = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const lines = message.split("\n");
+        const retry = lines.find((line) => line.startsWith("retry: "));
+        if (retry) retryMs = Number(retry.slice(7)) || retryMs;
+        const data = lines
+          .filter((line) => line.startsWith("data: "))
+          .map((line) => line.slice(6))
+          .join("\n");
+        if (data) {
+          const payment: ApiPayment = JSON.parse(data);
+          final = payment.status !== "Pending";
+          onStatus(payment);
+        }
+      }
+    }
+  };
+
+  (async () => {
+    while (!final && !controller.signal.aborted) {
+      await readStream();
+      if (!final) await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  })().catch((error) => {
+    if (!controller.signal.aborted) onError?.(error);
+  });
+
+  return () => controller.abort();
+};
+
+// Fetch one page of payment history; pass nextCursor back for the next page
+export const fetchPaymentHistory = async (
+  filters: { status?: string; method?: string; requestId?: number; limit?: number } = {},
+  cursor?: string
+): Promise<{ payments: ApiPayment[]; nextCursor: string | null }> => {
+  const params = new URLSearchParams();
+  if (filters.status) params.set("status", filters.status);
+  if (filters.method) params.set("method", filters.method);
+  if (filters.requestId) params.set("request_id", String(filters.requestId));
+  if (filters.limit) params.set("limit", String(filters.limit));
+  if (cursor) params.set("cursor", cursor);
+
+  const response = await fetch(`${API_BASE_URL}/payments/history?${params}`, {
+    headers: authHeaders(),
+  });
+  const data = await response.json();
+  if (!data.success) throw new Error(data.message);
+  return { payments: data.payments, nextCursor: data.next_cursor };
+};
@@ -0,0 +1,10 @@
+// W3C Trace Context for API calls. Each request starts a new trace whose id
+// the backend continues, so a click can be followed through the server spans
+// (the backend echoes it back as X-Trace-Id).
+
+const randomHex = (bytes: number): string =>
+  Array.from(crypto.getRandomValues(new Uint8Array(bytes)), (b) => b.toString(16).padStart(2, "0")).join("");
+
+export const traceHeaders = (): Record<string, string> => ({
+  traceparent: `00-${randomHex(16)}-${randomHex(8)}-01`,
+});
@@ -0,0 +1,29 @@
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+
+def create_pool(host, database, user, password, min_size=2, max_size=20, timeout=10.0):
+    """Build (but do not open) an asyncio connection pool for the async managers
+
+    Open it inside the running event loop, e.g. in the ASGI startup hook:
+    await pool.open(); close it on shutdown with await pool.close().
+    """
+    return AsyncConnectionPool(
+        make_conninfo(host=host, dbname=database, user=user, password=password),
+        min_size=min_size,
+        max_size=max_size,
+        timeout=timeout,
+        open=False,
+        name=f"canconnect-{database}"
+    )
+
+
+def pool_stats(pool):
+    """Checkout figures in the same shape as database.pool.ConnectionPool.stats()"""
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    return {
+        "size": pool.max_size,
+        "in_use": size - stats.get("pool_available", 0),
+        "waiting": stats.get("requests_waiting", 0)
+    }
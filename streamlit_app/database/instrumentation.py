@@ -0,0 +1,107 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2.extensions import cursor as base_cursor
+
+# Observers are plain callables; with none registered a query pays one empty-list check
+_query_observers = []
+_event_observers = []
+_observers_lock = threading.Lock()
+
+# Blocks currently inside timed(name), e.g. concurrent bcrypt calls, for health checks
+_active = {}
+_active_lock = threading.Lock()
+
+
+class InstrumentedCursor(base_cursor):
+    """psycopg2 cursor that reports every statement to the registered query observers
+
+    Observers are called as fn(query, params, duration_seconds, rowcount, cursor)
+    in the thread that ran the statement, including for statements that raise
+    (rowcount is then -1).
+    """
+
+    def execute(self, query, vars=None):
+        if not _query_observers:
+            return super().execute(query, vars)
+
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _notify_query(query, vars, time.perf_counter() - started, self.rowcount, self)
+
+    def executemany(self, query, vars_list):
+        if not _query_observers:
+            return super().executemany(query, vars_list)
+
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _notify_query(query, vars_list, time.perf_counter() - started, self.rowcount, self)
+
+
+def _notify_query(query, params, duration, rowcount, cursor):
+    for observer in list(_query_observers):
+        try:
+            observer(query, params, duration, rowcount, cursor)
+        except Exception:
+            # Instrumentation must never break a query
+            pass
+
+
+def add_query_observer(observer):
+    with _observers_lock:
+        if observer not in _query_observers:
+            _query_observers.append(observer)
+
+
+def remove_query_observer(observer):
+    with _observers_lock:
+        if observer in _query_observers:
+            _query_observers.remove(observer)
+
+
+def add_event_observer(observer):
+    """Register fn(name, value) for named measurements such as bcrypt time or upload bytes"""
+    with _observers_lock:
+        if observer not in _event_observers:
+            _event_observers.append(observer)
+
+
+def remove_event_observer(observer):
+    with _observers_lock:
+        if observer in _event_observers:
+            _event_observers.remove(observer)
+
+
+def observe(name, value):
+    """Report a named measurement to every event observer"""
+    for observer in list(_event_observers):
+        try:
+            observer(name, value)
+        except Exception:
+            pass
+
+
+def active(name):
+    """How many threads are inside timed(name) right now"""
+    return _active.get(name, 0)
+
+
+@contextmanager
+def timed(name):
+    """Report the block's wall time in seconds as a measurement called name"""
+    with _active_lock:
+        _active[name] = _active.get(name, 0) + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        with _active_lock:
+            _active[name] -= 1
+        if _event_observers:
+            observe(name, duration)
@@ -0,0 +1,202 @@
+import os
+import threading
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from database.instrumentation import InstrumentedCursor
+
+# Pool settings; pooling stays off (plain psycopg2.connect) until configure() is called
+_settings = None
+_pools = {}
+_pools_pid = None
+_registry_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No pooled connection became free within the checkout timeout"""
+
+
+class PooledConnection:
+    """psycopg2 connection proxy whose close() returns it to the pool
+
+    Managers keep their connect / try / finally close() pattern unchanged;
+    with pooling enabled "close" just hands the connection back.
+    """
+
+    def __init__(self, owner, conn):
+        self._owner = owner
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._owner.release(conn)
+
+
+class ConnectionPool:
+    """Thread-safe, blocking connection pool for one database"""
+
+    def __init__(self, minconn, maxconn, timeout, **dsn):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, cursor_factory=InstrumentedCursor, **dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+
+    def acquire(self):
+        """Check out a connection, waiting up to timeout seconds for a free one"""
+        with self._lock:
+            self.waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection, discarding it if it is broken"""
+        try:
+            discard = bool(conn.closed)
+            if not discard:
+                try:
+                    # Hand back a clean session: no open transaction, default autocommit
+                    if conn.autocommit:
+                        conn.autocommit = False
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            self._pool.putconn(conn, close=discard)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Current checkout figures (used by health checks and metrics)"""
+        with self._lock:
+            return {"size": self.maxconn, "in_use": self.in_use, "waiting": self.waiting}
+
+    def close(self):
+        self._pool.closeall()
+
+
+def configure(minconn=1, maxconn=10, timeout=10.0):
+    """Enable pooling for every later connect() in this process (and its forks)"""
+    global _settings
+    _settings = {"minconn": minconn, "maxconn": maxconn, "timeout": timeout}
+
+
+def is_enabled():
+    return _settings is not None
+
+
+def _forget_inherited_pools():
+    """Drop pools copied from a parent process without closing its sockets"""
+    global _pools, _pools_pid
+    _pools = {}
+    _pools_pid = os.getpid()
+
+
+def _after_fork_in_child():
+    global _registry_lock
+    # The parent may have held the lock mid-fork; the child starts with a fresh one
+    _registry_lock = threading.Lock()
+    _forget_inherited_pools()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_pool(host, database, user, password):
+    """The current process's pool for a database, created on first use"""
+    key = (host, database, user, password)
+
+    with _registry_lock:
+        if _pools_pid != os.getpid():
+            _forget_inherited_pools()
+        db_pool = _pools.get(key)
+        if db_pool is None:
+            db_pool = ConnectionPool(
+                _settings["minconn"], _settings["maxconn"], _settings["timeout"],
+                host=host, database=database, user=user, password=password
+            )
+            _pools[key] = db_pool
+        return db_pool
+
+
+def connect(host, database, user, password):
+    """Get a connection: pooled when configure() has been called, direct otherwise"""
+    if _settings is None:
+        return psycopg2.connect(host=host, database=database, user=user, password=password,
+                                cursor_factory=InstrumentedCursor)
+    return get_pool(host, database, user, password).acquire()
+
+
+def init_worker(minconn=None, maxconn=None, timeout=None):
+    """Per-worker setup after fork: apply this worker's pool size and drop inherited pools
+
+    Called from gunicorn's post_fork hook so each worker owns fresh sockets
+    instead of ones inherited from the preloaded master.
+    """
+    global _settings
+    if _settings is None:
+        configure()
+    overrides = {"minconn": minconn, "maxconn": maxconn, "timeout": timeout}
+    _settings = dict(_settings, **{k: v for k, v in overrides.items() if v is not None})
+
+    with _registry_lock:
+        _forget_inherited_pools()
+
+
+def warm(host, database, user, password):
+    """Open the pool's minimum connections now rather than on the first request"""
+    return get_pool(host, database, user, password)
+
+
+def pool_stats():
+    """Stats for every pool in this process, keyed by database name"""
+    with _registry_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        return {key[1]: db_pool.stats() for key, db_pool in _pools.items()}
+
+
+def close_all():
+    """Close every pool owned by this process"""
+    with _registry_lock:
+        if _pools_pid == os.getpid():
+            for db_pool in _pools.values():
+                db_pool.close()
+        _forget_inherited_pools()
@@ -0,0 +1,25 @@
+def parse_fields(value):
+    """'id, file_name' -> {'id', 'file_name'}; None or blank means every field"""
+    if value is None:
+        return None
+    fields = {name.strip() for name in value.split(",") if name.strip()}
+    return fields or None
+
+
+def select_fields(columns, fields=None, required=()):
+    """Names from columns (name -> SQL expression) to select, in declaration order
+
+    fields=None selects every column; required names are always kept.
+    Unknown names raise ValueError so callers can answer 400.
+    """
+    if fields is None:
+        return list(columns)
+    unknown = set(fields) - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    return [name for name in columns if name in fields or name in required]
+
+
+def column_list(columns, names):
+    """Comma-separated SQL expressions for names, each selected once"""
+    return ", ".join(dict.fromkeys(columns[name] for name in names))
@@ -163,6 +163,7 @@ CREATE TABLE IF NOT EXISTS application_attachments (
     file_path VARCHAR(500) NOT NULL,
     file_type VARCHAR(50), -- pdf, jpg, png, etc
     file_size_bytes INTEGER,
+    checksum_sha256 VARCHAR(64), -- hex digest recorded at upload time
     storage_type VARCHAR(20) DEFAULT 'local', -- local, s3, azure
     s3_key VARCHAR(500), -- for AWS S3
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -170,7 +171,7 @@ CREATE TABLE IF NOT EXISTS application_attachments (
     is_verified BOOLEAN DEFAULT FALSE,
     verified_by INTEGER,
     verified_at TIMESTAMP,
-    status VARCHAR(20) DEFAULT 'active', -- active, archived, deleted
+    status VARCHAR(20) DEFAULT 'active', -- active, archived, deleted, missing, quarantined
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT fk_attach_request FOREIGN KEY (request_id) 
@@ -229,6 +230,15 @@ CREATE TABLE IF NOT EXISTS audit_logs (
         REFERENCES users(id)
 );
 
+-- ============================================================================
+-- MIGRATIONS FOR EXISTING DATABASES
+-- ============================================================================
+
+ALTER TABLE application_attachments ADD COLUMN IF NOT EXISTS checksum_sha256 VARCHAR(64);
+
+-- Trigram matching for the payment page's request search (ILIKE '%term%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- ============================================================================
 -- INDEXES FOR PERFORMANCE
 -- ============================================================================
@@ -246,11 +256,18 @@ CREATE INDEX IF NOT EXISTS idx_requests_service_id ON service_requests(service_i
 CREATE INDEX IF NOT EXISTS idx_requests_status ON service_requests(status);
 CREATE INDEX IF NOT EXISTS idx_requests_reference ON service_requests(reference_number);
 CREATE INDEX IF NOT EXISTS idx_requests_submitted ON service_requests(submitted_at);
+CREATE INDEX IF NOT EXISTS idx_requests_open_submitted ON service_requests(submitted_at DESC)
+    WHERE status NOT IN ('completed', 'rejected');
+CREATE INDEX IF NOT EXISTS idx_requests_reference_trgm ON service_requests USING gin (reference_number gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops);
 
 CREATE INDEX IF NOT EXISTS idx_attachments_request_id ON application_attachments(request_id);
+CREATE INDEX IF NOT EXISTS idx_attachments_request_active ON application_attachments(request_id, upload_date DESC, id DESC)
+    WHERE status = 'active';
 CREATE INDEX IF NOT EXISTS idx_attachments_user_id ON application_attachments(user_id);
 CREATE INDEX IF NOT EXISTS idx_attachments_storage ON application_attachments(storage_type);
 CREATE INDEX IF NOT EXISTS idx_attachments_expiry ON application_attachments(expiry_date);
+CREATE INDEX IF NOT EXISTS idx_attachments_status_id ON application_attachments(status, id);
 
 CREATE INDEX IF NOT EXISTS idx_audit_user_id ON audit_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_audit_entity ON audit_logs(entity_type, entity_id);
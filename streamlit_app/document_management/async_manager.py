@@ -0,0 +1,260 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from database.instrumentation import observe
+from document_management.manager import DocumentManager
+
+class AsyncDocumentManager(DocumentManager):
+    """DocumentManager for asyncio servers, backed by a psycopg 3 AsyncConnectionPool
+
+    Database methods are coroutines with the same results as DocumentManager.
+    File copies, hashing and deletes run in worker threads so large uploads
+    never stall the event loop. The inherited synchronous get_connection()
+    stays available for tools such as StorageScrubber run via asyncio.to_thread.
+    """
+
+    def __init__(self, pool, db_host, db_name, db_user, db_pass, storage_path="documents"):
+        super().__init__(db_host, db_name, db_user, db_pass, storage_path)
+        self.pool = pool
+
+    async def upload_document_stream(self, request_id: int, user_id: int, file_obj, file_name: str,
+                                     document_type_id: int = None, expiry_days: int = 365) -> Dict:
+        """Store an upload straight from a file-like object (no temporary file)"""
+        file_name = os.path.basename(file_name)
+
+        file_obj.seek(0, os.SEEK_END)
+        size_bytes = file_obj.tell()
+        file_obj.seek(0)
+
+        is_valid, error_msg = self.validate_upload(file_name, size_bytes)
+        if not is_valid:
+            return {"success": False, "message": error_msg}
+
+        file_extension = Path(file_name).suffix.lower().lstrip('.')
+        storage_subpath = f"req_{request_id}/{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file_name}"
+        destination_path = os.path.join(self.local_storage_dir, storage_subpath)
+
+        async with self.pool.connection() as conn:
+            try:
+                await asyncio.to_thread(os.makedirs, os.path.dirname(destination_path), exist_ok=True)
+                checksum, file_size = await asyncio.to_thread(
+                    self._copy_stream_with_checksum, file_obj, destination_path
+                )
+                observe("upload_bytes", file_size)
+
+                expiry_date = datetime.now() + timedelta(days=expiry_days)
+
+                cursor = await conn.execute("""
+                    INSERT INTO application_attachments
+                    (request_id, document_type_id, user_id, file_name, file_path,
+                     file_type, file_size_bytes, checksum_sha256, storage_type, expiry_date, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, (
+                    request_id, document_type_id, user_id, file_name, destination_path,
+                    file_extension, file_size, checksum, 'local', expiry_date, 'active'
+                ))
+
+                document_id = (await cursor.fetchone())[0]
+                await conn.commit()
+
+                return {
+                    "success": True,
+                    "document_id": document_id,
+                    "file_name": file_name,
+                    "file_size_mb": round(file_size / (1024 * 1024), 2),
+                    "storage_path": destination_path,
+                    "expiry_date": expiry_date.isoformat(),
+                    "message": "Document uploaded successfully"
+                }
+
+            except Exception as e:
+                await conn.rollback()
+                # Don't leave an orphaned file behind a failed insert
+                if os.path.exists(destination_path):
+                    await asyncio.to_thread(os.remove, destination_path)
+                return {"success": False, "message": f"Upload failed: {str(e)}"}
+
+    async def get_document(self, document_id: int) -> Optional[Dict]:
+        """Get document details by ID"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT id, file_name, file_path, file_type, file_size_bytes,
+                       upload_date, expiry_date, storage_type, status
+                FROM application_attachments
+                WHERE id = %s
+            """, (document_id,))
+
+            result = await cursor.fetchone()
+            if result:
+                return {
+                    "id": result[0],
+                    "file_name": result[1],
+                    "file_path": result[2],
+                    "file_type": result[3],
+                    "file_size_bytes": result[4],
+                    "upload_date": result[5],
+                    "expiry_date": result[6],
+                    "storage_type": result[7],
+                    "status": result[8]
+                }
+            return None
+
+    async def download_document(self, document_id: int) -> Optional[str]:
+        """Get file path for download"""
+        doc = await self.get_document(document_id)
+        if doc and await asyncio.to_thread(os.path.exists, doc['file_path']):
+            return doc['file_path']
+        return None
+
+    async def get_request_documents(self, request_id: int, limit: int = None, offset: int = 0,
+                                    fields=None) -> List[Dict]:
+        """Get documents for a service request, newest first (all of them unless limit is set)"""
+        query, names = self._documents_query(fields)
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, (request_id, limit, offset))
+            return [self._document_from_row(names, row) for row in await cursor.fetchall()]
+
+    async def verify_document(self, document_id: int, verified_by_user_id: int) -> Dict:
+        """Mark document as verified"""
+        async with self.pool.connection() as conn:
+            try:
+                cursor = await conn.execute("""
+                    UPDATE application_attachments
+                    SET is_verified = TRUE, verified_by = %s, verified_at = NOW()
+                    WHERE id = %s
+                    RETURNING verified_at
+                """, (verified_by_user_id, document_id))
+
+                result = await cursor.fetchone()
+                if result is None:
+                    await conn.rollback()
+                    return {"success": False, "message": "Document not found"}
+
+                await conn.commit()
+                return {"success": True, "verified_at": result[0].isoformat(), "message": "Document verified"}
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def delete_document(self, document_id: int) -> Dict:
+        """Delete/archive document"""
+        async with self.pool.connection() as conn:
+            try:
+                cursor = await conn.execute(
+                    "SELECT file_path FROM application_attachments WHERE id = %s",
+                    (document_id,)
+                )
+                result = await cursor.fetchone()
+                if not result:
+                    return {"success": False, "message": "Document not found"}
+
+                file_path = result[0]
+                if await asyncio.to_thread(os.path.exists, file_path):
+                    await asyncio.to_thread(os.remove, file_path)
+
+                await conn.execute(
+                    "UPDATE application_attachments SET status = 'deleted' WHERE id = %s",
+                    (document_id,)
+                )
+                await conn.commit()
+
+                return {"success": True, "message": "Document deleted"}
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def cleanup_expired_documents(self) -> Dict:
+        """Delete expired documents (retention policy)"""
+        async with self.pool.connection() as conn:
+            try:
+                cursor = await conn.execute("""
+                    SELECT id, file_path FROM application_attachments
+                    WHERE expiry_date <= NOW() AND status = 'active'
+                """)
+                expired_docs = await cursor.fetchall()
+
+                # Remove files off the event loop; only rows whose file is gone get archived
+                removed_ids = await asyncio.to_thread(self._remove_files, expired_docs)
+                if removed_ids:
+                    await conn.execute(
+                        "UPDATE application_attachments SET status = 'archived' WHERE id = ANY(%s)",
+                        (removed_ids,)
+                    )
+
+                await conn.commit()
+                return {
+                    "success": True,
+                    "deleted_count": len(removed_ids),
+                    "message": f"Cleaned up {len(removed_ids)} expired documents"
+                }
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    @staticmethod
+    def _remove_files(docs) -> List[int]:
+        """Delete (doc_id, file_path) files, returning the ids now safe to archive"""
+        removed = []
+        for doc_id, file_path in docs:
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                removed.append(doc_id)
+            except OSError:
+                # Left active; the storage scrubber reports anything left behind
+                continue
+        return removed
+
+    async def get_storage_stats(self) -> Dict:
+        """Get document storage statistics"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(file_size_bytes), 0)
+                FROM application_attachments
+                WHERE status = 'active'
+            """)
+            total_docs, total_size = await cursor.fetchone()
+
+            cursor = await conn.execute("""
+                SELECT storage_type, COUNT(*), SUM(file_size_bytes)
+                FROM application_attachments
+                WHERE status = 'active'
+                GROUP BY storage_type
+            """)
+            storage_by_type = [
+                {
+                    "storage_type": row[0],
+                    "count": row[1],
+                    "total_size_mb": round((row[2] or 0) / (1024*1024), 2)
+                }
+                for row in await cursor.fetchall()
+            ]
+
+            cursor = await conn.execute("""
+                SELECT file_type, COUNT(*), SUM(file_size_bytes)
+                FROM application_attachments
+                WHERE status = 'active'
+                GROUP BY file_type
+            """)
+            format_data = [
+                {
+                    "file_type": row[0],
+                    "count": row[1],
+                    "total_size_mb": round((row[2] or 0) / (1024*1024), 2)
+                }
+                for row in await cursor.fetchall()
+            ]
+
+            return {
+                "total_documents": total_docs,
+                "total_size_gb": round(total_size / (1024*1024*1024), 2),
+                "avg_file_size_mb": round((total_size / (1024*1024)) / max(total_docs, 1), 2),
+                "by_storage_type": storage_by_type,
+                "by_file_type": format_data
+            }
@@ -1,11 +1,27 @@
 import os
 import shutil
+import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
-import psycopg2
+from database.instrumentation import observe, timed
+from database.pool import connect
+from database.projection import column_list, select_fields
 from typing import Dict, List, Optional, Tuple
 import mimetypes
 
+# Document fields selectable with fields=...; both size fields are derived from file_size_bytes
+DOCUMENT_COLUMNS = {
+    "id": "id",
+    "file_name": "file_name",
+    "file_type": "file_type",
+    "file_size_mb": "file_size_bytes",
+    "file_size_formatted": "file_size_bytes",
+    "upload_date": "upload_date",
+    "is_verified": "is_verified",
+    "status": "status",
+    "document_type_id": "document_type_id"
+}
+
 class DocumentManager:
     """Manage document uploads, storage, validation, and retrieval"""
     
@@ -25,8 +41,8 @@ class DocumentManager:
         self.max_file_size_mb = 10  # Default 10MB
     
     def get_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(
+        """Create database connection (pooled when database.pool is configured)"""
+        return connect(
             host=self.db_host,
             database=self.db_name,
             user=self.db_user,
@@ -46,13 +62,24 @@ class DocumentManager:
         if not os.path.exists(file_path):
             return False, "File does not exist"
         
+        return self.validate_upload(os.path.basename(file_path), os.path.getsize(file_path), max_size_mb)
+    
+    def validate_upload(self, file_name: str, size_bytes: int, max_size_mb: int = None) -> Tuple[bool, str]:
+        """
+        Validate an upload's name and size before any bytes are written
+        
+        Returns: (is_valid, error_message)
+        """
+        if max_size_mb is None:
+            max_size_mb = self.max_file_size_mb
+        
         # Check file size
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        file_size_mb = size_bytes / (1024 * 1024)
         if file_size_mb > max_size_mb:
             return False, f"File size ({file_size_mb:.2f}MB) exceeds limit ({max_size_mb}MB)"
         
         # Check file extension
-        file_extension = Path(file_path).suffix.lower().lstrip('.')
+        file_extension = Path(file_name).suffix.lower().lstrip('.')
         if file_extension not in self.allowed_formats:
             return False, f"File format .{file_extension} not allowed. Allowed: {', '.join(self.allowed_formats)}"
         
@@ -72,27 +99,61 @@ class DocumentManager:
         
         Returns: Dictionary with upload result
         """
+        # Validate file
+        is_valid, error_msg = self.validate_file(file_path)
+        if not is_valid:
+            return {"success": False, "message": error_msg}
+        
+        with open(file_path, 'rb') as source:
+            result = self._store_document(request_id, user_id, source, os.path.basename(file_path),
+                                          document_type_id, expiry_days)
+        if result["success"]:
+            shutil.copystat(file_path, result["storage_path"])
+        return result
+    
+    def upload_document_stream(self, request_id: int, user_id: int, file_obj, file_name: str,
+                               document_type_id: int = None, expiry_days: int = 365) -> Dict:
+        """
+        Store an upload straight from a file-like object (no temporary file)
+        
+        Args:
+            file_obj: Readable binary stream, e.g. a Streamlit UploadedFile or werkzeug FileStorage
+            file_name: Original file name, used for validation and the stored name
+        
+        Returns: Dictionary with upload result
+        """
+        file_name = os.path.basename(file_name)
+        
+        # Size from the stream itself, so nothing is buffered to find it
+        file_obj.seek(0, os.SEEK_END)
+        size_bytes = file_obj.tell()
+        file_obj.seek(0)
+        
+        is_valid, error_msg = self.validate_upload(file_name, size_bytes)
+        if not is_valid:
+            return {"success": False, "message": error_msg}
+        
+        return self._store_document(request_id, user_id, file_obj, file_name, document_type_id, expiry_days)
+    
+    def _store_document(self, request_id: int, user_id: int, source, file_name: str,
+                        document_type_id: int = None, expiry_days: int = 365) -> Dict:
+        """Copy a validated stream into storage and record it"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        destination_path = None
         
         try:
-            # Validate file
-            is_valid, error_msg = self.validate_file(file_path)
-            if not is_valid:
-                return {"success": False, "message": error_msg}
-            
-            # Get file info
-            file_name = os.path.basename(file_path)
-            file_size = os.path.getsize(file_path)
-            file_extension = Path(file_path).suffix.lower().lstrip('.')
+            file_extension = Path(file_name).suffix.lower().lstrip('.')
             
             # Create organized storage path
             storage_subpath = f"req_{request_id}/{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file_name}"
             destination_path = os.path.join(self.local_storage_dir, storage_subpath)
             os.makedirs(os.path.dirname(destination_path), exist_ok=True)
             
-            # Copy file to storage
-            shutil.copy2(file_path, destination_path)
+            # Copy file to storage, recording its checksum for integrity scrubs
+            with timed("fs_copy_seconds"):
+                checksum, file_size = self._copy_stream_with_checksum(source, destination_path)
+            observe("upload_bytes", file_size)
             
             # Calculate expiry date
             expiry_date = datetime.now() + timedelta(days=expiry_days)
@@ -101,12 +162,12 @@ class DocumentManager:
             cursor.execute("""
                 INSERT INTO application_attachments
                 (request_id, document_type_id, user_id, file_name, file_path, 
-                 file_type, file_size_bytes, storage_type, expiry_date, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                 file_type, file_size_bytes, checksum_sha256, storage_type, expiry_date, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING id
             """, (
                 request_id, document_type_id, user_id, file_name, destination_path,
-                file_extension, file_size, 'local', expiry_date, 'active'
+                file_extension, file_size, checksum, 'local', expiry_date, 'active'
             ))
             
             document_id = cursor.fetchone()[0]
@@ -124,11 +185,36 @@ class DocumentManager:
         
         except Exception as e:
             conn.rollback()
+            # Don't leave an orphaned file behind a failed insert
+            if destination_path and os.path.exists(destination_path):
+                os.remove(destination_path)
             return {"success": False, "message": f"Upload failed: {str(e)}"}
         finally:
             cursor.close()
             conn.close()
     
+    @staticmethod
+    def file_checksum(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """Compute the SHA-256 hex digest of a stored file"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _copy_stream_with_checksum(source, destination_path: str,
+                                   chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+        """Write a binary stream to disk in chunks, returning (sha256 hex digest, bytes written)"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(destination_path, 'wb') as dst:
+            for chunk in iter(lambda: source.read(chunk_size), b''):
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+    
     def get_document(self, document_id: int) -> Optional[Dict]:
         """Get document details by ID"""
         conn = self.get_connection()
@@ -167,41 +253,64 @@ class DocumentManager:
             return doc['file_path']
         return None
     
-    def get_request_documents(self, request_id: int) -> List[Dict]:
-        """Get all documents for a service request"""
+    def _documents_query(self, fields=None) -> Tuple[str, List[str]]:
+        """SELECT for get_request_documents limited to fields, and the field names it returns"""
+        names = select_fields(DOCUMENT_COLUMNS, fields, required=("id",))
+        query = f"""
+            SELECT {column_list(DOCUMENT_COLUMNS, names)}
+            FROM application_attachments
+            WHERE request_id = %s AND status = 'active'
+            ORDER BY upload_date DESC, id DESC
+            LIMIT %s OFFSET %s
+        """
+        return query, names
+    
+    @staticmethod
+    def _document_from_row(names: List[str], row) -> Dict:
+        values = dict(zip(dict.fromkeys(DOCUMENT_COLUMNS[name] for name in names), row))
+        document = {}
+        for name in names:
+            if name in ("file_size_mb", "file_size_formatted"):
+                size_bytes = values["file_size_bytes"]
+                file_size_mb = round(size_bytes / (1024 * 1024), 2)
+                if name == "file_size_mb":
+                    document[name] = file_size_mb
+                elif file_size_mb < 1:
+                    document[name] = f"{round(size_bytes / 1024, 2)} KB"
+                else:
+                    document[name] = f"{file_size_mb} MB"
+            else:
+                document[name] = values[DOCUMENT_COLUMNS[name]]
+        return document
+    
+    def get_request_documents(self, request_id: int, limit: int = None, offset: int = 0,
+                              fields=None) -> List[Dict]:
+        """Get documents for a service request, newest first (all of them unless limit is set)
+        
+        fields limits the result (and the SELECT) to those document fields.
+        """
+        query, names = self._documents_query(fields)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute("""
-                SELECT id, file_name, file_type, file_size_bytes, upload_date, 
-                       is_verified, status, document_type_id
-                FROM application_attachments
-                WHERE request_id = %s AND status = 'active'
-                ORDER BY upload_date DESC
-            """, (request_id,))
-            
-            documents = []
-            for row in cursor.fetchall():
-                file_size_mb = round(row[3] / (1024 * 1024), 2)
-                if file_size_mb < 1:
-                    file_size_formatted = f"{round(row[3] / 1024, 2)} KB"
-                else:
-                    file_size_formatted = f"{file_size_mb} MB"
-                
-                documents.append({
-                    "id": row[0],
-                    "file_name": row[1],
-                    "file_type": row[2],
-                    "file_size_mb": file_size_mb,
-                    "file_size_formatted": file_size_formatted,
-                    "upload_date": row[4],
-                    "is_verified": row[5],
-                    "status": row[6],
-                    "document_type_id": row[7]
-                })
-            
-            return documents
+            cursor.execute(query, (request_id, limit, offset))
+            return [self._document_from_row(names, row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def count_request_documents(self, request_id: int) -> int:
+        """Count active documents for a service request"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                "SELECT COUNT(*) FROM application_attachments WHERE request_id = %s AND status = 'active'",
+                (request_id,)
+            )
+            return cursor.fetchone()[0]
         finally:
             cursor.close()
             conn.close()
@@ -216,10 +325,16 @@ class DocumentManager:
                 UPDATE application_attachments
                 SET is_verified = TRUE, verified_by = %s, verified_at = NOW()
                 WHERE id = %s
+                RETURNING verified_at
             """, (verified_by_user_id, document_id))
             
+            result = cursor.fetchone()
+            if result is None:
+                conn.rollback()
+                return {"success": False, "message": "Document not found"}
+            
             conn.commit()
-            return {"success": True, "message": "Document verified"}
+            return {"success": True, "verified_at": result[0].isoformat(), "message": "Document verified"}
         except Exception as e:
             conn.rollback()
             return {"success": False, "message": str(e)}
@@ -245,7 +360,8 @@ class DocumentManager:
                 
                 # Delete from filesystem
                 if os.path.exists(file_path):
-                    os.remove(file_path)
+                    with timed("fs_remove_seconds"):
+                        os.remove(file_path)
                 
                 # Mark as deleted in database
                 cursor.execute(
@@ -289,8 +405,10 @@ class DocumentManager:
                         (doc_id,)
                     )
                     deleted_count += 1
-                except:
-                    pass
+                except OSError:
+                    # Leave the row active so the file and row stay in sync;
+                    # the storage scrubber reports anything left behind
+                    continue
             
             conn.commit()
             return {
@@ -0,0 +1,415 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class StorageScrubber:
+    """Reconcile application_attachments rows against files in document storage
+
+    Each run processes a bounded slice of the store and records where it
+    stopped in a checkpoint file, so a full pass is spread over many runs:
+
+    - rows:  active attachment rows are streamed with a server-side cursor in
+             id order and checked for a file on disk (and optionally checksum)
+    - files: request directories (req_<id>) are scanned in name order and every
+             file is matched against the rows recorded for that request
+
+    Nothing is changed unless apply=True. Quarantine actions then move orphaned
+    or corrupt files into <storage_path>/quarantine and flag the affected rows.
+
+    Rows and files are matched on their path below local_storage_dir
+    (req_<id>/<file>), never on the working directory the uploader ran in.
+    A slice where nearly every row is missing or nearly every file orphaned
+    points at a wrong storage path rather than real damage, so apply is
+    refused for it.
+    """
+
+    CHECKPOINT_FILE = ".scrub_checkpoint.json"
+
+    def __init__(self, doc_manager, workers: int = 8, grace_minutes: int = 60,
+                 report_dir: str = None, max_missing_ratio: float = 0.9, min_sample: int = 20):
+        self.doc_manager = doc_manager
+        self.workers = workers
+        self.grace_seconds = grace_minutes * 60
+        self.max_missing_ratio = max_missing_ratio
+        self.min_sample = min_sample
+        self.local_storage_dir = os.path.abspath(doc_manager.local_storage_dir)
+        self.quarantine_dir = os.path.join(doc_manager.storage_path, "quarantine")
+        self.report_dir = report_dir or os.path.join(doc_manager.storage_path, "scrub_reports")
+        self.checkpoint_path = os.path.join(doc_manager.storage_path, self.CHECKPOINT_FILE)
+
+    # ---------------------------------------------------------------
+    # Checkpoints
+    # ---------------------------------------------------------------
+
+    def load_checkpoint(self) -> Dict:
+        """Load the scrub position, starting a new pass if none exists"""
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r') as f:
+                return json.load(f)
+        return {
+            "last_attachment_id": 0,
+            "last_directory": "",
+            "pass_started_at": datetime.now().isoformat(),
+            "passes_completed": 0
+        }
+
+    def save_checkpoint(self, checkpoint: Dict):
+        """Atomically persist the scrub position"""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # ---------------------------------------------------------------
+    # Path matching
+    # ---------------------------------------------------------------
+
+    @staticmethod
+    def storage_key(path: str) -> Optional[str]:
+        """req_<id>/<file> part of a stored or on-disk path, or None if it has none"""
+        parts = os.path.normpath(path).split(os.sep)
+        if len(parts) >= 2 and parts[-2].startswith("req_"):
+            return os.path.join(parts[-2], parts[-1])
+        return None
+
+    def resolve_stored_path(self, stored_path: str) -> str:
+        """Absolute location of a row's file under local_storage_dir"""
+        key = self.storage_key(stored_path)
+        if key is not None:
+            return os.path.join(self.local_storage_dir, key)
+        if os.path.isabs(stored_path):
+            return os.path.normpath(stored_path)
+        return os.path.join(self.local_storage_dir, stored_path)
+
+    # ---------------------------------------------------------------
+    # Rows -> files
+    # ---------------------------------------------------------------
+
+    def _stream_rows(self, after_id: int, max_rows: int):
+        """Yield active attachment rows after a given id via a server-side cursor"""
+        conn = self.doc_manager.get_connection()
+        cursor = conn.cursor(name="scrub_attachments")
+        cursor.itersize = 1000
+
+        try:
+            cursor.execute("""
+                SELECT id, request_id, file_path, file_size_bytes, checksum_sha256
+                FROM application_attachments
+                WHERE status = 'active' AND storage_type = 'local' AND id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (after_id, max_rows))
+
+            for row in cursor:
+                yield {
+                    "id": row[0],
+                    "request_id": row[1],
+                    "file_path": row[2],
+                    "file_size_bytes": row[3],
+                    "checksum_sha256": row[4]
+                }
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _check_row(self, row: Dict, verify_checksums: bool) -> Optional[Dict]:
+        """Check one row's file; returns a finding or None if healthy"""
+        file_path = self.resolve_stored_path(row["file_path"])
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return {
+                "type": "missing_file", "document_id": row["id"], "file_path": file_path,
+                "stored_path": row["file_path"]
+            }
+
+        if row["file_size_bytes"] is not None and size != row["file_size_bytes"]:
+            return {
+                "type": "size_mismatch", "document_id": row["id"], "file_path": file_path,
+                "expected": row["file_size_bytes"], "actual": size
+            }
+
+        if verify_checksums and row["checksum_sha256"]:
+            actual = self.doc_manager.file_checksum(file_path)
+            if actual != row["checksum_sha256"]:
+                return {
+                    "type": "checksum_mismatch", "document_id": row["id"], "file_path": file_path,
+                    "expected": row["checksum_sha256"], "actual": actual
+                }
+        return None
+
+    def scrub_rows(self, checkpoint: Dict, max_rows: int, verify_checksums: bool) -> Dict:
+        """Check the next slice of rows, advancing the checkpoint"""
+        findings = []
+        checked = 0
+        last_id = checkpoint["last_attachment_id"]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batch = []
+            for row in self._stream_rows(last_id, max_rows):
+                batch.append(row)
+                if len(batch) >= 500:
+                    findings.extend(f for f in executor.map(
+                        lambda r: self._check_row(r, verify_checksums), batch) if f)
+                    checked += len(batch)
+                    last_id = batch[-1]["id"]
+                    batch = []
+            if batch:
+                findings.extend(f for f in executor.map(
+                    lambda r: self._check_row(r, verify_checksums), batch) if f)
+                checked += len(batch)
+                last_id = batch[-1]["id"]
+
+        exhausted = checked < max_rows
+        checkpoint["last_attachment_id"] = 0 if exhausted else last_id
+        return {"checked": checked, "exhausted": exhausted, "findings": findings}
+
+    # ---------------------------------------------------------------
+    # Files -> rows
+    # ---------------------------------------------------------------
+
+    def _next_directories(self, after: str, max_directories: int) -> List[str]:
+        """Return the next request directories in name order"""
+        if not os.path.isdir(self.local_storage_dir):
+            return []
+        names = sorted(
+            entry.name for entry in os.scandir(self.local_storage_dir)
+            if entry.is_dir() and entry.name.startswith("req_") and entry.name > after
+        )
+        return names[:max_directories]
+
+    def _scan_directory(self, name: str) -> List[str]:
+        """List files in a request directory that are past the upload grace period"""
+        now = datetime.now().timestamp()
+        files = []
+        for entry in os.scandir(os.path.join(self.local_storage_dir, name)):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if now - max(stat.st_mtime, stat.st_ctime) < self.grace_seconds:
+                continue
+            files.append(os.path.abspath(entry.path))
+        return files
+
+    def _known_paths(self, request_ids: List[int]) -> Dict[str, tuple]:
+        """Map resolved absolute file path -> (document id, status) for the given requests"""
+        if not request_ids:
+            return {}
+        conn = self.doc_manager.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT id, file_path, status
+                FROM application_attachments
+                WHERE request_id = ANY(%s)
+            """, (request_ids,))
+            return {self.resolve_stored_path(row[1]): (row[0], row[2]) for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def scrub_files(self, checkpoint: Dict, max_directories: int) -> Dict:
+        """Check the next slice of request directories, advancing the checkpoint"""
+        directories = self._next_directories(checkpoint["last_directory"], max_directories)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            scanned = dict(zip(directories, executor.map(self._scan_directory, directories)))
+
+        request_ids = []
+        for name in directories:
+            try:
+                request_ids.append(int(name[len("req_"):]))
+            except ValueError:
+                continue
+        known = self._known_paths(request_ids)
+
+        findings = []
+        checked = 0
+        for name, files in scanned.items():
+            for path in files:
+                checked += 1
+                match = known.get(path)
+                if match is None:
+                    findings.append({"type": "orphan_file", "file_path": path})
+                elif match[1] != 'active':
+                    findings.append({
+                        "type": "stale_file", "file_path": path,
+                        "document_id": match[0], "status": match[1]
+                    })
+
+        exhausted = len(directories) < max_directories
+        checkpoint["last_directory"] = "" if exhausted else (directories[-1] if directories else "")
+        return {
+            "directories": len(directories), "checked": checked,
+            "exhausted": exhausted, "findings": findings
+        }
+
+    # ---------------------------------------------------------------
+    # Quarantine actions
+    # ---------------------------------------------------------------
+
+    def _quarantine_file(self, file_path: str) -> str:
+        """Move a file into the quarantine directory, preserving its relative path"""
+        relative = os.path.relpath(file_path, self.local_storage_dir)
+        if relative.startswith(".."):
+            relative = os.path.basename(file_path)
+        target = os.path.join(self.quarantine_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(file_path, target)
+        return target
+
+    def apply_actions(self, findings: List[Dict]) -> List[Dict]:
+        """Quarantine files and flag rows for the given findings"""
+        actions = []
+        missing_ids = []
+        quarantined_ids = []
+
+        for finding in findings:
+            kind = finding["type"]
+            try:
+                if kind == "missing_file":
+                    missing_ids.append(finding["document_id"])
+                    actions.append({"action": "mark_missing", "document_id": finding["document_id"]})
+                elif kind in ("orphan_file", "stale_file", "size_mismatch", "checksum_mismatch"):
+                    target = self._quarantine_file(finding["file_path"])
+                    actions.append({"action": "quarantine", "file_path": finding["file_path"], "moved_to": target})
+                    if kind in ("size_mismatch", "checksum_mismatch"):
+                        quarantined_ids.append(finding["document_id"])
+            except OSError as e:
+                actions.append({"action": "error", "file_path": finding.get("file_path"), "message": str(e)})
+
+        if missing_ids or quarantined_ids:
+            conn = self.doc_manager.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE application_attachments SET status = 'missing', updated_at = NOW()
+                    WHERE id = ANY(%s) AND status = 'active'
+                """, (missing_ids,))
+                cursor.execute("""
+                    UPDATE application_attachments SET status = 'quarantined', updated_at = NOW()
+                    WHERE id = ANY(%s) AND status = 'active'
+                """, (quarantined_ids,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+
+        return actions
+
+    def misconfiguration(self, rows_result: Dict, files_result: Dict) -> Optional[str]:
+        """Reason to distrust a slice whose findings are almost all missing/orphaned"""
+        missing = sum(1 for f in rows_result["findings"] if f["type"] == "missing_file")
+        if rows_result["checked"] >= self.min_sample and missing >= rows_result["checked"] * self.max_missing_ratio:
+            return (f"{missing} of {rows_result['checked']} rows have no file under "
+                    f"{self.local_storage_dir}; check the storage path")
+        orphans = sum(1 for f in files_result["findings"] if f["type"] == "orphan_file")
+        if files_result["checked"] >= self.min_sample and orphans >= files_result["checked"] * self.max_missing_ratio:
+            return (f"{orphans} of {files_result['checked']} files match no row; "
+                    f"check the storage path and database")
+        return None
+
+    # ---------------------------------------------------------------
+    # Entry point
+    # ---------------------------------------------------------------
+
+    def run(self, max_rows: int = 10000, max_directories: int = 500,
+            verify_checksums: bool = False, apply: bool = False) -> Dict:
+        """Scrub the next slice of the store and write a report"""
+        started_at = datetime.now()
+        checkpoint = self.load_checkpoint()
+
+        try:
+            rows_result = self.scrub_rows(checkpoint, max_rows, verify_checksums)
+            files_result = self.scrub_files(checkpoint, max_directories)
+        except Exception as e:
+            return {"success": False, "message": f"Scrub failed: {str(e)}"}
+
+        findings = rows_result["findings"] + files_result["findings"]
+        refused = self.misconfiguration(rows_result, files_result) if apply else None
+        actions = self.apply_actions(findings) if apply and refused is None else []
+
+        pass_complete = rows_result["exhausted"] and files_result["exhausted"]
+        if pass_complete:
+            checkpoint["passes_completed"] += 1
+            checkpoint["pass_started_at"] = datetime.now().isoformat()
+        self.save_checkpoint(checkpoint)
+
+        report = {
+            "started_at": started_at.isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "rows_checked": rows_result["checked"],
+            "directories_scanned": files_result["directories"],
+            "files_checked": files_result["checked"],
+            "verify_checksums": verify_checksums,
+            "applied": apply and refused is None,
+            "refused": refused,
+            "pass_complete": pass_complete,
+            "checkpoint": checkpoint,
+            "findings": findings,
+            "actions": actions
+        }
+
+        os.makedirs(self.report_dir, exist_ok=True)
+        report_path = os.path.join(self.report_dir, f"scrub_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        return {
+            "success": True,
+            "report_path": report_path,
+            "rows_checked": report["rows_checked"],
+            "files_checked": report["files_checked"],
+            "findings": len(findings),
+            "actions": len(actions),
+            "pass_complete": pass_complete,
+            "refused": refused,
+            "message": f"Scrubbed {report['rows_checked']} rows and {report['files_checked']} files, "
+                       f"{len(findings)} issue(s) found"
+                       + (f"; not applied: {refused}" if refused else "")
+        }
+
+
+def main():
+    """Command-line entry point for scheduled scrub runs"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from document_management.manager import DocumentManager
+
+    parser = argparse.ArgumentParser(description="Scrub CanConnect document storage")
+    # Same default as the API's FILE_STORAGE_PATH, so both resolve the same local_storage_dir
+    parser.add_argument("--storage-path", default=os.getenv("FILE_STORAGE_PATH", "documents/local"))
+    parser.add_argument("--max-rows", type=int, default=10000)
+    parser.add_argument("--max-directories", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--verify-checksums", action="store_true")
+    parser.add_argument("--apply", action="store_true", help="Quarantine files and flag rows")
+    args = parser.parse_args()
+
+    doc_manager = DocumentManager(
+        db_host=os.getenv("DB_HOST", "localhost"),
+        db_name=os.getenv("DB_NAME", "canconnect"),
+        db_user=os.getenv("DB_USER", "postgres"),
+        db_pass=os.getenv("DB_PASS", "password"),
+        storage_path=args.storage_path
+    )
+    scrubber = StorageScrubber(doc_manager, workers=args.workers)
+    result = scrubber.run(
+        max_rows=args.max_rows,
+        max_directories=args.max_directories,
+        verify_checksums=args.verify_checksums,
+        apply=args.apply
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
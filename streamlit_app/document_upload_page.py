@@ -29,13 +29,44 @@ with st.sidebar:
         ["Upload Document", "My Documents", "Verification Queue", "Storage Stats"]
     )
 
+DOCUMENTS_PER_PAGE = 10
+
+
+@st.cache_resource
+def get_doc_manager():
+    """One DocumentManager per server process instead of one per rerun"""
+    return DocumentManager(
+        db_host="localhost",
+        db_name="canconnect",
+        db_user="postgres",
+        db_pass="password"
+    )
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_request_documents(request_id, page):
+    """One page of a request's documents plus the total count"""
+    manager = get_doc_manager()
+    documents = manager.get_request_documents(
+        request_id, limit=DOCUMENTS_PER_PAGE, offset=(page - 1) * DOCUMENTS_PER_PAGE
+    )
+    return documents, manager.count_request_documents(request_id)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_storage_stats():
+    """Storage statistics; refreshed every few minutes or after a change"""
+    return get_doc_manager().get_storage_stats()
+
+
+def invalidate_document_caches():
+    """Drop cached queries after an upload, delete, verification or cleanup"""
+    load_request_documents.clear()
+    load_storage_stats.clear()
+
+
 # Initialize document manager
-doc_manager = DocumentManager(
-    db_host="localhost",
-    db_name="canconnect",
-    db_user="postgres",
-    db_pass="password"
-)
+doc_manager = get_doc_manager()
 
 # Tab 1: Upload Document
 if selected_tab == "Upload Document":
@@ -72,83 +103,100 @@ if selected_tab == "Upload Document":
         st.write(f"**Size:** {uploaded_file.size / 1024:.2f} KB")
         
         if st.button("📤 Upload Document", use_container_width=True):
-            # Save temporary file
-            temp_path = f"temp_{uploaded_file.name}"
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Validate file
-            is_valid, error_msg = doc_manager.validate_file(temp_path)
+            # Stream straight from the upload buffer into storage; no temp file
+            result = doc_manager.upload_document_stream(
+                request_id=request_id,
+                user_id=user_id,
+                file_obj=uploaded_file,
+                file_name=uploaded_file.name,
+                document_type_id=document_type_id,
+                expiry_days=expiry_days
+            )
             
-            if not is_valid:
-                st.error(f"❌ {error_msg}")
+            if result["success"]:
+                invalidate_document_caches()
+                st.success(f"✅ Document uploaded successfully!")
+                st.write(f"**Document ID:** {result['document_id']}")
+                st.write(f"**Storage Path:** {result['storage_path']}")
+                st.write(f"**Expiry Date:** {result['expiry_date']}")
             else:
-                # Upload document
-                result = doc_manager.upload_document(
-                    request_id=request_id,
-                    user_id=user_id,
-                    file_path=temp_path,
-                    document_type_id=document_type_id,
-                    expiry_days=expiry_days
-                )
-                
-                if result["success"]:
-                    st.success(f"✅ Document uploaded successfully!")
-                    st.write(f"**Document ID:** {result['document_id']}")
-                    st.write(f"**Storage Path:** {result['file_path']}")
-                    st.write(f"**Expiry Date:** {result['expiry_date']}")
-                else:
-                    st.error(f"❌ {result['message']}")
-            
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+                st.error(f"❌ {result['message']}")
 
 # Tab 2: My Documents
 elif selected_tab == "My Documents":
     st.header("My Uploaded Documents")
     
-    request_id = st.number_input("Enter Service Request ID", min_value=1, key="req_id")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        request_id = st.number_input("Enter Service Request ID", min_value=1, key="req_id")
+    with col2:
+        if st.button("🔄 Refresh", use_container_width=True):
+            load_request_documents.clear()
+    
+    # Reset to the first page when switching requests
+    if st.session_state.get('documents_request_id') != request_id:
+        st.session_state.documents_request_id = request_id
+        st.session_state.documents_page = 1
     
-    if st.button("📂 Load Documents", use_container_width=True):
-        documents = doc_manager.get_request_documents(request_id)
+    documents, total_documents = load_request_documents(request_id, st.session_state.documents_page)
+    total_pages = max(1, (total_documents + DOCUMENTS_PER_PAGE - 1) // DOCUMENTS_PER_PAGE)
+    
+    if documents:
+        st.success(f"Found {total_documents} document(s)")
         
-        if documents:
-            st.success(f"Found {len(documents)} document(s)")
-            
-            for doc in documents:
-                with st.container(border=True):
-                    col1, col2, col3 = st.columns([2, 1, 1])
-                    
-                    with col1:
-                        st.write(f"**{doc['file_name']}**")
-                        st.caption(f"Size: {doc['file_size_formatted']} | Type: {doc['file_type']}")
+        for doc in documents:
+            with st.container(border=True):
+                col1, col2, col3 = st.columns([2, 1, 1])
+                
+                with col1:
+                    st.write(f"**{doc['file_name']}**")
+                    st.caption(f"Size: {doc['file_size_formatted']} | Type: {doc['file_type']}")
+                
+                with col2:
+                    if doc['is_verified']:
+                        st.success("✅ Verified")
+                    else:
+                        st.warning("⏳ Pending")
+                
+                with col3:
+                    col_del, col_down = st.columns(2)
+                    with col_down:
+                        if st.button("📥", key=f"download_{doc['id']}", help="Download"):
+                            st.session_state.download_document_id = doc['id']
+                    with col_del:
+                        if st.button("🗑️", key=f"delete_{doc['id']}", help="Delete"):
+                            result = doc_manager.delete_document(doc['id'])
+                            if result["success"]:
+                                invalidate_document_caches()
+                                st.rerun()
                     
-                    with col2:
-                        if doc['is_verified']:
-                            st.success("✅ Verified")
+                    # The file is only opened for the document the user asked for
+                    if st.session_state.get('download_document_id') == doc['id']:
+                        file_path = doc_manager.download_document(doc['id'])
+                        if file_path:
+                            with open(file_path, "rb") as f:
+                                st.download_button(
+                                    label="Click to download",
+                                    data=f,
+                                    file_name=doc['file_name'],
+                                    key=f"download_file_{doc['id']}"
+                                )
                         else:
-                            st.warning("⏳ Pending")
-                    
-                    with col3:
-                        col_del, col_down = st.columns(2)
-                        with col_down:
-                            if st.button("📥", key=f"download_{doc['id']}", help="Download"):
-                                file_path = doc_manager.download_document(doc['id'])
-                                if file_path and os.path.exists(file_path):
-                                    with open(file_path, "rb") as f:
-                                        st.download_button(
-                                            label="Click to download",
-                                            data=f.read(),
-                                            file_name=doc['file_name']
-                                        )
-                        with col_del:
-                            if st.button("🗑️", key=f"delete_{doc['id']}", help="Delete"):
-                                result = doc_manager.delete_document(doc['id'])
-                                if result["success"]:
-                                    st.rerun()
-        else:
-            st.info("No documents found for this request")
+                            st.error("File is missing from storage")
+        
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.session_state.documents_page > 1 and st.button("← Previous"):
+                st.session_state.documents_page -= 1
+                st.rerun()
+        with col_page:
+            st.caption(f"Page {st.session_state.documents_page} of {total_pages}")
+        with col_next:
+            if st.session_state.documents_page < total_pages and st.button("Next →"):
+                st.session_state.documents_page += 1
+                st.rerun()
+    else:
+        st.info("No documents found for this request")
 
 # Tab 3: Verification Queue (Staff Only)
 elif selected_tab == "Verification Queue":
@@ -167,6 +215,7 @@ elif selected_tab == "Verification Queue":
     if st.button("✅ Verify Document", use_container_width=True):
         result = doc_manager.verify_document(document_id, staff_id)
         if result["success"]:
+            invalidate_document_caches()
             st.success("Document verified successfully!")
             st.write(f"**Verified At:** {result['verified_at']}")
             st.write(f"**Verified By:** Staff ID {staff_id}")
@@ -179,10 +228,9 @@ elif selected_tab == "Verification Queue":
     if st.button("🧹 Run Cleanup", use_container_width=True, type="secondary"):
         cleanup_result = doc_manager.cleanup_expired_documents()
         if cleanup_result["success"]:
+            invalidate_document_caches()
             st.success("Cleanup completed!")
-            st.write(f"**Documents Archived:** {cleanup_result['archived_count']}")
-            st.write(f"**Documents Deleted:** {cleanup_result['deleted_count']}")
-            st.write(f"**Total Size Freed:** {cleanup_result['total_size_freed_mb']:.2f} MB")
+            st.write(f"**Documents Archived:** {cleanup_result['deleted_count']}")
         else:
             st.error(f"❌ {cleanup_result['message']}")
 
@@ -190,7 +238,10 @@ elif selected_tab == "Verification Queue":
 elif selected_tab == "Storage Stats":
     st.header("💾 Storage Statistics")
     
-    stats = doc_manager.get_storage_stats()
+    if st.button("🔄 Refresh Statistics"):
+        load_storage_stats.clear()
+    
+    stats = load_storage_stats()
     
     col1, col2, col3 = st.columns(3)
     
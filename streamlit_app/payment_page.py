@@ -1,15 +1,18 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
 from datetime import datetime
 import sys
 import os
+import uuid
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from payment_system.gateway import PaymentGateway
 from payment_system.receipt import ReceiptGenerator
+from payment_system.receipt_queue import ReceiptQueue
+from payment_system.batch import BatchReceiptRenderer
+from payment_system.providers import SimulatedProvider
 
 st.set_page_config(page_title="Payment System", page_icon="💳", layout="wide")
 
@@ -19,9 +22,45 @@ DB_NAME = "canconnect"
 DB_USER = "postgres"
 DB_PASS = "password"
 
+
+@st.cache_resource
+def get_payment_services():
+    """Build the gateway, receipt queue and generator once per server process"""
+    receipt_gen = ReceiptGenerator(output_dir="receipts")
+    receipt_queue = ReceiptQueue(DB_HOST, DB_NAME, DB_USER, DB_PASS)
+    gateway = PaymentGateway(DB_HOST, DB_NAME, DB_USER, DB_PASS,
+                             provider=SimulatedProvider(), receipt_queue=receipt_queue)
+    return receipt_gen, receipt_queue, gateway
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def search_requests(query, limit=20):
+    """Top open requests matching the search box (cached briefly across reruns)"""
+    return get_payment_services()[2].search_payable_requests(query, limit)
+
+
 # Initialize payment gateway
-gateway = PaymentGateway(DB_HOST, DB_NAME, DB_USER, DB_PASS)
-receipt_gen = ReceiptGenerator(output_dir="receipts")
+receipt_gen, receipt_queue, gateway = get_payment_services()
+
+
+def show_receipt_status(transaction_id):
+    """Show a queued receipt's status, with a download button once rendered"""
+    job = receipt_queue.get_job(transaction_id)
+    if not job:
+        st.info("No receipt has been requested for this transaction")
+    elif job['status'] == 'done' and job['filepath'] and os.path.exists(job['filepath']):
+        with open(job['filepath'], 'rb') as f:
+            st.download_button(
+                label="Download Receipt (PDF)",
+                data=f.read(),
+                file_name=os.path.basename(job['filepath']),
+                mime="application/pdf",
+                key=f"receipt_{transaction_id}"
+            )
+    elif job['status'] == 'failed':
+        st.error(f"Receipt generation failed: {job['error']}")
+    else:
+        st.info("📄 Receipt is being prepared. Check back in a moment using Verify Payment.")
 
 st.title("💳 Payment System")
 st.markdown("Mock payment gateway for CanConnect services")
@@ -38,48 +77,45 @@ with tab1:
     with col1:
         st.subheader("Request Details")
         
-        # Get pending requests
+        # Server-side search: only the top matches are fetched, however many requests are open
+        search_query = st.text_input("Search requests", placeholder="Reference number or citizen name")
+        request_id = None
+        request_data = None
+        
         try:
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, citizen_name, service_type, status, submitted_at 
-                FROM service_requests 
-                WHERE status != 'Completed'
-                ORDER BY submitted_at DESC
-            """)
-            requests = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            requests = search_requests(search_query)
             
             if requests:
-                request_options = {f"REQ-{r[0]:03d}: {r[2]} ({r[1]})": r for r in requests}
+                request_options = {
+                    f"{r['reference_number']}: {r['service_type']} ({r['citizen_name']})": r
+                    for r in requests
+                }
                 selected_request = st.selectbox("Select Request", options=request_options.keys())
                 
                 if selected_request:
                     request_data = request_options[selected_request]
-                    request_id = request_data[0]
+                    request_id = request_data['request_id']
                     
                     st.info(f"""
-                    **Citizen:** {request_data[1]}
-                    **Service:** {request_data[2]}
-                    **Status:** {request_data[3]}
-                    **Submitted:** {request_data[4]}
+                    **Citizen:** {request_data['citizen_name']}
+                    **Service:** {request_data['service_type']}
+                    **Fee:** ₱{float(request_data['fee']):,.2f}
+                    **Status:** {request_data['status']}
+                    **Submitted:** {request_data['submitted_at']}
                     """)
+                if len(requests) == 20:
+                    st.caption("Showing the 20 most recent matches; refine the search to narrow them down.")
             else:
-                st.warning("No pending requests available")
-                request_id = None
-                request_data = None
+                st.warning("No open requests match the search" if search_query else "No pending requests available")
         
         except Exception as e:
             st.error(f"Database error: {str(e)}")
-            request_id = None
     
     with col2:
         st.subheader("Payment Details")
         
         if request_id:
-            amount = st.number_input("Amount (₱)", min_value=50, value=100, step=10)
+            amount = st.number_input("Amount (₱)", min_value=50, value=max(int(request_data['fee']), 50), step=10)
             payment_method = st.selectbox("Payment Method", ["Cash", "Check", "Bank Transfer", "Online"])
             
             st.divider()
@@ -87,103 +123,137 @@ with tab1:
             # Show payment simulation options
             st.markdown("### Simulation Options")
             success_rate = st.slider("Success Rate (%)", 0, 100, 90, help="Probability of payment success")
+            latency = st.slider("Provider Latency (s)", 0.0, 10.0, (0.5, 2.0), step=0.5,
+                                help="Delay before the provider's webhook arrives")
+            
+            # One idempotency key per payment form, so double-clicks and reruns
+            # replay the first result instead of charging again
+            form_signature = (request_id, amount, payment_method)
+            if st.session_state.get('payment_form') != form_signature:
+                st.session_state.payment_form = form_signature
+                st.session_state.payment_idempotency_key = uuid.uuid4().hex
+                st.session_state.pop('pending_transaction', None)
             
             if st.button("Process Payment", use_container_width=True, type="primary"):
-                # Process payment
+                # Submit payment; the outcome arrives asynchronously via webhook
                 payment_result = gateway.process_payment(
                     request_id=request_id,
                     amount=amount,
                     payment_method=payment_method.lower(),
-                    citizen_name=request_data[1],
-                    email="citizen@canconnect.gov.ph"  # Default email
+                    citizen_name=request_data['citizen_name'],
+                    email=request_data['email'],
+                    idempotency_key=st.session_state.payment_idempotency_key,
+                    provider_options={
+                        "failure_rate": 1 - success_rate / 100,
+                        "latency_seconds": latency
+                    }
                 )
                 
-                col1_result, col2_result = st.columns(2)
+                if payment_result['success']:
+                    if payment_result.get('replayed'):
+                        st.info("This payment was already submitted; showing the original result.")
+                    st.session_state.pending_transaction = payment_result['transaction_id']
+                    search_requests.clear()
+                else:
+                    if not payment_result.get('replayed'):
+                        st.session_state.payment_idempotency_key = uuid.uuid4().hex
+                    st.error("❌ Payment Processing Failed")
+                    st.error(payment_result['message'])
+            
+            pending_transaction = st.session_state.get('pending_transaction')
+            if pending_transaction:
+                st.divider()
+                verification = gateway.verify_payment(pending_transaction)
+                status = verification.get('status')
                 
-                with col1_result:
-                    if payment_result['success']:
-                        st.success("✅ Payment Processed Successfully!")
-                        st.json({
-                            "Transaction ID": payment_result['transaction_id'],
-                            "Amount": f"₱{payment_result['amount']}",
-                            "Method": payment_result['method'],
-                            "Status": payment_result['status'],
-                            "Timestamp": payment_result['timestamp']
-                        })
-                        
-                        # Generate receipt
-                        receipt_result = receipt_gen.generate_receipt(
-                            payment_data=payment_result,
-                            citizen_info={
-                                'name': request_data[1],
-                                'email': 'citizen@canconnect.gov.ph',
-                                'phone': '09XX-XXXX-XXX'
-                            },
-                            service_info={
-                                'request_id': f"REQ-{request_id:03d}",
-                                'service_type': request_data[2],
-                                'description': f"Payment for {request_data[2]}"
-                            }
-                        )
-                        
-                        if receipt_result['success']:
-                            st.success(f"📄 {receipt_result['message']}")
-                            
-                            # Provide download button
-                            with open(receipt_result['filepath'], 'rb') as f:
-                                st.download_button(
-                                    label="Download Receipt (PDF)",
-                                    data=f.read(),
-                                    file_name=receipt_result['filename'],
-                                    mime="application/pdf"
-                                )
-                    else:
-                        st.error("❌ Payment Processing Failed")
-                        st.error(payment_result['message'])
+                if status == 'Completed':
+                    st.success("✅ Payment Processed Successfully!")
+                    show_receipt_status(pending_transaction)
+                elif status == 'Failed':
+                    st.error("❌ Payment was declined by the provider. Please try again.")
+                    # A declined attempt may be retried deliberately with a fresh key
+                    st.session_state.payment_idempotency_key = uuid.uuid4().hex
+                else:
+                    st.info(f"⏳ Payment {pending_transaction} submitted. Awaiting provider confirmation...")
                 
-                with col2_result:
-                    st.info(f"**Simulated Success Rate:** {success_rate}%")
+                if verification.get('found'):
+                    st.json({
+                        "Transaction ID": verification['transaction_id'],
+                        "Amount": f"₱{verification['amount']}",
+                        "Status": status,
+                        "Paid At": str(verification['paid_at'])
+                    })
+                st.button("🔄 Refresh Status", key="refresh_payment_status")
+                st.caption(f"Simulated success rate: {success_rate}%")
 
 # Tab 2: Payment History
 with tab2:
     st.header("Payment History")
     
-    col1, col2 = st.columns([3, 1])
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        search_citizen = st.text_input("Search by citizen name (optional)")
+        history_user = st.number_input("User ID (0 = all)", min_value=0, value=0)
     
     with col2:
-        limit = st.number_input("Show last N records", 5, 100, 10)
+        history_status = st.selectbox("Status", ["All", "Completed", "Failed", "Pending"])
+    
+    with col3:
+        history_method = st.selectbox("Method", ["All", "Cash", "Check", "Bank Transfer", "Online"])
+    
+    with col4:
+        limit = st.number_input("Records per page", 5, 100, 10)
+    
+    # Keyset pagination: keep the cursor of every page visited so "Previous" works
+    history_filters = (history_user, history_status, history_method, limit)
+    if st.session_state.get('history_filters') != history_filters:
+        st.session_state.history_filters = history_filters
+        st.session_state.history_cursors = [None]
     
     try:
-        history = gateway.get_payment_history(citizen_name=search_citizen if search_citizen else None, limit=limit)
+        history = gateway.get_payment_history(
+            user_id=history_user or None,
+            status=None if history_status == "All" else history_status,
+            payment_method=None if history_method == "All" else history_method.lower(),
+            limit=limit,
+            cursor=st.session_state.history_cursors[-1]
+        )
         
-        if history:
-            df_history = pd.DataFrame(history, columns=[
-                'ID', 'Request ID', 'Amount', 'Method', 'Transaction ID', 
-                'Status', 'Paid At', 'Created At', 'Updated At', 'Service Type', 'Citizen'
-            ])
+        if history['payments']:
+            df_history = pd.DataFrame(history['payments'])
             
             # Format columns
-            df_display = df_history[['Transaction ID', 'Citizen', 'Service Type', 'Amount', 'Method', 'Status', 'Paid At']].copy()
+            df_display = df_history[['transaction_id', 'citizen_name', 'service_type', 'amount', 'method', 'status', 'paid_at']].copy()
+            df_display.columns = ['Transaction ID', 'Citizen', 'Service Type', 'Amount', 'Method', 'Status', 'Paid At']
             df_display['Amount'] = df_display['Amount'].apply(lambda x: f"₱{x:.2f}")
             
             st.dataframe(df_display, use_container_width=True, hide_index=True)
             
-            # Summary statistics
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if len(st.session_state.history_cursors) > 1 and st.button("← Previous"):
+                    st.session_state.history_cursors.pop()
+                    st.rerun()
+            with col_page:
+                st.caption(f"Page {len(st.session_state.history_cursors)}")
+            with col_next:
+                if history['next_cursor'] and st.button("Next →"):
+                    st.session_state.history_cursors.append(history['next_cursor'])
+                    st.rerun()
+            
+            # Summary statistics for this page
             col1, col2, col3, col4 = st.columns(4)
             with col1:
                 total = len(df_history)
-                st.metric("Total Payments", total)
+                st.metric("Payments on Page", total)
             with col2:
-                successful = len(df_history[df_history['Status'] == 'Completed'])
+                successful = len(df_history[df_history['status'] == 'Completed'])
                 st.metric("Completed", successful)
             with col3:
-                failed = len(df_history[df_history['Status'] == 'Failed'])
+                failed = len(df_history[df_history['status'] == 'Failed'])
                 st.metric("Failed", failed)
             with col4:
-                total_amount = df_history['Amount'].sum()
+                total_amount = df_history['amount'].sum()
                 st.metric("Total Amount", f"₱{total_amount:,.2f}")
         else:
             st.info("No payment records found")
@@ -195,31 +265,53 @@ with tab2:
 with tab3:
     st.header("Verify Payment Status")
     
-    transaction_id = st.text_input("Enter Transaction ID", placeholder="CC20231201120530ABC123")
+    transaction_id = st.text_input("Enter Transaction ID or scanned receipt code",
+                                   placeholder="CC01HGW2N7Q8V5ZT3K9M4XRB6P2D")
     
     if st.button("Verify Payment", use_container_width=True):
-        verification = gateway.verify_payment(transaction_id)
-        
-        if verification.get('found'):
-            st.success("✅ Payment Found")
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Transaction ID", verification['transaction_id'])
-            with col2:
-                st.metric("Amount", f"₱{verification['amount']:.2f}")
-            with col3:
-                status = verification['status']
-                if status == 'Completed':
-                    st.metric("Status", "✅ " + status)
-                elif status == 'Failed':
-                    st.metric("Status", "❌ " + status)
+        if transaction_id.startswith("CCR1|"):
+            # Scanned QR code: the signature check needs no database round trip
+            if receipt_gen.signer is None:
+                st.error("Receipt verification key is not configured (RECEIPT_VERIFY_KEY_PATH)")
+            else:
+                code_check = receipt_gen.signer.verify(transaction_id)
+                if code_check['valid']:
+                    st.success("✅ Genuine receipt")
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Transaction ID", code_check['transaction_id'])
+                    with col2:
+                        st.metric("Amount", f"₱{code_check['amount']:.2f}")
+                    with col3:
+                        st.metric("Paid At", code_check['paid_at'])
+                    st.caption(f"Reference #: {code_check['reference_number']}")
                 else:
-                    st.metric("Status", "⏳ " + status)
-            with col4:
-                st.metric("Paid At", verification['paid_at'])
+                    st.error(f"❌ {code_check['message']}")
         else:
-            st.warning("⚠️ Transaction not found")
+            verification = gateway.verify_payment(transaction_id)
+            
+            if verification.get('found'):
+                st.success("✅ Payment Found")
+                col1, col2, col3, col4 = st.columns(4)
+                
+                with col1:
+                    st.metric("Transaction ID", verification['transaction_id'])
+                with col2:
+                    st.metric("Amount", f"₱{verification['amount']:.2f}")
+                with col3:
+                    status = verification['status']
+                    if status == 'Completed':
+                        st.metric("Status", "✅ " + status)
+                    elif status == 'Failed':
+                        st.metric("Status", "❌ " + status)
+                    else:
+                        st.metric("Status", "⏳ " + status)
+                with col4:
+                    st.metric("Paid At", verification['paid_at'])
+                
+                show_receipt_status(verification['transaction_id'])
+            else:
+                st.warning("⚠️ Transaction not found")
 
 # Tab 4: Statistics
 with tab4:
@@ -250,13 +342,79 @@ with tab4:
     st.subheader("Payment Status Distribution")
     st.bar_chart(df_status.set_index('Status'), use_container_width=True)
     
+    st.subheader("Daily Revenue (last 30 days)")
+    daily_revenue = gateway.get_daily_revenue(days=30)
+    if daily_revenue:
+        df_revenue = pd.DataFrame(daily_revenue).set_index('day')
+        df_revenue['revenue'] = df_revenue['revenue'].astype(float)
+        st.line_chart(df_revenue[['revenue']], use_container_width=True)
+    else:
+        st.info("No payments in the last 30 days")
+    
+    st.divider()
+    
+    st.markdown("### Cashier's Daily Report")
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        report_date = st.date_input("Collection date", value=datetime.now().date())
+    with col2:
+        include_receipts = st.checkbox("Include day's receipts (single PDF)", value=False)
+    
+    if st.button("Generate Daily Report", use_container_width=True):
+        batch_renderer = BatchReceiptRenderer(gateway)
+        with st.spinner("Rendering report..."):
+            report_result = batch_renderer.collection_report(report_date)
+            report = report_result['report']
+            
+            st.metric("Total Collected", f"₱{float(report['total_amount']):,.2f}", f"{report['total_count']} transactions")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.dataframe(pd.DataFrame(report['by_method']), use_container_width=True, hide_index=True)
+            with col2:
+                st.dataframe(pd.DataFrame(report['by_service']), use_container_width=True, hide_index=True)
+            
+            with open(report_result['filepath'], 'rb') as f:
+                st.download_button("Download Collection Report (PDF)", data=f.read(),
+                                   file_name=report_result['filename'], mime="application/pdf")
+            
+            if include_receipts:
+                receipts_result = batch_renderer.render_day(report_date)
+                st.caption(receipts_result['message'])
+                for path in receipts_result['files']:
+                    with open(path, 'rb') as f:
+                        st.download_button(f"Download {os.path.basename(path)}", data=f.read(),
+                                           file_name=os.path.basename(path), mime="application/pdf")
+    
     st.divider()
     
     st.markdown("### Generated Receipts")
-    receipts = receipt_gen.list_receipts()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        receipt_request = st.text_input("Filter by request ID", key="receipt_request_filter")
+    with col2:
+        receipt_date = st.date_input("Filter by date", value=None, key="receipt_date_filter")
+    with col3:
+        page_size = st.selectbox("Per page", [25, 50, 100], key="receipt_page_size")
+    
+    receipt_filters = {
+        "request_id": receipt_request or None,
+        "date_from": receipt_date,
+        "date_to": receipt_date
+    }
+    total_receipts = receipt_gen.count_receipts(**receipt_filters)
+    total_pages = max(1, (total_receipts + page_size - 1) // page_size)
+    page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, key="receipt_page")
+    
+    receipts = receipt_gen.list_receipts(limit=page_size, offset=(page - 1) * page_size, **receipt_filters)
     if receipts:
-        for receipt in receipts:
-            st.write(f"📄 {receipt}")
+        st.caption(f"{total_receipts} receipt(s) — page {page} of {total_pages}")
+        st.dataframe(
+            pd.DataFrame(receipts)[['transaction_id', 'request_id', 'receipt_date', 'filename']],
+            use_container_width=True,
+            hide_index=True
+        )
     else:
         st.info("No receipts generated yet")
 
@@ -6,10 +6,28 @@ e-government services platform.
 
 Components:
 - gateway.py: Mock payment gateway and processing
+- async_gateway.py: asyncio variant of the gateway on psycopg 3 (import directly; needs psycopg)
+- providers.py: Payment provider adapters (simulated provider with webhooks)
 - receipt.py: PDF receipt generation
+- receipt_signing.py: Signed receipt QR payloads and offline verification
+- receipt_index.py: SQLite index over date-sharded receipt files
+- receipt_queue.py: Durable queue and worker pool for asynchronous receipts
+- batch.py: Bulk receipt rendering and daily collection reports
+- reconciliation.py: Settlement file reconciliation against payments
+- ledger.py: Append-only payment event ledger with daily balance snapshots
+- ids.py: Time-ordered transaction ID generator
+- cache.py: In-memory TTL cache used for idempotent replays
 """
 
 from .gateway import PaymentGateway
+from .providers import PaymentProvider, SimulatedProvider
 from .receipt import ReceiptGenerator
+from .receipt_signing import ReceiptSigner
+from .receipt_queue import ReceiptQueue, ReceiptWorker
+from .batch import BatchReceiptRenderer
+from .reconciliation import SettlementReconciler
+from .ledger import PaymentLedger
 
-__all__ = ['PaymentGateway', 'ReceiptGenerator']
+__all__ = ['PaymentGateway', 'PaymentProvider', 'SimulatedProvider', 'ReceiptGenerator', 'ReceiptSigner',
+           'ReceiptQueue', 'ReceiptWorker', 'BatchReceiptRenderer', 'SettlementReconciler',
+           'PaymentLedger']
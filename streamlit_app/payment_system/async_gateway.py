@@ -0,0 +1,422 @@
+from psycopg.types.json import Json
+from datetime import datetime, timedelta
+import asyncio
+
+from .gateway import RECEIPT_DETAILS_QUERY, PaymentGateway
+from .receipt_queue import INSERT_JOB
+
+# One ledger row per execute; executemany pipelines them in a single round trip
+LEDGER_INSERT = """
+    INSERT INTO payment_ledger
+    (transaction_id, request_id, service_id, event_type, amount, payment_method,
+     provider_reference, remarks)
+    SELECT v.transaction_id, v.request_id, sr.service_id, v.event_type, v.amount,
+           v.payment_method, v.provider_reference, v.remarks
+    FROM (VALUES (%s, %s::int, %s, %s::numeric, %s, %s, %s))
+         AS v (transaction_id, request_id, event_type, amount, payment_method,
+               provider_reference, remarks)
+    LEFT JOIN service_requests sr ON sr.id = v.request_id
+"""
+
+class AsyncPaymentGateway(PaymentGateway):
+    """PaymentGateway for asyncio servers, backed by a psycopg 3 AsyncConnectionPool
+
+    The request-path methods (process_payment, handle_webhook, refund_payment,
+    verify_payment, get_payment_history, get_request_owner, get_service_request)
+    are coroutines with the same results as PaymentGateway. Reporting and
+    maintenance methods (ledger balances, stats, purges) are inherited
+    unchanged and run on the synchronous connection settings; call them via
+    asyncio.to_thread.
+    """
+
+    def __init__(self, pool, db_host, db_name, db_user, db_pass, **kwargs):
+        super().__init__(db_host, db_name, db_user, db_pass, **kwargs)
+        self.pool = pool
+
+    async def _append_ledger(self, cursor, events):
+        await cursor.executemany(LEDGER_INSERT, self.ledger.event_rows(events))
+
+    async def process_payment(self, request_id, amount, payment_method, citizen_name, email,
+                              idempotency_key=None, provider_options=None, user_id=None):
+        """Submit a payment to the provider (see PaymentGateway.process_payment)"""
+        fingerprint = self._request_fingerprint(request_id, amount, payment_method)
+        key = self._scoped_idempotency_key(idempotency_key, user_id)
+
+        if key:
+            cached = self._idempotency_cache.get(key)
+            if cached is not None:
+                return self._replay(cached, fingerprint)
+
+        async with self.pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    if key:
+                        # Held until commit/rollback, so a concurrent duplicate waits here
+                        await cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (key,))
+                        await cursor.execute(
+                            """
+                            SELECT request_fingerprint, response
+                            FROM payment_idempotency_keys
+                            WHERE idempotency_key = %s
+                            """,
+                            (key,)
+                        )
+                        existing = await cursor.fetchone()
+                        if existing:
+                            await conn.commit()
+                            stored = {"fingerprint": existing[0], "response": existing[1]}
+                            self._idempotency_cache.set(key, stored)
+                            return self._replay(stored, fingerprint)
+
+                    transaction_id = self._generate_transaction_id()
+
+                    # Record the attempt as pending; completed and in-flight payments are never overwritten
+                    await cursor.execute(
+                        """
+                        INSERT INTO payments
+                        (request_id, amount, payment_method, transaction_id, status, paid_at)
+                        VALUES (%s, %s, %s, %s, 'Pending', NOW())
+                        ON CONFLICT (request_id) DO UPDATE
+                        SET amount = EXCLUDED.amount, payment_method = EXCLUDED.payment_method,
+                            status = 'Pending', transaction_id = EXCLUDED.transaction_id,
+                            paid_at = NOW(), updated_at = NOW()
+                        WHERE payments.status NOT IN ('Completed', 'Pending')
+                        RETURNING id
+                        """,
+                        (request_id, amount, payment_method, transaction_id)
+                    )
+                    if await cursor.fetchone() is None:
+                        await cursor.execute(
+                            "SELECT status, transaction_id FROM payments WHERE request_id = %s",
+                            (request_id,)
+                        )
+                        existing = await cursor.fetchone()
+                        await conn.rollback()
+                        return self._payment_exists(request_id, *existing)
+
+                    await self._append_ledger(cursor, [{
+                        "transaction_id": transaction_id,
+                        "request_id": request_id,
+                        "event_type": "attempted",
+                        "amount": amount,
+                        "payment_method": payment_method
+                    }])
+
+                    result = {
+                        "success": True,
+                        "transaction_id": transaction_id,
+                        "request_id": request_id,
+                        "status": "Pending",
+                        "amount": amount,
+                        "method": payment_method,
+                        "timestamp": datetime.now().isoformat(),
+                        "message": "Payment submitted. Awaiting confirmation from the payment provider."
+                    }
+
+                    if key:
+                        await cursor.execute(
+                            """
+                            INSERT INTO payment_idempotency_keys
+                            (idempotency_key, request_id, request_fingerprint, response)
+                            VALUES (%s, %s, %s, %s)
+                            """,
+                            (key, request_id, fingerprint, Json(result))
+                        )
+
+                await conn.commit()
+
+            except Exception as e:
+                await conn.rollback()
+                return {
+                    "success": False,
+                    "status": "Error",
+                    "message": f"Database error: {str(e)}"
+                }
+
+        if key:
+            self._idempotency_cache.set(key, {"fingerprint": fingerprint, "response": result})
+
+        # Providers report back from their own threads; route the outcome onto this loop
+        loop = asyncio.get_running_loop()
+        try:
+            self.provider.submit(
+                transaction_id, amount, payment_method,
+                callback=lambda event: asyncio.run_coroutine_threadsafe(self.handle_webhook(event), loop),
+                **(provider_options or {})
+            )
+        except Exception as e:
+            # The pending row is already committed; fail it and replay the failure for this key
+            await self.handle_webhook(self._submission_failure_event(transaction_id, e))
+            failed = self._submission_failed_result(result)
+            if key:
+                await self._store_idempotent_response(key, fingerprint, failed)
+            return failed
+
+        return result
+
+    async def _store_idempotent_response(self, key, fingerprint, response):
+        self._idempotency_cache.set(key, {"fingerprint": fingerprint, "response": response})
+        async with self.pool.connection() as conn:
+            try:
+                await conn.execute(
+                    "UPDATE payment_idempotency_keys SET response = %s WHERE idempotency_key = %s",
+                    (Json(response), key)
+                )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+
+    async def handle_webhook(self, event):
+        """Apply a provider outcome to a pending payment (idempotent)"""
+        status = event.get('status')
+        if status not in ('Completed', 'Failed'):
+            return {"success": False, "message": f"Unsupported payment status: {status}"}
+
+        async with self.pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        """
+                        UPDATE payments
+                        SET status = %s, paid_at = NOW(), updated_at = NOW()
+                        WHERE transaction_id = %s AND status = 'Pending'
+                        RETURNING id, request_id, amount, payment_method, paid_at
+                        """,
+                        (status, event['transaction_id'])
+                    )
+                    payment = await cursor.fetchone()
+                    if payment is None:
+                        await conn.rollback()
+                        return {"success": True, "applied": False, "message": "Payment already settled or unknown"}
+
+                    payment_id, request_id, amount, payment_method, paid_at = payment
+
+                    await cursor.execute(
+                        """
+                        INSERT INTO payment_history (payment_id, old_status, new_status, changed_by, remarks)
+                        VALUES (%s, 'Pending', %s, %s, %s)
+                        """,
+                        (payment_id, status, event.get('provider', 'provider'),
+                         event.get('failure_reason') or event.get('provider_reference'))
+                    )
+
+                    await self._append_ledger(cursor, [{
+                        "transaction_id": event['transaction_id'],
+                        "request_id": request_id,
+                        "event_type": status.lower(),
+                        "amount": amount,
+                        "payment_method": payment_method,
+                        "provider_reference": event.get('provider_reference'),
+                        "remarks": event.get('failure_reason')
+                    }])
+
+                    if status == 'Completed':
+                        await cursor.execute(
+                            "UPDATE service_requests SET status = 'For Payment Verification' WHERE id = %s",
+                            (request_id,)
+                        )
+                        if self.receipt_queue:
+                            await self._queue_receipt(
+                                cursor, event['transaction_id'], request_id, amount, payment_method, paid_at
+                            )
+
+                    await cursor.execute(
+                        "SELECT pg_notify(%s, %s)",
+                        (self.STATUS_CHANNEL, f"{event['transaction_id']}:{status}")
+                    )
+
+                await conn.commit()
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": f"Database error: {str(e)}"}
+
+        self._stats_cache.clear()
+
+        return {"success": True, "applied": True, "transaction_id": event['transaction_id'], "status": status}
+
+    async def refund_payment(self, transaction_id, reason=None, refunded_by='System'):
+        """Refund a completed payment, recording the refund in the ledger"""
+        async with self.pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        """
+                        UPDATE payments
+                        SET status = 'Refunded', updated_at = NOW()
+                        WHERE transaction_id = %s AND status = 'Completed'
+                        RETURNING id, request_id, amount, payment_method
+                        """,
+                        (transaction_id,)
+                    )
+                    payment = await cursor.fetchone()
+                    if payment is None:
+                        await conn.rollback()
+                        return {"success": False, "message": "Only completed payments can be refunded"}
+
+                    payment_id, request_id, amount, payment_method = payment
+
+                    await cursor.execute(
+                        """
+                        INSERT INTO payment_history (payment_id, old_status, new_status, changed_by, remarks)
+                        VALUES (%s, 'Completed', 'Refunded', %s, %s)
+                        """,
+                        (payment_id, refunded_by, reason)
+                    )
+
+                    await self._append_ledger(cursor, [{
+                        "transaction_id": transaction_id,
+                        "request_id": request_id,
+                        "event_type": "refunded",
+                        "amount": amount,
+                        "payment_method": payment_method,
+                        "remarks": reason
+                    }])
+
+                    await cursor.execute(
+                        "SELECT pg_notify(%s, %s)",
+                        (self.STATUS_CHANNEL, f"{transaction_id}:Refunded")
+                    )
+
+                await conn.commit()
+                self._stats_cache.clear()
+
+                return {
+                    "success": True,
+                    "transaction_id": transaction_id,
+                    "status": "Refunded",
+                    "amount": amount,
+                    "message": "Payment refunded"
+                }
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": f"Database error: {str(e)}"}
+
+    async def _queue_receipt(self, cursor, transaction_id, request_id, amount, payment_method, paid_at):
+        """Queue the receipt for a completed payment in the caller's transaction"""
+        await cursor.execute(RECEIPT_DETAILS_QUERY, (request_id,))
+        row = await cursor.fetchone()
+        payment_data, citizen_info, service_info = self._receipt_details(
+            transaction_id, request_id, amount, payment_method, paid_at, row
+        )
+        await cursor.execute(
+            INSERT_JOB,
+            (transaction_id, Json(self.receipt_queue.payload(payment_data, citizen_info, service_info)))
+        )
+        await cursor.execute("SELECT pg_notify(%s, %s)", (self.receipt_queue.CHANNEL, transaction_id))
+
+    async def get_request_owner(self, request_id):
+        """Get the user ID that owns a service request"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute("SELECT user_id FROM service_requests WHERE id = %s", (request_id,))
+            result = await cursor.fetchone()
+            return result[0] if result else None
+
+    async def get_service_request(self, request_id, fields=None):
+        """Get a service request with its citizen and service (only the given fields when set)"""
+        query, names = self._service_request_query(fields)
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(query, (request_id,))
+            row = await cursor.fetchone()
+            return dict(zip(names, row)) if row else None
+
+    async def verify_payment(self, transaction_id):
+        """Verify payment status"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                """
+                SELECT transaction_id, request_id, amount, payment_method, status, paid_at, created_at
+                FROM payments
+                WHERE transaction_id = %s
+                """,
+                (transaction_id,)
+            )
+            payment = await cursor.fetchone()
+
+            if payment:
+                return {
+                    "found": True,
+                    "transaction_id": payment[0],
+                    "request_id": payment[1],
+                    "amount": payment[2],
+                    "method": payment[3],
+                    "status": payment[4],
+                    "paid_at": payment[5],
+                    "created_at": payment[6]
+                }
+            return {"found": False, "message": "Transaction not found"}
+
+    async def get_payment_history(self, user_id=None, request_id=None, status=None, payment_method=None,
+                                  date_from=None, date_to=None, limit=20, cursor=None):
+        """Get payment history, newest first, with keyset pagination"""
+        conditions = []
+        params = []
+
+        if user_id is not None:
+            conditions.append("sr.user_id = %s")
+            params.append(user_id)
+        if request_id is not None:
+            conditions.append("p.request_id = %s")
+            params.append(request_id)
+        if status:
+            conditions.append("p.status = %s")
+            params.append(status)
+        if payment_method:
+            conditions.append("p.payment_method = %s")
+            params.append(payment_method)
+        if date_from:
+            conditions.append("p.paid_at >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("p.paid_at < %s")
+            params.append(date_to + timedelta(days=1))
+        if cursor:
+            cursor_paid_at, cursor_id = self._decode_history_cursor(cursor)
+            conditions.append("(p.paid_at, p.id) < (%s, %s)")
+            params.extend([cursor_paid_at, cursor_id])
+
+        conditions.append("p.paid_at IS NOT NULL")
+        where = " AND ".join(conditions)
+
+        async with self.pool.connection() as conn:
+            # Fetch one extra row to know whether another page exists
+            db_cursor = await conn.execute(
+                f"""
+                SELECT p.id, p.transaction_id, p.request_id, sr.reference_number, sr.user_id,
+                       u.full_name, s.name, p.amount, p.payment_method, p.status, p.paid_at
+                FROM payments p
+                JOIN service_requests sr ON p.request_id = sr.id
+                JOIN users u ON sr.user_id = u.id
+                JOIN services s ON sr.service_id = s.id
+                WHERE {where}
+                ORDER BY p.paid_at DESC, p.id DESC
+                LIMIT %s
+                """,
+                params + [limit + 1]
+            )
+            rows = await db_cursor.fetchall()
+
+        payments = [
+            {
+                "id": row[0],
+                "transaction_id": row[1],
+                "request_id": row[2],
+                "reference_number": row[3],
+                "user_id": row[4],
+                "citizen_name": row[5],
+                "service_type": row[6],
+                "amount": row[7],
+                "method": row[8],
+                "status": row[9],
+                "paid_at": row[10]
+            }
+            for row in rows[:limit]
+        ]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = payments[-1]
+            next_cursor = f"{last['paid_at'].isoformat()}|{last['id']}"
+
+        return {"payments": payments, "next_cursor": next_cursor}
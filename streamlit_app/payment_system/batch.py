@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import argparse
+import os
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # volumes are returned unmerged
+    PdfWriter = None
+
+from .receipt import ReceiptGenerator
+
+# One generator (and therefore one set of styles) per pool process
+_worker_generator = None
+
+
+def _init_worker(receipts_dir):
+    """Pool initializer: build the shared ReceiptGenerator once per process"""
+    global _worker_generator
+    _worker_generator = ReceiptGenerator(output_dir=receipts_dir)
+
+
+def _render_files(receipts):
+    """Render a chunk of receipts as individual, indexed files"""
+    return [
+        _worker_generator.generate_receipt(*receipt)['filepath']
+        for receipt in receipts
+    ]
+
+
+def _render_volume(args):
+    """Render a chunk of receipts as one multi-page volume"""
+    filename, receipts, output_dir = args
+    return _worker_generator.generate_combined(receipts, filename, output_dir=output_dir)['filepath']
+
+
+def merge_volumes(paths, filepath):
+    """Concatenate volume PDFs into filepath and delete the volumes"""
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(filepath, "wb") as f:
+        writer.write(f)
+    writer.close()
+    for path in paths:
+        os.remove(path)
+    return filepath
+
+
+def receipt_args(payment):
+    """Convert a PaymentGateway.get_payments_for_day row into generate_receipt arguments"""
+    paid_at = payment['paid_at']
+    return (
+        {
+            "transaction_id": payment['transaction_id'],
+            "request_id": payment['request_id'],
+            "amount": float(payment['amount']),
+            "method": payment['method'],
+            "status": payment['status'],
+            "timestamp": paid_at.isoformat() if isinstance(paid_at, datetime) else paid_at
+        },
+        {
+            "name": payment['citizen_name'] or 'N/A',
+            "email": payment['email'] or 'N/A',
+            "phone": payment['phone'] or 'N/A'
+        },
+        {
+            "request_id": payment['reference_number'],
+            "service_type": payment['service_name'],
+            "description": f"Payment for {payment['service_name']}"
+        }
+    )
+
+
+class BatchReceiptRenderer:
+    """Render a day's receipts and the cashier's collection report in bulk
+
+    Individual receipts are written to receipts_dir (date-sharded and
+    recorded in its receipt index, like receipts generated one at a time);
+    combined volumes and collection reports go to output_dir.
+    """
+
+    def __init__(self, gateway, output_dir="receipts/batches", receipts_dir="receipts",
+                 workers=None, chunk_size=250, pages_per_file=100):
+        self.gateway = gateway
+        self.output_dir = output_dir
+        self.receipts_dir = receipts_dir
+        self.workers = workers or os.cpu_count() or 2
+        self.chunk_size = chunk_size
+        self.pages_per_file = pages_per_file
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _chunks(self, items, size):
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def render(self, payments, combined=True, name="receipts", pages_per_file=None):
+        """Render receipts for the given payments
+
+        combined=False writes one PDF per transaction across a process pool.
+        combined=True splits the batch into volumes of pages_per_file receipts
+        (default self.pages_per_file) rendered in parallel, then merges them
+        into one PDF when pypdf is installed.
+        """
+        receipts = [receipt_args(payment) for payment in payments]
+        if not receipts:
+            return {"success": True, "files": [], "count": 0, "message": "No payments to render"}
+
+        pages_per_file = pages_per_file or self.pages_per_file
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.receipts_dir,)) as executor:
+            if combined:
+                chunks = self._chunks(receipts, pages_per_file)
+                volumes = [
+                    (f"{name}.pdf" if len(chunks) == 1 else f"{name}_part{index + 1:03d}.pdf", chunk, self.output_dir)
+                    for index, chunk in enumerate(chunks)
+                ]
+                files = list(executor.map(_render_volume, volumes))
+            else:
+                files = [
+                    path
+                    for chunk_paths in executor.map(_render_files, self._chunks(receipts, self.chunk_size))
+                    for path in chunk_paths
+                ]
+
+        if combined and len(files) > 1 and PdfWriter is not None:
+            files = [merge_volumes(files, os.path.join(self.output_dir, f"{name}.pdf"))]
+
+        return {
+            "success": True,
+            "files": files,
+            "count": len(receipts),
+            "message": f"Rendered {len(receipts)} receipts into {len(files)} file(s)"
+        }
+
+    def render_day(self, day, combined=True, pages_per_file=None):
+        """Render every completed payment's receipt for a given date"""
+        payments = self.gateway.get_payments_for_day(day)
+        return self.render(payments, combined=combined, name=f"receipts_{day.isoformat()}",
+                           pages_per_file=pages_per_file)
+
+    def collection_report(self, day):
+        """Build the daily collection report PDF and return it with its totals"""
+        report = self.gateway.get_daily_collection(day)
+        generator = ReceiptGenerator(output_dir=self.receipts_dir)
+        result = generator.generate_collection_report(report, output_dir=self.output_dir)
+        result["report"] = report
+        return result
+
+
+def main():
+    """Command-line entry point: python -m payment_system.batch --date YYYY-MM-DD"""
+    from .gateway import PaymentGateway
+
+    parser = argparse.ArgumentParser(description="Render a day's receipts and collection report")
+    parser.add_argument("--date", default=date.today().isoformat())
+    parser.add_argument("--output-dir", default="receipts/batches", help="Combined volumes and reports")
+    parser.add_argument("--receipts-dir", default=os.getenv("RECEIPT_OUTPUT_DIR", "receipts"),
+                        help="Receipt store and index for --separate (the app's RECEIPT_OUTPUT_DIR)")
+    parser.add_argument("--separate", action="store_true", help="One indexed PDF per receipt")
+    parser.add_argument("--pages-per-file", type=int, default=100,
+                        help="Receipts per volume rendered in parallel before merging")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    gateway = PaymentGateway(
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_NAME", "canconnect"),
+        os.getenv("DB_USER", "postgres"),
+        os.getenv("DB_PASS", "password")
+    )
+    renderer = BatchReceiptRenderer(gateway, output_dir=args.output_dir, receipts_dir=args.receipts_dir,
+                                    workers=args.workers, pages_per_file=args.pages_per_file)
+    day = date.fromisoformat(args.date)
+
+    receipts = renderer.render_day(day, combined=not args.separate, pages_per_file=args.pages_per_file)
+    print(receipts['message'])
+    report = renderer.collection_report(day)
+    print(report['message'])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,183 @@
-import psycopg2
-from datetime import datetime
-import random
-import string
+from database.pool import connect
+from database.projection import column_list, select_fields
+from psycopg2.extras import Json
+from datetime import datetime, timedelta
+import hashlib
+
+from .cache import TTLCache
+from .ids import transaction_ids
+from .ledger import PaymentLedger
+from .providers import SimulatedProvider
+
+# Service request fields selectable with fields=...; users/services are joined only when needed
+REQUEST_COLUMNS = {
+    "id": "sr.id",
+    "reference_number": "sr.reference_number",
+    "user_id": "sr.user_id",
+    "citizen_name": "u.full_name",
+    "email": "u.email",
+    "service_id": "sr.service_id",
+    "service_type": "s.name",
+    "fee": "s.fee",
+    "status": "sr.status",
+    "notes": "sr.notes",
+    "submitted_at": "sr.submitted_at",
+    "approved_at": "sr.approved_at",
+    "completed_at": "sr.completed_at",
+    "estimated_completion_date": "sr.estimated_completion_date"
+}
+
+# Payer and service details printed on a receipt
+RECEIPT_DETAILS_QUERY = """
+    SELECT sr.reference_number, u.full_name, u.email, u.phone, s.name
+    FROM service_requests sr
+    JOIN users u ON sr.user_id = u.id
+    JOIN services s ON sr.service_id = s.id
+    WHERE sr.id = %s
+"""
 
 class PaymentGateway:
     """Mock payment gateway for CanConnect system"""
     
-    def __init__(self, db_host, db_name, db_user, db_pass):
+    # LISTEN/NOTIFY channel carrying "<transaction_id>:<status>" on every settlement
+    STATUS_CHANNEL = "payment_status"
+    
+    # Methods accepted from the API (the web app offers e-wallet and cash, the counter the rest)
+    PAYMENT_METHODS = ("cash", "check", "bank transfer", "online", "e-wallet")
+    
+    def __init__(self, db_host, db_name, db_user, db_pass, idempotency_ttl_seconds=300,
+                 stats_ttl_seconds=30, provider=None, receipt_queue=None):
         self.db_host = db_host
         self.db_name = db_name
         self.db_user = db_user
         self.db_pass = db_pass
         
+        # Charges are handed to the provider; outcomes arrive via handle_webhook
+        self.provider = provider or SimulatedProvider()
+        self.receipt_queue = receipt_queue
+        
+        # Append-only event trail; written in the same transaction as payments
+        self.ledger = PaymentLedger(self)
+        
+        # Recent idempotent results, so client retries skip the database entirely
+        self._idempotency_cache = TTLCache(ttl_seconds=idempotency_ttl_seconds, maxsize=10000)
+        
+        # Dashboard aggregates; a few seconds of staleness is fine for statistics
+        self._stats_cache = TTLCache(ttl_seconds=stats_ttl_seconds, maxsize=64)
+        
     def get_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(
+        """Create database connection (pooled when database.pool is configured)"""
+        return connect(
             host=self.db_host,
             database=self.db_name,
             user=self.db_user,
             password=self.db_pass
         )
     
-    def process_payment(self, request_id, amount, payment_method, citizen_name, email):
-        """Process mock payment"""
+    def process_payment(self, request_id, amount, payment_method, citizen_name, email,
+                        idempotency_key=None, provider_options=None, user_id=None):
+        """Submit a payment to the provider
+        
+        The payment is recorded as Pending and the call returns without waiting
+        on the provider; the final Completed/Failed status is applied when the
+        provider's webhook reaches handle_webhook. If the provider refuses the
+        charge outright, the payment is marked Failed before returning.
+        
+        When an idempotency_key is given, the first result stored for that key is
+        returned for every later call with the same key instead of charging again.
+        Keys are scoped to user_id, so two users can't collide on (or replay)
+        each other's keys. Concurrent calls with the same key are serialized
+        with an advisory lock.
+        """
+        fingerprint = self._request_fingerprint(request_id, amount, payment_method)
+        key = self._scoped_idempotency_key(idempotency_key, user_id)
+        
+        if key:
+            cached = self._idempotency_cache.get(key)
+            if cached is not None:
+                return self._replay(cached, fingerprint)
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
+            if key:
+                # Held until commit/rollback, so a concurrent duplicate waits here
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (key,))
+                cursor.execute(
+                    """
+                    SELECT request_fingerprint, response
+                    FROM payment_idempotency_keys
+                    WHERE idempotency_key = %s
+                    """,
+                    (key,)
+                )
+                existing = cursor.fetchone()
+                if existing:
+                    conn.commit()
+                    stored = {"fingerprint": existing[0], "response": existing[1]}
+                    self._idempotency_cache.set(key, stored)
+                    return self._replay(stored, fingerprint)
+            
             # Generate mock transaction ID
             transaction_id = self._generate_transaction_id()
             
-            # Simulate payment processing (90% success rate)
-            import random
-            is_successful = random.random() < 0.9
-            
-            payment_status = "Completed" if is_successful else "Failed"
-            
-            # Check if payment record exists, if so update, else insert
+            # Record the attempt as pending; a completed payment, or one still with
+            # the provider (whose webhook matches on transaction_id), is never overwritten
             cursor.execute(
                 """
                 INSERT INTO payments 
                 (request_id, amount, payment_method, transaction_id, status, paid_at)
-                VALUES (%s, %s, %s, %s, %s, NOW())
+                VALUES (%s, %s, %s, %s, 'Pending', NOW())
                 ON CONFLICT (request_id) DO UPDATE 
-                SET status = %s, transaction_id = %s, paid_at = NOW()
+                SET amount = EXCLUDED.amount, payment_method = EXCLUDED.payment_method,
+                    status = 'Pending', transaction_id = EXCLUDED.transaction_id,
+                    paid_at = NOW(), updated_at = NOW()
+                WHERE payments.status NOT IN ('Completed', 'Pending')
+                RETURNING id
                 """,
-                (request_id, amount, payment_method, transaction_id, payment_status, payment_status, transaction_id)
+                (request_id, amount, payment_method, transaction_id)
             )
-            
-            # Update service request status
-            if is_successful:
+            if cursor.fetchone() is None:
                 cursor.execute(
-                    "UPDATE service_requests SET status = 'For Payment Verification' WHERE id = %s",
+                    "SELECT status, transaction_id FROM payments WHERE request_id = %s",
                     (request_id,)
                 )
+                existing = cursor.fetchone()
+                conn.rollback()
+                return self._payment_exists(request_id, *existing)
             
-            conn.commit()
+            self.ledger.append([{
+                "transaction_id": transaction_id,
+                "request_id": request_id,
+                "event_type": "attempted",
+                "amount": amount,
+                "payment_method": payment_method
+            }], cursor=cursor)
             
-            return {
-                "success": is_successful,
+            result = {
+                "success": True,
                 "transaction_id": transaction_id,
-                "status": payment_status,
+                "request_id": request_id,
+                "status": "Pending",
                 "amount": amount,
                 "method": payment_method,
                 "timestamp": datetime.now().isoformat(),
-                "message": "Payment processed successfully!" if is_successful else "Payment failed. Please try again."
+                "message": "Payment submitted. Awaiting confirmation from the payment provider."
             }
             
+            if key:
+                cursor.execute(
+                    """
+                    INSERT INTO payment_idempotency_keys
+                    (idempotency_key, request_id, request_fingerprint, response)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    (key, request_id, fingerprint, Json(result))
+                )
+            
+            conn.commit()
+            
         except Exception as e:
             conn.rollback()
             return {
@@ -77,6 +188,391 @@ class PaymentGateway:
         finally:
             cursor.close()
             conn.close()
+        
+        if key:
+            self._idempotency_cache.set(key, {"fingerprint": fingerprint, "response": result})
+        
+        # Only hand the charge over once the pending row is visible to webhooks
+        try:
+            self.provider.submit(
+                transaction_id, amount, payment_method,
+                callback=self.handle_webhook,
+                **(provider_options or {})
+            )
+        except Exception as e:
+            # The pending row is already committed; fail it rather than leave it
+            # Pending, and make retries of this key replay the failure
+            self.handle_webhook(self._submission_failure_event(transaction_id, e))
+            failed = self._submission_failed_result(result)
+            if key:
+                self._store_idempotent_response(key, fingerprint, failed)
+            return failed
+        
+        return result
+    
+    def handle_webhook(self, event):
+        """Apply a provider outcome to a pending payment
+        
+        Safe to call more than once for the same event: only a Pending payment
+        with the event's transaction ID is moved to its final status. A
+        completion's receipt job is queued in the same transaction.
+        """
+        status = event.get('status')
+        if status not in ('Completed', 'Failed'):
+            return {"success": False, "message": f"Unsupported payment status: {status}"}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                """
+                UPDATE payments
+                SET status = %s, paid_at = NOW(), updated_at = NOW()
+                WHERE transaction_id = %s AND status = 'Pending'
+                RETURNING id, request_id, amount, payment_method, paid_at
+                """,
+                (status, event['transaction_id'])
+            )
+            payment = cursor.fetchone()
+            if payment is None:
+                conn.rollback()
+                return {"success": True, "applied": False, "message": "Payment already settled or unknown"}
+            
+            payment_id, request_id, amount, payment_method, paid_at = payment
+            
+            cursor.execute(
+                """
+                INSERT INTO payment_history (payment_id, old_status, new_status, changed_by, remarks)
+                VALUES (%s, 'Pending', %s, %s, %s)
+                """,
+                (payment_id, status, event.get('provider', 'provider'),
+                 event.get('failure_reason') or event.get('provider_reference'))
+            )
+            
+            self.ledger.append([{
+                "transaction_id": event['transaction_id'],
+                "request_id": request_id,
+                "event_type": status.lower(),
+                "amount": amount,
+                "payment_method": payment_method,
+                "provider_reference": event.get('provider_reference'),
+                "remarks": event.get('failure_reason')
+            }], cursor=cursor)
+            
+            if status == 'Completed':
+                cursor.execute(
+                    "UPDATE service_requests SET status = 'For Payment Verification' WHERE id = %s",
+                    (request_id,)
+                )
+                # Queued in this transaction, so a completed payment always has its receipt job
+                if self.receipt_queue:
+                    self._queue_receipt(cursor, event['transaction_id'], request_id, amount, payment_method, paid_at)
+            
+            # Delivered on commit to every process listening for status changes
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                (self.STATUS_CHANNEL, f"{event['transaction_id']}:{status}")
+            )
+            
+            conn.commit()
+            self._stats_cache.clear()
+            
+            return {"success": True, "applied": True, "transaction_id": event['transaction_id'], "status": status}
+        
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": f"Database error: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def refund_payment(self, transaction_id, reason=None, refunded_by='System'):
+        """Refund a completed payment, recording the refund in the ledger"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                """
+                UPDATE payments
+                SET status = 'Refunded', updated_at = NOW()
+                WHERE transaction_id = %s AND status = 'Completed'
+                RETURNING id, request_id, amount, payment_method
+                """,
+                (transaction_id,)
+            )
+            payment = cursor.fetchone()
+            if payment is None:
+                conn.rollback()
+                return {"success": False, "message": "Only completed payments can be refunded"}
+            
+            payment_id, request_id, amount, payment_method = payment
+            
+            cursor.execute(
+                """
+                INSERT INTO payment_history (payment_id, old_status, new_status, changed_by, remarks)
+                VALUES (%s, 'Completed', 'Refunded', %s, %s)
+                """,
+                (payment_id, refunded_by, reason)
+            )
+            
+            self.ledger.append([{
+                "transaction_id": transaction_id,
+                "request_id": request_id,
+                "event_type": "refunded",
+                "amount": amount,
+                "payment_method": payment_method,
+                "remarks": reason
+            }], cursor=cursor)
+            
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                (self.STATUS_CHANNEL, f"{transaction_id}:Refunded")
+            )
+            
+            conn.commit()
+            self._stats_cache.clear()
+            
+            return {
+                "success": True,
+                "transaction_id": transaction_id,
+                "status": "Refunded",
+                "amount": amount,
+                "message": "Payment refunded"
+            }
+        
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": f"Database error: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _queue_receipt(self, cursor, transaction_id, request_id, amount, payment_method, paid_at):
+        """Queue the receipt for a completed payment on the caller's cursor"""
+        cursor.execute(RECEIPT_DETAILS_QUERY, (request_id,))
+        row = cursor.fetchone()
+        self.receipt_queue.enqueue(
+            *self._receipt_details(transaction_id, request_id, amount, payment_method, paid_at, row),
+            cursor=cursor
+        )
+    
+    def _receipt_details(self, transaction_id, request_id, amount, payment_method, paid_at, row):
+        """(payment_data, citizen_info, service_info) for a receipt job from a RECEIPT_DETAILS_QUERY row"""
+        reference_number, full_name, email, phone, service_name = row or (
+            f"REQ-{request_id:03d}", None, None, None, None
+        )
+        return (
+            {
+                "transaction_id": transaction_id,
+                "request_id": request_id,
+                "amount": float(amount),
+                "method": payment_method,
+                "status": "Completed",
+                "timestamp": paid_at.isoformat()
+            },
+            {
+                "name": full_name or 'N/A',
+                "email": email or 'N/A',
+                "phone": phone or 'N/A'
+            },
+            {
+                "request_id": reference_number,
+                "service_type": service_name or 'N/A',
+                "description": f"Payment for {service_name or 'service request'}"
+            }
+        )
+    
+    def get_request_owner(self, request_id):
+        """Get the user ID that owns a service request"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT user_id FROM service_requests WHERE id = %s", (request_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _service_request_query(self, fields=None):
+        """SELECT for get_service_request limited to fields, and the field names it returns"""
+        # user_id is always read so callers can check ownership
+        names = select_fields(REQUEST_COLUMNS, fields, required=("id", "user_id"))
+        joins = []
+        if {"citizen_name", "email"} & set(names):
+            joins.append("JOIN users u ON sr.user_id = u.id")
+        if {"service_type", "fee"} & set(names):
+            joins.append("JOIN services s ON sr.service_id = s.id")
+        query = f"""
+            SELECT {column_list(REQUEST_COLUMNS, names)}
+            FROM service_requests sr
+            {' '.join(joins)}
+            WHERE sr.id = %s
+        """
+        return query, names
+    
+    def get_service_request(self, request_id, fields=None):
+        """Get a service request with its citizen and service (only the given fields when set)"""
+        query, names = self._service_request_query(fields)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(query, (request_id,))
+            row = cursor.fetchone()
+            return dict(zip(names, row)) if row else None
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _payment_exists(self, request_id, status, transaction_id):
+        """Refusal for a request that is already paid or has a charge in flight"""
+        if status == 'Pending':
+            message = "A payment for this request is already awaiting confirmation from the payment provider."
+        else:
+            message = "This request has already been paid."
+        return {
+            "success": False,
+            "status": status,
+            "transaction_id": transaction_id,
+            "request_id": request_id,
+            "message": message
+        }
+    
+    def _scoped_idempotency_key(self, idempotency_key, user_id):
+        """Namespace a client idempotency key by the user sending it"""
+        if not idempotency_key or user_id is None:
+            return idempotency_key
+        return f"{user_id}:{idempotency_key}"
+    
+    def _submission_failure_event(self, transaction_id, error):
+        """Webhook-shaped Failed event for a charge the provider refused to accept"""
+        return {
+            "transaction_id": transaction_id,
+            "status": "Failed",
+            "provider": self.provider.name,
+            "failure_reason": f"Submission failed: {error}"
+        }
+    
+    def _submission_failed_result(self, result):
+        return dict(
+            result,
+            success=False,
+            status="Failed",
+            message="The payment provider could not be reached. No charge was made; please try again."
+        )
+    
+    def _store_idempotent_response(self, key, fingerprint, response):
+        """Replace the stored result for key (the row was written by process_payment)"""
+        self._idempotency_cache.set(key, {"fingerprint": fingerprint, "response": response})
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                "UPDATE payment_idempotency_keys SET response = %s WHERE idempotency_key = %s",
+                (Json(response), key)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def _request_fingerprint(self, request_id, amount, payment_method):
+        """Hash the parameters an idempotency key is bound to"""
+        raw = f"{request_id}|{float(amount):.2f}|{payment_method}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _replay(self, stored, fingerprint):
+        """Return a stored idempotent result, rejecting keys reused for other payments"""
+        if stored["fingerprint"] != fingerprint:
+            return {
+                "success": False,
+                "status": "Error",
+                "message": "Idempotency key was already used for a different payment"
+            }
+        return dict(stored["response"], replayed=True)
+    
+    def purge_idempotency_keys(self, older_than_hours=24):
+        """Delete stored idempotency results past their retention window"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                "DELETE FROM payment_idempotency_keys WHERE created_at < NOW() - %s * INTERVAL '1 hour'",
+                (older_than_hours,)
+            )
+            deleted = cursor.rowcount
+            conn.commit()
+            return {"success": True, "deleted_count": deleted}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def search_payable_requests(self, query="", limit=20):
+        """Top open service requests matching a reference number or citizen name
+        
+        Each branch of the match is served by its own trigram index and only the
+        newest `limit` rows are returned, so the cost does not grow with the
+        number of open requests.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            query = (query or "").strip()
+            if query:
+                pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                matches = """
+                    SELECT sr.id FROM service_requests sr WHERE sr.reference_number ILIKE %(pattern)s
+                    UNION
+                    SELECT sr.id FROM users u JOIN service_requests sr ON sr.user_id = u.id
+                    WHERE u.full_name ILIKE %(pattern)s
+                """
+                source = f"({matches}) m JOIN service_requests sr ON sr.id = m.id"
+            else:
+                pattern = None
+                source = "service_requests sr"
+            
+            cursor.execute(
+                f"""
+                SELECT sr.id, sr.reference_number, u.full_name, u.email, s.name, s.fee,
+                       sr.status, sr.submitted_at
+                FROM {source}
+                JOIN users u ON sr.user_id = u.id
+                JOIN services s ON sr.service_id = s.id
+                WHERE sr.status NOT IN ('completed', 'rejected')
+                ORDER BY sr.submitted_at DESC
+                LIMIT %(limit)s
+                """,
+                {"pattern": pattern, "limit": limit}
+            )
+            
+            return [
+                {
+                    "request_id": row[0],
+                    "reference_number": row[1],
+                    "citizen_name": row[2],
+                    "email": row[3],
+                    "service_type": row[4],
+                    "fee": row[5],
+                    "status": row[6],
+                    "submitted_at": row[7]
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            cursor.close()
+            conn.close()
     
     def verify_payment(self, transaction_id):
         """Verify payment status"""
@@ -84,8 +580,13 @@ class PaymentGateway:
         cursor = conn.cursor()
         
         try:
+            # Served by the unique index on payments.transaction_id
             cursor.execute(
-                "SELECT * FROM payments WHERE transaction_id = %s",
+                """
+                SELECT transaction_id, request_id, amount, payment_method, status, paid_at, created_at
+                FROM payments
+                WHERE transaction_id = %s
+                """,
                 (transaction_id,)
             )
             payment = cursor.fetchone()
@@ -93,10 +594,13 @@ class PaymentGateway:
             if payment:
                 return {
                     "found": True,
-                    "transaction_id": payment[3],
+                    "transaction_id": payment[0],
+                    "request_id": payment[1],
                     "amount": payment[2],
+                    "method": payment[3],
                     "status": payment[4],
-                    "paid_at": payment[5]
+                    "paid_at": payment[5],
+                    "created_at": payment[6]
                 }
             else:
                 return {"found": False, "message": "Transaction not found"}
@@ -105,77 +609,278 @@ class PaymentGateway:
             cursor.close()
             conn.close()
     
-    def get_payment_history(self, citizen_name=None, limit=10):
-        """Get payment history"""
+    def get_payment_history(self, user_id=None, request_id=None, status=None, payment_method=None,
+                            date_from=None, date_to=None, limit=20, cursor=None):
+        """Get payment history, newest first, with keyset pagination
+        
+        Pass the returned next_cursor back as cursor to fetch the next page.
+        """
+        conditions = []
+        params = []
+        
+        if user_id is not None:
+            conditions.append("sr.user_id = %s")
+            params.append(user_id)
+        if request_id is not None:
+            conditions.append("p.request_id = %s")
+            params.append(request_id)
+        if status:
+            conditions.append("p.status = %s")
+            params.append(status)
+        if payment_method:
+            conditions.append("p.payment_method = %s")
+            params.append(payment_method)
+        if date_from:
+            conditions.append("p.paid_at >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("p.paid_at < %s")
+            params.append(date_to + timedelta(days=1))
+        if cursor:
+            cursor_paid_at, cursor_id = self._decode_history_cursor(cursor)
+            conditions.append("(p.paid_at, p.id) < (%s, %s)")
+            params.extend([cursor_paid_at, cursor_id])
+        
+        conditions.append("p.paid_at IS NOT NULL")
+        where = " AND ".join(conditions)
+        
+        conn = self.get_connection()
+        db_cursor = conn.cursor()
+        
+        try:
+            # Fetch one extra row to know whether another page exists
+            db_cursor.execute(
+                f"""
+                SELECT p.id, p.transaction_id, p.request_id, sr.reference_number, sr.user_id,
+                       u.full_name, s.name, p.amount, p.payment_method, p.status, p.paid_at
+                FROM payments p
+                JOIN service_requests sr ON p.request_id = sr.id
+                JOIN users u ON sr.user_id = u.id
+                JOIN services s ON sr.service_id = s.id
+                WHERE {where}
+                ORDER BY p.paid_at DESC, p.id DESC
+                LIMIT %s
+                """,
+                params + [limit + 1]
+            )
+            rows = db_cursor.fetchall()
+            
+            payments = [
+                {
+                    "id": row[0],
+                    "transaction_id": row[1],
+                    "request_id": row[2],
+                    "reference_number": row[3],
+                    "user_id": row[4],
+                    "citizen_name": row[5],
+                    "service_type": row[6],
+                    "amount": row[7],
+                    "method": row[8],
+                    "status": row[9],
+                    "paid_at": row[10]
+                }
+                for row in rows[:limit]
+            ]
+            
+            next_cursor = None
+            if len(rows) > limit:
+                last = payments[-1]
+                next_cursor = f"{last['paid_at'].isoformat()}|{last['id']}"
+            
+            return {"payments": payments, "next_cursor": next_cursor}
+            
+        finally:
+            db_cursor.close()
+            conn.close()
+    
+    def _decode_history_cursor(self, cursor):
+        """Split a history cursor into its (paid_at, id) sort key"""
+        paid_at, payment_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(paid_at), int(payment_id)
+    
+    def get_payments_for_day(self, day, status='Completed'):
+        """Get payments made on a given date with payer and service details"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            if citizen_name:
-                cursor.execute(
-                    """
-                    SELECT p.*, sr.service_type, sr.citizen_name 
-                    FROM payments p
-                    JOIN service_requests sr ON p.request_id = sr.id
-                    WHERE sr.citizen_name = %s
-                    ORDER BY p.paid_at DESC LIMIT %s
-                    """,
-                    (citizen_name, limit)
-                )
-            else:
-                cursor.execute(
-                    """
-                    SELECT p.*, sr.service_type, sr.citizen_name 
-                    FROM payments p
-                    JOIN service_requests sr ON p.request_id = sr.id
-                    ORDER BY p.paid_at DESC LIMIT %s
-                    """,
-                    (limit,)
-                )
+            cursor.execute(
+                """
+                SELECT p.transaction_id, p.request_id, sr.reference_number, p.amount,
+                       p.payment_method, p.status, p.paid_at,
+                       u.full_name, u.email, u.phone, s.name
+                FROM payments p
+                JOIN service_requests sr ON p.request_id = sr.id
+                JOIN users u ON sr.user_id = u.id
+                JOIN services s ON sr.service_id = s.id
+                WHERE p.paid_at >= %s AND p.paid_at < %s AND p.status = %s
+                ORDER BY p.paid_at, p.id
+                """,
+                (day, day + timedelta(days=1), status)
+            )
+            
+            return [
+                {
+                    "transaction_id": row[0],
+                    "request_id": row[1],
+                    "reference_number": row[2],
+                    "amount": row[3],
+                    "method": row[4],
+                    "status": row[5],
+                    "paid_at": row[6],
+                    "citizen_name": row[7],
+                    "email": row[8],
+                    "phone": row[9],
+                    "service_name": row[10]
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def get_daily_collection(self, day):
+        """Aggregate a day's completed payments by payment method and by service"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(
+                """
+                SELECT p.payment_method, s.name, COUNT(*), COALESCE(SUM(p.amount), 0),
+                       GROUPING(p.payment_method), GROUPING(s.name)
+                FROM payments p
+                JOIN service_requests sr ON p.request_id = sr.id
+                JOIN services s ON sr.service_id = s.id
+                WHERE p.paid_at >= %s AND p.paid_at < %s AND p.status = 'Completed'
+                GROUP BY GROUPING SETS ((p.payment_method), (s.name), ())
+                ORDER BY 1, 2
+                """,
+                (day, day + timedelta(days=1))
+            )
             
-            payments = cursor.fetchall()
-            return payments
+            report = {
+                "date": day.isoformat(),
+                "by_method": [],
+                "by_service": [],
+                "total_count": 0,
+                "total_amount": 0
+            }
+            for method, service, count, amount, method_grouped, service_grouped in cursor.fetchall():
+                if method_grouped and service_grouped:
+                    report["total_count"] = count
+                    report["total_amount"] = amount
+                elif service_grouped:
+                    report["by_method"].append({"payment_method": method, "count": count, "amount": amount})
+                else:
+                    report["by_service"].append({"service": service, "count": count, "amount": amount})
             
+            return report
         finally:
             cursor.close()
             conn.close()
     
     def _generate_transaction_id(self):
-        """Generate unique transaction ID"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        return f"CC{timestamp}{random_suffix}"
+        """Generate unique, time-ordered transaction ID"""
+        return transaction_ids.generate()
     
-    def get_payment_stats(self):
+    def get_payment_stats(self, use_cache=True):
         """Get payment statistics"""
+        if use_cache:
+            cached = self._stats_cache.get("payment_stats")
+            if cached is not None:
+                return cached
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            # Total payments
-            cursor.execute("SELECT COUNT(*) FROM payments")
-            total_payments = cursor.fetchone()[0]
-            
-            # Total amount
-            cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'Completed'")
-            total_amount = cursor.fetchone()[0]
-            
-            # Successful payments
-            cursor.execute("SELECT COUNT(*) FROM payments WHERE status = 'Completed'")
-            successful = cursor.fetchone()[0]
-            
-            # Failed payments
-            cursor.execute("SELECT COUNT(*) FROM payments WHERE status = 'Failed'")
-            failed = cursor.fetchone()[0]
+            # One pass over payments for every counter
+            cursor.execute("""
+                SELECT COUNT(*),
+                       COALESCE(SUM(amount) FILTER (WHERE status = 'Completed'), 0),
+                       COUNT(*) FILTER (WHERE status = 'Completed'),
+                       COUNT(*) FILTER (WHERE status = 'Failed')
+                FROM payments
+            """)
+            total_payments, total_amount, successful, failed = cursor.fetchone()
             
-            return {
+            stats = {
                 "total_payments": total_payments,
                 "total_amount": total_amount,
                 "successful": successful,
                 "failed": failed,
                 "success_rate": (successful / total_payments * 100) if total_payments > 0 else 0
             }
+            self._stats_cache.set("payment_stats", stats)
+            return stats
             
         finally:
             cursor.close()
             conn.close()
+    
+    def get_daily_revenue(self, days=30, use_cache=True):
+        """Get per-day payment counts and revenue from the pre-aggregated rollup"""
+        cache_key = ("daily_revenue", days)
+        if use_cache:
+            cached = self._stats_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT day,
+                       COALESCE(SUM(payment_count), 0),
+                       COALESCE(SUM(payment_count) FILTER (WHERE status = 'Completed'), 0),
+                       COALESCE(SUM(payment_count) FILTER (WHERE status = 'Failed'), 0),
+                       COALESCE(SUM(total_amount) FILTER (WHERE status = 'Completed'), 0)
+                FROM payment_daily_rollup
+                WHERE day > CURRENT_DATE - %s
+                GROUP BY day
+                ORDER BY day
+            """, (days,))
+            
+            revenue = [
+                {
+                    "day": row[0],
+                    "total_payments": row[1],
+                    "completed": row[2],
+                    "failed": row[3],
+                    "revenue": row[4]
+                }
+                for row in cursor.fetchall()
+            ]
+            self._stats_cache.set(cache_key, revenue)
+            return revenue
+            
+        finally:
+            cursor.close()
+            conn.close()
+    
+    def rebuild_daily_rollup(self):
+        """Recompute payment_daily_rollup from payments (backfill or repair)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("LOCK TABLE payments IN SHARE MODE")
+            cursor.execute("TRUNCATE payment_daily_rollup")
+            cursor.execute("""
+                INSERT INTO payment_daily_rollup (day, payment_method, status, payment_count, total_amount)
+                SELECT COALESCE(paid_at, created_at)::date, payment_method, status, COUNT(*), SUM(amount)
+                FROM payments
+                GROUP BY 1, 2, 3
+            """)
+            rows = cursor.rowcount
+            conn.commit()
+            self._stats_cache.clear()
+            return {"success": True, "rollup_rows": rows}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            cursor.close()
+            conn.close()
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Crockford base32: no I, L, O or U, so IDs read back unambiguously
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class TransactionIdGenerator:
+    """ULID-style transaction IDs: <prefix><48-bit ms timestamp><80-bit random>
+
+    IDs sort lexicographically by creation time. Within one millisecond the
+    random part is incremented rather than redrawn, so IDs from a process are
+    strictly monotonic; across processes and nodes the 80 random bits make a
+    collision vanishingly unlikely without any coordination.
+    """
+
+    def __init__(self, prefix="CC"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+        # A forked child must not continue the parent's sequence
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def generate(self):
+        """Return a new transaction ID"""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms <= self._last_ms:
+                # Same (or skewed-back) millisecond: keep order by incrementing
+                now_ms = self._last_ms
+                random_part = self._last_random + 1
+                if random_part > _RANDOM_MAX:
+                    now_ms += 1
+                    random_part = int.from_bytes(os.urandom(10), "big")
+            else:
+                random_part = int.from_bytes(os.urandom(10), "big")
+
+            self._last_ms = now_ms
+            self._last_random = random_part
+
+        return f"{self.prefix}{_encode(now_ms, 10)}{_encode(random_part, 16)}"
+
+    def timestamp(self, transaction_id):
+        """Recover the creation time embedded in a transaction ID"""
+        encoded = transaction_id[len(self.prefix):len(self.prefix) + 10]
+        value = 0
+        for char in encoded:
+            value = value * 32 + _ALPHABET.index(char)
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+transaction_ids = TransactionIdGenerator()
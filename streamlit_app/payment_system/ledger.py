@@ -0,0 +1,369 @@
+from psycopg2.extras import execute_values
+from datetime import date, datetime, timedelta
+import argparse
+import os
+
+class PaymentLedger:
+    """Append-only ledger of payment events with daily balance snapshots
+
+    Every attempt, completion, failure and refund is appended to the
+    payment_ledger table (range-partitioned by month) and never updated.
+    Closed days are folded into payment_ledger_snapshots per service and
+    payment method, so balances read the snapshots plus the short tail of
+    events recorded since the last snapshotted day.
+    """
+
+    EVENT_TYPES = ("attempted", "completed", "failed", "refunded")
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def append(self, events, cursor=None):
+        """Insert ledger events in one batched statement
+
+        Pass the caller's cursor to write inside its transaction (the gateway
+        does this so a payment and its ledger event commit together). Each
+        event is a dict with transaction_id, request_id, event_type, amount,
+        payment_method and optionally provider_reference and remarks.
+        """
+        if not events:
+            return 0
+
+        rows = self.event_rows(events)
+
+        if cursor is not None:
+            self._insert(cursor, rows)
+            return len(rows)
+
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            self._insert(cursor, rows)
+            conn.commit()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def event_rows(self, events):
+        """Validate events and flatten them to the VALUES row layout used by inserts"""
+        rows = []
+        for event in events:
+            if event["event_type"] not in self.EVENT_TYPES:
+                raise ValueError(f"Unknown ledger event type: {event['event_type']}")
+            rows.append((
+                event["transaction_id"],
+                event["request_id"],
+                event["event_type"],
+                event["amount"],
+                event["payment_method"],
+                event.get("provider_reference"),
+                event.get("remarks")
+            ))
+        return rows
+
+    def _insert(self, cursor, rows):
+        # service_id is denormalized onto the event so snapshots never join back
+        execute_values(
+            cursor,
+            """
+            INSERT INTO payment_ledger
+            (transaction_id, request_id, service_id, event_type, amount, payment_method,
+             provider_reference, remarks)
+            SELECT v.transaction_id, v.request_id, sr.service_id, v.event_type, v.amount,
+                   v.payment_method, v.provider_reference, v.remarks
+            FROM (VALUES %s) AS v (transaction_id, request_id, event_type, amount, payment_method,
+                                   provider_reference, remarks)
+            LEFT JOIN service_requests sr ON sr.id = v.request_id
+            """,
+            rows,
+            template="(%s, %s::int, %s, %s::numeric, %s, %s, %s)",
+            page_size=500
+        )
+
+    def ensure_partitions(self, months_ahead=2):
+        """Create monthly partitions from the current month through months_ahead
+
+        Run this from a monthly (or daily) schedule, e.g. cron calling
+        `python -m payment_system.ledger partitions`; schema.sql only creates
+        the current and next month. Events for a month without a partition
+        land in payment_ledger_default and are moved into the partition when
+        it is created.
+        """
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            first = date.today().replace(day=1)
+            created = []
+            for offset in range(months_ahead + 1):
+                month = (first.month - 1 + offset) % 12 + 1
+                year = first.year + (first.month - 1 + offset) // 12
+                cursor.execute("SELECT payment_ledger_ensure_partition(%s)", (date(year, month, 1),))
+                created.append(cursor.fetchone()[0])
+            conn.commit()
+            return {"success": True, "partitions": created}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def snapshot_day(self, day, cursor=None):
+        """Fold one day's ledger events into payment_ledger_snapshots (idempotent)"""
+        if cursor is None:
+            conn = self.gateway.get_connection()
+            cursor = conn.cursor()
+            try:
+                rows = self.snapshot_day(day, cursor)
+                conn.commit()
+                return rows
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+
+        cursor.execute("DELETE FROM payment_ledger_snapshots WHERE day = %s", (day,))
+        cursor.execute(
+            """
+            INSERT INTO payment_ledger_snapshots
+            (day, service_id, payment_method, attempted_count, completed_count, failed_count,
+             refunded_count, collected_amount, refunded_amount)
+            SELECT %s, COALESCE(service_id, 0), payment_method,
+                   COUNT(*) FILTER (WHERE event_type = 'attempted'),
+                   COUNT(*) FILTER (WHERE event_type = 'completed'),
+                   COUNT(*) FILTER (WHERE event_type = 'failed'),
+                   COUNT(*) FILTER (WHERE event_type = 'refunded'),
+                   COALESCE(SUM(amount) FILTER (WHERE event_type = 'completed'), 0),
+                   COALESCE(SUM(amount) FILTER (WHERE event_type = 'refunded'), 0)
+            FROM payment_ledger
+            WHERE recorded_at >= %s AND recorded_at < %s
+            GROUP BY 2, 3
+            """,
+            (day, day, day + timedelta(days=1))
+        )
+        rows = cursor.rowcount
+        cursor.execute(
+            """
+            INSERT INTO payment_ledger_snapshot_days (day, snapshot_rows, taken_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (day) DO UPDATE
+            SET snapshot_rows = EXCLUDED.snapshot_rows, taken_at = EXCLUDED.taken_at
+            """,
+            (day, rows)
+        )
+        return rows
+
+    def snapshot_pending(self, lag_minutes=60):
+        """Snapshot every closed day since the last snapshot
+
+        A day is only considered closed lag_minutes after midnight, so
+        transactions that started before midnight have committed first.
+        """
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            # Serialize concurrent snapshot runs
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('payment_ledger_snapshots'))")
+            cursor.execute(
+                """
+                SELECT COALESCE(
+                    (SELECT MAX(day) + 1 FROM payment_ledger_snapshot_days),
+                    (SELECT MIN(recorded_at)::date FROM payment_ledger)
+                )
+                """
+            )
+            start = cursor.fetchone()[0]
+            last_closed = (datetime.now() - timedelta(minutes=lag_minutes)).date() - timedelta(days=1)
+
+            days = 0
+            day = start
+            while day is not None and day <= last_closed:
+                self.snapshot_day(day, cursor)
+                days += 1
+                day += timedelta(days=1)
+
+            conn.commit()
+            return {"success": True, "days": days, "through": last_closed.isoformat()}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get_balances(self, date_from, date_to):
+        """Per-service totals for a date range from snapshots plus the unsnapshotted tail"""
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                WITH watermark AS (
+                    SELECT COALESCE(MAX(day) + 1, DATE '-infinity') AS tail_from
+                    FROM payment_ledger_snapshot_days
+                ),
+                totals AS (
+                    SELECT service_id, payment_method, completed_count, failed_count, refunded_count,
+                           collected_amount, refunded_amount
+                    FROM payment_ledger_snapshots, watermark
+                    WHERE day >= %(date_from)s AND day <= %(date_to)s AND day < watermark.tail_from
+
+                    UNION ALL
+
+                    SELECT COALESCE(service_id, 0), payment_method,
+                           COUNT(*) FILTER (WHERE event_type = 'completed'),
+                           COUNT(*) FILTER (WHERE event_type = 'failed'),
+                           COUNT(*) FILTER (WHERE event_type = 'refunded'),
+                           COALESCE(SUM(amount) FILTER (WHERE event_type = 'completed'), 0),
+                           COALESCE(SUM(amount) FILTER (WHERE event_type = 'refunded'), 0)
+                    FROM payment_ledger, watermark
+                    WHERE recorded_at >= GREATEST(%(date_from)s, watermark.tail_from)
+                      AND recorded_at < %(date_end)s
+                    GROUP BY 1, 2
+                )
+                SELECT t.service_id, s.name, t.payment_method,
+                       SUM(t.completed_count), SUM(t.failed_count), SUM(t.refunded_count),
+                       SUM(t.collected_amount), SUM(t.refunded_amount)
+                FROM totals t
+                LEFT JOIN services s ON s.id = t.service_id
+                GROUP BY t.service_id, s.name, t.payment_method
+                ORDER BY s.name, t.payment_method
+                """,
+                {"date_from": date_from, "date_to": date_to, "date_end": date_to + timedelta(days=1)}
+            )
+
+            balances = [
+                {
+                    "service_id": row[0],
+                    "service": row[1] or "Unknown",
+                    "payment_method": row[2],
+                    "completed": row[3],
+                    "failed": row[4],
+                    "refunded": row[5],
+                    "collected_amount": row[6],
+                    "refunded_amount": row[7],
+                    "net_amount": row[6] - row[7]
+                }
+                for row in cursor.fetchall()
+            ]
+            return {
+                "date_from": date_from.isoformat(),
+                "date_to": date_to.isoformat(),
+                "balances": balances,
+                "net_amount": sum(balance["net_amount"] for balance in balances)
+            }
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get_events(self, transaction_id):
+        """Full event trail for one transaction, oldest first"""
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                SELECT id, event_type, amount, payment_method, provider_reference, remarks, recorded_at
+                FROM payment_ledger
+                WHERE transaction_id = %s
+                ORDER BY recorded_at, id
+                """,
+                (transaction_id,)
+            )
+            return [
+                {
+                    "id": row[0],
+                    "event_type": row[1],
+                    "amount": row[2],
+                    "payment_method": row[3],
+                    "provider_reference": row[4],
+                    "remarks": row[5],
+                    "recorded_at": row[6]
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            cursor.close()
+            conn.close()
+
+    def backfill_from_payments(self):
+        """Seed the ledger from payments recorded before it existed (one event per payment)"""
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                INSERT INTO payment_ledger
+                (transaction_id, request_id, service_id, event_type, amount, payment_method,
+                 remarks, recorded_at)
+                SELECT p.transaction_id, p.request_id, sr.service_id,
+                       CASE p.status WHEN 'Completed' THEN 'completed'
+                                     WHEN 'Failed' THEN 'failed'
+                                     ELSE 'attempted' END,
+                       p.amount, p.payment_method, 'Backfilled from payments',
+                       COALESCE(p.paid_at, p.created_at)
+                FROM payments p
+                LEFT JOIN service_requests sr ON sr.id = p.request_id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM payment_ledger l WHERE l.transaction_id = p.transaction_id
+                )
+                """
+            )
+            inserted = cursor.rowcount
+            conn.commit()
+            return {"success": True, "inserted": inserted}
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def main():
+    """Command-line entry point: python -m payment_system.ledger {partitions,snapshot,balances,backfill}"""
+    from .gateway import PaymentGateway
+
+    parser = argparse.ArgumentParser(description="Maintain the payment ledger")
+    parser.add_argument("command", choices=["partitions", "snapshot", "balances", "backfill"])
+    parser.add_argument("--months-ahead", type=int, default=2)
+    parser.add_argument("--date-from", default=date.today().replace(day=1).isoformat())
+    parser.add_argument("--date-to", default=date.today().isoformat())
+    args = parser.parse_args()
+
+    gateway = PaymentGateway(
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_NAME", "canconnect"),
+        os.getenv("DB_USER", "postgres"),
+        os.getenv("DB_PASS", "password")
+    )
+    ledger = gateway.ledger
+
+    if args.command == "partitions":
+        print(ledger.ensure_partitions(args.months_ahead))
+    elif args.command == "snapshot":
+        print(ledger.snapshot_pending())
+    elif args.command == "backfill":
+        print(ledger.backfill_from_payments())
+    else:
+        result = ledger.get_balances(date.fromisoformat(args.date_from), date.fromisoformat(args.date_to))
+        for balance in result["balances"]:
+            print(f"{balance['service']:<35} {balance['payment_method']:<10} "
+                  f"{balance['completed']:>6} {balance['net_amount']:>14,.2f}")
+        print(f"{'Net collected':<46} {result['net_amount']:>21,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import hmac
+import json
+import random
+import time
+import urllib.request
+import uuid
+
+def sign_webhook(body, secret):
+    """HMAC-SHA256 signature for a webhook body"""
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+# Placeholders that once shipped as defaults; anyone could sign with them
+INSECURE_WEBHOOK_SECRETS = {'change-this-webhook-secret'}
+MIN_WEBHOOK_SECRET_LENGTH = 16
+
+
+def webhook_secret_usable(secret):
+    """Whether a webhook secret is set and not a known placeholder"""
+    return bool(secret) and len(secret) >= MIN_WEBHOOK_SECRET_LENGTH and secret not in INSECURE_WEBHOOK_SECRETS
+
+
+def verify_webhook_signature(body, signature, secret):
+    """Check a webhook body against its X-Webhook-Signature header"""
+    if not signature or not webhook_secret_usable(secret):
+        return False
+    return hmac.compare_digest(sign_webhook(body, secret), signature)
+
+
+class PaymentProvider:
+    """Base payment provider adapter
+
+    submit() hands a charge to the provider and returns immediately. The
+    provider later reports the outcome as a webhook event:
+
+        {"transaction_id", "status": "Completed" | "Failed", "provider",
+         "provider_reference", "failure_reason", "occurred_at"}
+
+    delivered either to the in-process callback or to a webhook URL.
+    """
+
+    name = "base"
+
+    def submit(self, transaction_id, amount, payment_method, callback, **options):
+        raise NotImplementedError
+
+    def shutdown(self):
+        """Release provider resources"""
+        pass
+
+
+class SimulatedProvider(PaymentProvider):
+    """Local provider for development and offline load tests
+
+    Each charge settles after a random delay in latency_seconds and fails
+    with probability failure_rate. Outcomes are delivered from a thread
+    pool, so the caller never blocks on the simulated provider.
+    """
+
+    name = "simulated"
+
+    def __init__(self, failure_rate=0.1, latency_seconds=(0.5, 2.0), webhook_url=None,
+                 webhook_secret=None, max_workers=8):
+        self.failure_rate = failure_rate
+        self.latency_seconds = latency_seconds
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="simulated-provider")
+
+    def submit(self, transaction_id, amount, payment_method, callback, **options):
+        """Accept a charge and schedule its webhook"""
+        failure_rate = options.get('failure_rate', self.failure_rate)
+        latency_seconds = options.get('latency_seconds', self.latency_seconds)
+        provider_reference = f"SIM-{uuid.uuid4().hex[:12].upper()}"
+        self._executor.submit(self._settle, transaction_id, failure_rate, latency_seconds,
+                              provider_reference, callback)
+        return {"accepted": True, "provider": self.name, "provider_reference": provider_reference}
+
+    def _settle(self, transaction_id, failure_rate, latency_seconds, provider_reference, callback):
+        low, high = latency_seconds
+        time.sleep(random.uniform(low, high))
+
+        failed = random.random() < failure_rate
+        event = {
+            "transaction_id": transaction_id,
+            "status": "Failed" if failed else "Completed",
+            "provider": self.name,
+            "provider_reference": provider_reference,
+            "failure_reason": "Declined by simulated provider" if failed else None,
+            "occurred_at": datetime.now().isoformat()
+        }
+        self._deliver(event, callback)
+
+    def _deliver(self, event, callback):
+        """Send the event to the webhook URL, or to the in-process callback"""
+        if not self.webhook_url:
+            callback(event)
+            return
+
+        body = json.dumps(event).encode('utf-8')
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-Webhook-Signature"] = sign_webhook(body, self.webhook_secret)
+
+        webhook_request = urllib.request.Request(self.webhook_url, data=body, headers=headers, method="POST")
+        for attempt in range(3):
+            try:
+                with urllib.request.urlopen(webhook_request, timeout=10):
+                    return
+            except OSError:
+                time.sleep(2 ** attempt)
+
+        # Webhook endpoint unreachable; fall back to the local callback
+        callback(event)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
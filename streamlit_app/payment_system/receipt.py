@@ -1,62 +1,125 @@
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 from reportlab.lib.units import inch
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.graphics.shapes import Drawing
 from datetime import datetime
 import os
+import shutil
+
+from .receipt_index import ReceiptIndex
+from .receipt_signing import ReceiptSigner
 
 class ReceiptGenerator:
     """Generate PDF receipts for payments"""
     
-    def __init__(self, output_dir="receipts"):
+    def __init__(self, output_dir="receipts", signer=None):
         self.output_dir = output_dir
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
-    
-    def generate_receipt(self, payment_data, citizen_info, service_info):
-        """Generate a PDF receipt"""
         
-        # Create filename
-        filename = f"{payment_data['transaction_id']}.pdf"
-        filepath = os.path.join(self.output_dir, filename)
+        # Receipts are sharded by date; the index maps IDs and dates to files
+        self.index = ReceiptIndex(os.path.join(output_dir, "index.sqlite3"))
         
-        # Create PDF
-        doc = SimpleDocTemplate(filepath, pagesize=letter,
-                              rightMargin=0.5*inch, leftMargin=0.5*inch,
-                              topMargin=0.5*inch, bottomMargin=0.5*inch)
+        # Styles are immutable once built, so every receipt from this
+        # generator shares them instead of rebuilding per call
+        self._build_styles()
         
-        # Container for elements
-        elements = []
-        styles = getSampleStyleSheet()
+        # Signs the verification QR code; configured from the environment by default
+        self.signer = signer if signer is not None else ReceiptSigner.from_env()
+    
+    def _build_styles(self):
+        """Build paragraph and table styles shared by all receipts"""
+        self.styles = getSampleStyleSheet()
         
-        # Custom styles
-        title_style = ParagraphStyle(
+        self.title_style = ParagraphStyle(
             'CustomTitle',
-            parent=styles['Heading1'],
+            parent=self.styles['Heading1'],
             fontSize=24,
             textColor=colors.HexColor('#0066A1'),
             spaceAfter=6,
             alignment=1  # Center
         )
         
-        heading_style = ParagraphStyle(
+        self.heading_style = ParagraphStyle(
             'CustomHeading',
-            parent=styles['Heading2'],
+            parent=self.styles['Heading2'],
             fontSize=12,
             textColor=colors.HexColor('#004D7A'),
             spaceAfter=6
         )
         
-        normal_style = ParagraphStyle(
+        self.normal_style = ParagraphStyle(
             'CustomNormal',
-            parent=styles['Normal'],
+            parent=self.styles['Normal'],
             fontSize=10,
             spaceAfter=4
         )
         
+        self.receipt_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ])
+        
+        self.info_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f5f5f5')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+        ])
+        
+        self.payment_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 1), (1, 1), 'RIGHT'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0066A1')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')])
+        ])
+    
+    def _paid_at(self, payment_data):
+        """Payment time from the payment result, falling back to now"""
+        timestamp = payment_data.get('timestamp')
+        if isinstance(timestamp, datetime):
+            return timestamp
+        if timestamp:
+            try:
+                return datetime.fromisoformat(timestamp)
+            except ValueError:
+                pass
+        return datetime.now()
+    
+    def _verification_qr(self, payment_data, service_info, paid_at, size=1.4*inch):
+        """QR code carrying the signed receipt payload"""
+        code = self.signer.sign(
+            payment_data['transaction_id'],
+            payment_data['amount'],
+            service_info.get('request_id', 'N/A'),
+            paid_at
+        )
+        widget = QrCodeWidget(code, barLevel='M')
+        x0, y0, x1, y1 = widget.getBounds()
+        drawing = Drawing(size, size, transform=[size / (x1 - x0), 0, 0, size / (y1 - y0), 0, 0])
+        drawing.add(widget)
+        return drawing
+    
+    def build_elements(self, payment_data, citizen_info, service_info):
+        """Build the flowables for one receipt"""
+        paid_at = self._paid_at(payment_data)
+        styles = self.styles
+        heading_style = self.heading_style
+        
+        # Container for elements
+        elements = []
+        
         # Header
-        elements.append(Paragraph("CANCONNECT", title_style))
+        elements.append(Paragraph("CANCONNECT", self.title_style))
         elements.append(Paragraph("Municipality of Cantilan", styles['Normal']))
         elements.append(Paragraph("Surigao del Sur 8317", styles['Normal']))
         elements.append(Spacer(1, 0.2*inch))
@@ -68,15 +131,11 @@ class ReceiptGenerator:
         # Receipt info
         receipt_info = [
             ['Receipt #:', payment_data['transaction_id']],
-            ['Date:', datetime.now().strftime("%B %d, %Y")],
-            ['Time:', datetime.now().strftime("%H:%M:%S")]
+            ['Date:', paid_at.strftime("%B %d, %Y")],
+            ['Time:', paid_at.strftime("%H:%M:%S")]
         ]
         receipt_table = Table(receipt_info, colWidths=[2*inch, 3*inch])
-        receipt_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ]))
+        receipt_table.setStyle(self.receipt_table_style)
         elements.append(receipt_table)
         elements.append(Spacer(1, 0.2*inch))
         
@@ -88,13 +147,7 @@ class ReceiptGenerator:
             ['Phone:', citizen_info.get('phone', 'N/A')]
         ]
         payer_table = Table(payer_info, colWidths=[1.5*inch, 3.5*inch])
-        payer_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f5f5f5')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-        ]))
+        payer_table.setStyle(self.info_table_style)
         elements.append(payer_table)
         elements.append(Spacer(1, 0.2*inch))
         
@@ -106,48 +159,71 @@ class ReceiptGenerator:
             ['Reference #:', service_info.get('request_id', 'N/A')]
         ]
         service_table = Table(service_data, colWidths=[1.5*inch, 3.5*inch])
-        service_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f5f5f5')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-        ]))
+        service_table.setStyle(self.info_table_style)
         elements.append(service_table)
         elements.append(Spacer(1, 0.2*inch))
         
         # Payment details
         elements.append(Paragraph("PAYMENT DETAILS", heading_style))
         payment_details = [
-            ['Amount Paid:', f"₱{payment_data['amount']:.2f}"],
+            ['Amount Paid:', f"₱{float(payment_data['amount']):.2f}"],
             ['Payment Method:', payment_data['method'].title()],
             ['Payment Status:', payment_data['status']],
-            ['Paid At:', datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
+            ['Paid At:', paid_at.strftime("%Y-%m-%d %H:%M:%S")]
         ]
         payment_table = Table(payment_details, colWidths=[1.5*inch, 3.5*inch])
-        payment_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 1), (1, 1), 'RIGHT'),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0066A1')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')])
-        ]))
+        payment_table.setStyle(self.payment_table_style)
         elements.append(payment_table)
         elements.append(Spacer(1, 0.3*inch))
         
+        # Signed QR code, verifiable at kiosks without a database lookup
+        if self.signer and self.signer.can_sign:
+            qr_table = Table([[
+                self._verification_qr(payment_data, service_info, paid_at),
+                Paragraph("Scan to verify this receipt. The code is digitally signed by the "
+                          "Municipality of Cantilan and can be checked offline.", self.normal_style)
+            ]], colWidths=[1.6*inch, 3.4*inch])
+            qr_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]))
+            elements.append(qr_table)
+            elements.append(Spacer(1, 0.2*inch))
+        
         # Footer
-        elements.append(Paragraph("___" * 20, normal_style))
+        elements.append(Paragraph("___" * 20, self.normal_style))
         elements.append(Paragraph("Thank you for your payment!", styles['Normal']))
         elements.append(Paragraph("For inquiries, please visit the Municipal Hall or call (086) 888-xxxx", 
                                  styles['Normal']))
         elements.append(Paragraph("This is an official receipt. Please keep for your records.", 
                                  styles['Normal']))
         
+        return elements
+    
+    def _document(self, filepath):
+        """Create a page template for a receipt file"""
+        return SimpleDocTemplate(filepath, pagesize=letter,
+                                 rightMargin=0.5*inch, leftMargin=0.5*inch,
+                                 topMargin=0.5*inch, bottomMargin=0.5*inch)
+    
+    def generate_receipt(self, payment_data, citizen_info, service_info):
+        """Generate a PDF receipt"""
+        
+        paid_at = self._paid_at(payment_data)
+        
+        # Create filename in the date shard (receipts/YYYY/MM/DD/)
+        filename = f"{payment_data['transaction_id']}.pdf"
+        shard_dir = os.path.join(self.output_dir, paid_at.strftime("%Y"), paid_at.strftime("%m"), paid_at.strftime("%d"))
+        os.makedirs(shard_dir, exist_ok=True)
+        filepath = os.path.join(shard_dir, filename)
+        
         # Build PDF
-        doc.build(elements)
+        doc = self._document(filepath)
+        doc.build(self.build_elements(payment_data, citizen_info, service_info))
+        
+        self.index.add(
+            transaction_id=payment_data['transaction_id'],
+            request_id=payment_data.get('request_id', service_info.get('request_id')),
+            receipt_date=paid_at.date().isoformat(),
+            filepath=filepath
+        )
         
         return {
             "success": True,
@@ -156,16 +232,118 @@ class ReceiptGenerator:
             "message": f"Receipt generated: {filename}"
         }
     
+    def generate_combined(self, receipts, filename, output_dir=None):
+        """Render many receipts into one multi-page PDF (one receipt per page)
+        
+        receipts is a list of (payment_data, citizen_info, service_info) tuples.
+        The file goes to output_dir (default: the receipts directory) and is
+        not indexed; only individual receipts are.
+        """
+        filepath = os.path.join(output_dir or self.output_dir, filename)
+        
+        elements = []
+        for index, (payment_data, citizen_info, service_info) in enumerate(receipts):
+            if index:
+                elements.append(PageBreak())
+            elements.extend(self.build_elements(payment_data, citizen_info, service_info))
+        
+        self._document(filepath).build(elements)
+        
+        return {
+            "success": True,
+            "filepath": filepath,
+            "filename": filename,
+            "count": len(receipts),
+            "message": f"{len(receipts)} receipts written to {filename}"
+        }
+    
+    def generate_collection_report(self, report, filename=None, output_dir=None):
+        """Render a daily collection report from PaymentGateway.get_daily_collection"""
+        filename = filename or f"collection_{report['date']}.pdf"
+        filepath = os.path.join(output_dir or self.output_dir, filename)
+        styles = self.styles
+        
+        elements = []
+        elements.append(Paragraph("CANCONNECT", self.title_style))
+        elements.append(Paragraph("Municipality of Cantilan", styles['Normal']))
+        elements.append(Spacer(1, 0.2*inch))
+        elements.append(Paragraph(f"DAILY COLLECTION REPORT — {report['date']}", self.heading_style))
+        elements.append(Spacer(1, 0.1*inch))
+        
+        sections = [
+            ("BY PAYMENT METHOD", "Payment Method", "payment_method", report['by_method']),
+            ("BY SERVICE", "Service", "service", report['by_service'])
+        ]
+        for title, label, key, rows in sections:
+            elements.append(Paragraph(title, self.heading_style))
+            data = [[label, 'Count', 'Amount']]
+            data.extend([
+                [str(row[key]).title() if key == 'payment_method' else str(row[key]),
+                 str(row['count']), f"₱{float(row['amount']):,.2f}"]
+                for row in rows
+            ])
+            table = Table(data, colWidths=[3.5*inch, 1*inch, 2*inch], repeatRows=1)
+            table.setStyle(self.payment_table_style)
+            elements.append(table)
+            elements.append(Spacer(1, 0.2*inch))
+        
+        totals = Table([
+            ['Total Transactions:', str(report['total_count'])],
+            ['Total Collected:', f"₱{float(report['total_amount']):,.2f}"]
+        ], colWidths=[2*inch, 3*inch])
+        totals.setStyle(self.receipt_table_style)
+        elements.append(totals)
+        elements.append(Spacer(1, 0.3*inch))
+        elements.append(Paragraph("___" * 20, self.normal_style))
+        elements.append(Paragraph(f"Generated {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+        
+        self._document(filepath).build(elements)
+        
+        return {
+            "success": True,
+            "filepath": filepath,
+            "filename": filename,
+            "message": f"Collection report generated: {filename}"
+        }
+    
     def get_receipt(self, transaction_id):
         """Get receipt by transaction ID"""
-        filepath = os.path.join(self.output_dir, f"{transaction_id}.pdf")
-        if os.path.exists(filepath):
+        filepath = self.index.get(transaction_id)
+        if filepath and os.path.exists(filepath):
             return filepath
+        
+        # Receipts generated before the index existed live in the flat directory
+        legacy_path = os.path.join(self.output_dir, f"{transaction_id}.pdf")
+        if os.path.exists(legacy_path):
+            return legacy_path
         return None
     
-    def list_receipts(self):
-        """List all generated receipts"""
-        receipts = []
-        if os.path.exists(self.output_dir):
-            receipts = [f for f in os.listdir(self.output_dir) if f.endswith('.pdf')]
-        return receipts
+    def list_receipts(self, limit=50, offset=0, request_id=None, date_from=None, date_to=None):
+        """List generated receipts, newest first, filtered and paginated"""
+        return self.index.list(limit=limit, offset=offset, request_id=request_id,
+                               date_from=date_from, date_to=date_to)
+    
+    def count_receipts(self, request_id=None, date_from=None, date_to=None):
+        """Count generated receipts matching the filters"""
+        return self.index.count(request_id=request_id, date_from=date_from, date_to=date_to)
+    
+    def migrate_flat_receipts(self):
+        """Move receipts from the old flat directory into date shards and index them"""
+        migrated = 0
+        for entry in os.scandir(self.output_dir):
+            if not entry.is_file() or not entry.name.endswith('.pdf'):
+                continue
+            receipt_date = datetime.fromtimestamp(entry.stat().st_mtime)
+            shard_dir = os.path.join(self.output_dir, receipt_date.strftime("%Y"),
+                                     receipt_date.strftime("%m"), receipt_date.strftime("%d"))
+            os.makedirs(shard_dir, exist_ok=True)
+            filepath = os.path.join(shard_dir, entry.name)
+            shutil.move(entry.path, filepath)
+            self.index.add(
+                transaction_id=entry.name[:-len('.pdf')],
+                request_id=None,
+                receipt_date=receipt_date.date().isoformat(),
+                filepath=filepath
+            )
+            migrated += 1
+        return {"success": True, "migrated_count": migrated}
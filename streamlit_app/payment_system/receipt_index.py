@@ -0,0 +1,116 @@
+import sqlite3
+import os
+from datetime import datetime
+
+class ReceiptIndex:
+    """Embedded SQLite index of generated receipts
+
+    Receipts live in date-sharded directories (YYYY/MM/DD); this index maps
+    transaction ID, request ID and date to the file so lookups and listings
+    never scan the receipts directory.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = self.get_connection()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS receipts (
+                    transaction_id TEXT PRIMARY KEY,
+                    request_id TEXT,
+                    receipt_date TEXT NOT NULL,
+                    filepath TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_receipts_request ON receipts(request_id);
+                CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(receipt_date, transaction_id);
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_connection(self):
+        """Open an index connection (one per call keeps it safe across threads and processes)"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add(self, transaction_id, request_id, receipt_date, filepath):
+        """Record (or replace) a receipt"""
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO receipts
+                (transaction_id, request_id, receipt_date, filepath, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (transaction_id, None if request_id is None else str(request_id),
+                 receipt_date, filepath, datetime.now().isoformat())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, transaction_id):
+        """Get a receipt's file path by transaction ID"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute(
+                "SELECT filepath FROM receipts WHERE transaction_id = ?",
+                (transaction_id,)
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def _filters(self, request_id, date_from, date_to):
+        clauses = []
+        params = []
+        if request_id is not None:
+            clauses.append("request_id = ?")
+            params.append(str(request_id))
+        if date_from:
+            clauses.append("receipt_date >= ?")
+            params.append(str(date_from))
+        if date_to:
+            clauses.append("receipt_date <= ?")
+            params.append(str(date_to))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def list(self, limit=50, offset=0, request_id=None, date_from=None, date_to=None):
+        """List receipts newest first, filtered and paginated"""
+        where, params = self._filters(request_id, date_from, date_to)
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT transaction_id, request_id, receipt_date, filepath, created_at
+                FROM receipts {where}
+                ORDER BY receipt_date DESC, transaction_id DESC
+                LIMIT ? OFFSET ?
+                """,
+                params + [limit, offset]
+            ).fetchall()
+            return [
+                {
+                    "transaction_id": row[0],
+                    "request_id": row[1],
+                    "receipt_date": row[2],
+                    "filepath": row[3],
+                    "filename": os.path.basename(row[3]),
+                    "created_at": row[4]
+                }
+                for row in rows
+            ]
+        finally:
+            conn.close()
+
+    def count(self, request_id=None, date_from=None, date_to=None):
+        """Count receipts matching the filters"""
+        where, params = self._filters(request_id, date_from, date_to)
+        conn = self.get_connection()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM receipts {where}", params).fetchone()[0]
+        finally:
+            conn.close()
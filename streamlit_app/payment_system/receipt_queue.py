@@ -0,0 +1,317 @@
+import psycopg2
+from database.pool import connect
+from psycopg2.extras import Json
+import argparse
+import multiprocessing
+import os
+import select
+import signal
+import sys
+
+from .receipt import ReceiptGenerator
+
+# At most one job per transaction; a repeated completion webhook queues nothing
+INSERT_JOB = """
+    INSERT INTO receipt_jobs (transaction_id, payload)
+    VALUES (%s, %s)
+    ON CONFLICT (transaction_id) DO NOTHING
+"""
+
+class ReceiptQueue:
+    """Durable receipt rendering queue stored in the receipt_jobs table
+
+    Payments enqueue a job and return immediately; ReceiptWorker processes
+    claim jobs with FOR UPDATE SKIP LOCKED and render the PDFs out of band.
+    Receipts are then fetched by transaction ID once their job is done.
+    """
+
+    CHANNEL = "receipt_jobs"
+
+    def __init__(self, db_host, db_name, db_user, db_pass, max_attempts=3, stale_after_minutes=10):
+        self.db_host = db_host
+        self.db_name = db_name
+        self.db_user = db_user
+        self.db_pass = db_pass
+        self.max_attempts = max_attempts
+        self.stale_after_minutes = stale_after_minutes
+
+    def get_connection(self):
+        """Create database connection (pooled when database.pool is configured)"""
+        return connect(
+            host=self.db_host,
+            database=self.db_name,
+            user=self.db_user,
+            password=self.db_pass
+        )
+
+    def enqueue(self, payment_data, citizen_info, service_info, cursor=None):
+        """Queue a receipt for rendering (no-op if one is already queued for the transaction)
+
+        Pass the caller's cursor to queue inside its transaction (the gateway
+        does this so a completed payment and its receipt job commit together);
+        errors then propagate to the caller instead of being returned.
+        """
+        result = {
+            "success": True,
+            "transaction_id": payment_data['transaction_id'],
+            "status": "queued",
+            "message": "Receipt queued for generation"
+        }
+
+        if cursor is not None:
+            self._insert(cursor, payment_data, citizen_info, service_info)
+            return result
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            self._insert(cursor, payment_data, citizen_info, service_info)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": f"Could not queue receipt: {str(e)}"}
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def payload(payment_data, citizen_info, service_info):
+        """Job payload stored in receipt_jobs.payload"""
+        return {
+            "payment_data": payment_data,
+            "citizen_info": citizen_info,
+            "service_info": service_info
+        }
+
+    def _insert(self, cursor, payment_data, citizen_info, service_info):
+        cursor.execute(
+            INSERT_JOB,
+            (payment_data['transaction_id'], Json(self.payload(payment_data, citizen_info, service_info)))
+        )
+        # Delivered to workers on commit
+        cursor.execute("SELECT pg_notify(%s, %s)", (self.CHANNEL, payment_data['transaction_id']))
+
+    def get_job(self, transaction_id):
+        """Get receipt job status by transaction ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                SELECT transaction_id, status, attempts, filepath, error, created_at, finished_at
+                FROM receipt_jobs
+                WHERE transaction_id = %s
+                """,
+                (transaction_id,)
+            )
+            row = cursor.fetchone()
+            if row:
+                return {
+                    "transaction_id": row[0],
+                    "status": row[1],
+                    "attempts": row[2],
+                    "filepath": row[3],
+                    "error": row[4],
+                    "created_at": row[5],
+                    "finished_at": row[6]
+                }
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    def backlog(self):
+        """Jobs waiting or rendering, and the age in seconds of the oldest queued one"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                SELECT COUNT(*) FILTER (WHERE status = 'queued'),
+                       COUNT(*) FILTER (WHERE status = 'processing'),
+                       EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE status = 'queued'))
+                FROM receipt_jobs
+                WHERE status IN ('queued', 'processing')
+                """
+            )
+            queued, processing, oldest = cursor.fetchone()
+            return {
+                "queued": queued,
+                "processing": processing,
+                "oldest_queued_seconds": round(float(oldest), 1) if oldest is not None else None
+            }
+        finally:
+            cursor.close()
+            conn.close()
+
+    def claim(self, conn, limit=10):
+        """Claim queued (or stale in-progress) jobs for this worker"""
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE receipt_jobs
+                SET status = 'processing', attempts = attempts + 1, started_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM receipt_jobs
+                    WHERE status = 'queued'
+                       OR (status = 'processing'
+                           AND started_at < NOW() - %s * INTERVAL '1 minute')
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT %s
+                )
+                RETURNING id, transaction_id, payload, attempts
+                """,
+                (self.stale_after_minutes, limit)
+            )
+            jobs = [
+                {"id": row[0], "transaction_id": row[1], "payload": row[2], "attempts": row[3]}
+                for row in cursor.fetchall()
+            ]
+            conn.commit()
+            return jobs
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def complete(self, conn, job_id, filepath):
+        """Mark a job as rendered"""
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                """
+                UPDATE receipt_jobs
+                SET status = 'done', filepath = %s, error = NULL, finished_at = NOW()
+                WHERE id = %s
+                """,
+                (filepath, job_id)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def fail(self, conn, job, error):
+        """Requeue a failed job, or give up after max_attempts"""
+        cursor = conn.cursor()
+        status = 'failed' if job['attempts'] >= self.max_attempts else 'queued'
+
+        try:
+            cursor.execute(
+                """
+                UPDATE receipt_jobs
+                SET status = %s, error = %s, finished_at = NOW()
+                WHERE id = %s
+                """,
+                (status, error, job['id'])
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+class ReceiptWorker:
+    """Render queued receipts; styles are built once per worker"""
+
+    def __init__(self, queue, output_dir="receipts", batch_size=10, poll_interval=5.0):
+        self.queue = queue
+        self.generator = ReceiptGenerator(output_dir=output_dir)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._running = True
+
+    def stop(self, *args):
+        """Finish the current batch and exit the run loop"""
+        self._running = False
+
+    def run_once(self, conn):
+        """Render one batch of claimed jobs; returns the number processed"""
+        jobs = self.queue.claim(conn, limit=self.batch_size)
+
+        for job in jobs:
+            payload = job['payload']
+            try:
+                result = self.generator.generate_receipt(
+                    payment_data=payload['payment_data'],
+                    citizen_info=payload['citizen_info'],
+                    service_info=payload['service_info']
+                )
+                self.queue.complete(conn, job['id'], result['filepath'])
+            except Exception as e:
+                self.queue.fail(conn, job, str(e))
+
+        return len(jobs)
+
+    def run(self):
+        """Process jobs until stopped, sleeping on LISTEN between empty polls"""
+        conn = self.queue.get_connection()
+        # LISTEN holds its connection for the worker's lifetime, so never take it from a pool
+        listen_conn = psycopg2.connect(host=self.queue.db_host, database=self.queue.db_name,
+                                       user=self.queue.db_user, password=self.queue.db_pass)
+        listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        listen_cursor = listen_conn.cursor()
+        listen_cursor.execute(f"LISTEN {ReceiptQueue.CHANNEL}")
+
+        try:
+            while self._running:
+                if self.run_once(conn):
+                    continue
+
+                # Queue is empty; wait for a NOTIFY or the poll interval
+                if select.select([listen_conn], [], [], self.poll_interval) != ([], [], []):
+                    listen_conn.poll()
+                    listen_conn.notifies.clear()
+        finally:
+            listen_cursor.close()
+            listen_conn.close()
+            conn.close()
+
+
+def _worker_main(db_config, output_dir, batch_size):
+    """Process entry point for a pooled receipt worker"""
+    worker = ReceiptWorker(ReceiptQueue(**db_config), output_dir=output_dir, batch_size=batch_size)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+def run_worker_pool(db_config, workers=2, output_dir="receipts", batch_size=10):
+    """Start a pool of receipt worker processes and wait for them to exit"""
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(db_config, output_dir, batch_size), daemon=False)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def main():
+    """Command-line entry point: python -m payment_system.receipt_queue"""
+    parser = argparse.ArgumentParser(description="Run CanConnect receipt rendering workers")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--output-dir", default="receipts")
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+
+    db_config = {
+        "db_host": os.getenv("DB_HOST", "localhost"),
+        "db_name": os.getenv("DB_NAME", "canconnect"),
+        "db_user": os.getenv("DB_USER", "postgres"),
+        "db_pass": os.getenv("DB_PASS", "password")
+    }
+    print(f"Starting {args.workers} receipt worker(s) writing to {args.output_dir}", file=sys.stderr)
+    run_worker_pool(db_config, workers=args.workers, output_dir=args.output_dir, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
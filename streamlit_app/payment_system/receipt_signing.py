@@ -0,0 +1,147 @@
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from datetime import datetime
+import argparse
+import base64
+import os
+
+# Bump when the payload layout changes; old receipts keep verifying under their version
+PAYLOAD_VERSION = "CCR1"
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class ReceiptSigner:
+    """Sign and verify the payload printed as a QR code on receipts
+
+    The payload is "CCR1|<transaction_id>|<amount>|<reference>|<unix time>|<signature>"
+    with an Ed25519 signature over everything before the last "|". Signing
+    needs the private key; verification needs only the public key, so kiosks
+    can check a receipt offline and without any way to mint new ones.
+    """
+
+    def __init__(self, private_key=None, public_key=None):
+        if private_key is None and public_key is None:
+            raise ValueError("A private or public key is required")
+        self.private_key = private_key
+        self.public_key = public_key or private_key.public_key()
+
+    @classmethod
+    def from_files(cls, private_key_path=None, public_key_path=None):
+        """Load PEM keys; returns None when no key is configured"""
+        private_key = public_key = None
+        if private_key_path:
+            with open(private_key_path, "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+        if public_key_path:
+            with open(public_key_path, "rb") as f:
+                public_key = serialization.load_pem_public_key(f.read())
+        if private_key is None and public_key is None:
+            return None
+        return cls(private_key=private_key, public_key=public_key)
+
+    @classmethod
+    def from_env(cls):
+        """Load keys from RECEIPT_SIGNING_KEY_PATH / RECEIPT_VERIFY_KEY_PATH"""
+        return cls.from_files(os.getenv("RECEIPT_SIGNING_KEY_PATH"), os.getenv("RECEIPT_VERIFY_KEY_PATH"))
+
+    @staticmethod
+    def generate_keys(out_dir):
+        """Write a new receipt_signing.pem / receipt_verify.pem key pair"""
+        os.makedirs(out_dir, exist_ok=True)
+        private_key = Ed25519PrivateKey.generate()
+
+        private_path = os.path.join(out_dir, "receipt_signing.pem")
+        public_path = os.path.join(out_dir, "receipt_verify.pem")
+        with open(private_path, "wb") as f:
+            f.write(private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ))
+        os.chmod(private_path, 0o600)
+        with open(public_path, "wb") as f:
+            f.write(private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ))
+        return {"private_key": private_path, "public_key": public_path}
+
+    @property
+    def can_sign(self):
+        return self.private_key is not None
+
+    def sign(self, transaction_id, amount, reference, paid_at):
+        """Build the signed QR payload for a receipt"""
+        if not self.can_sign:
+            raise ValueError("Signing requires the private key")
+
+        fields = [transaction_id, f"{float(amount):.2f}", str(reference), str(int(paid_at.timestamp()))]
+        if any("|" in field for field in fields):
+            raise ValueError("Receipt fields must not contain '|'")
+
+        body = "|".join([PAYLOAD_VERSION] + fields)
+        signature = self.private_key.sign(body.encode("utf-8"))
+        return f"{body}|{_b64encode(signature)}"
+
+    def verify(self, code):
+        """Check a scanned QR payload; never touches the database"""
+        parts = code.strip().split("|")
+        if len(parts) != 6 or parts[0] != PAYLOAD_VERSION:
+            return {"valid": False, "message": "Not a CanConnect receipt code"}
+
+        body, signature = code.strip().rsplit("|", 1)
+        try:
+            self.public_key.verify(_b64decode(signature), body.encode("utf-8"))
+        except (InvalidSignature, ValueError):
+            return {"valid": False, "message": "Signature does not match; receipt may be altered"}
+
+        _, transaction_id, amount, reference, timestamp, _ = parts
+        return {
+            "valid": True,
+            "transaction_id": transaction_id,
+            "amount": float(amount),
+            "reference_number": reference,
+            "paid_at": datetime.fromtimestamp(int(timestamp)).isoformat(),
+            "message": "Receipt signature is valid"
+        }
+
+
+def main():
+    """Command-line entry point: python -m payment_system.receipt_signing {keygen,verify}"""
+    parser = argparse.ArgumentParser(description="Receipt QR signing keys and offline verification")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    keygen = subparsers.add_parser("keygen", help="Generate a signing key pair")
+    keygen.add_argument("--out-dir", default="keys")
+
+    verify = subparsers.add_parser("verify", help="Verify a scanned receipt code")
+    verify.add_argument("code")
+    verify.add_argument("--public-key", default=os.getenv("RECEIPT_VERIFY_KEY_PATH", "keys/receipt_verify.pem"))
+    args = parser.parse_args()
+
+    if args.command == "keygen":
+        paths = ReceiptSigner.generate_keys(args.out_dir)
+        print(f"Signing key (keep on the receipt server): {paths['private_key']}")
+        print(f"Verify key (distribute to kiosks):        {paths['public_key']}")
+        return
+
+    result = ReceiptSigner.from_files(public_key_path=args.public_key).verify(args.code)
+    print(result["message"])
+    if result["valid"]:
+        print(f"  Transaction: {result['transaction_id']}")
+        print(f"  Amount:      ₱{result['amount']:,.2f}")
+        print(f"  Reference:   {result['reference_number']}")
+        print(f"  Paid at:     {result['paid_at']}")
+    raise SystemExit(0 if result["valid"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import pandas as pd
+from datetime import date, timedelta
+import argparse
+import io
+import os
+import uuid
+
+class SettlementReconciler:
+    """Reconcile payments against bank / e-wallet settlement files
+
+    Settlement CSVs are normalized with pandas, bulk-loaded into the
+    settlement_staging table with COPY, and matched against payments
+    set-wise in SQL (one statement per run, no per-line lookups).
+    """
+
+    DEFAULT_COLUMNS = {
+        "transaction_id": "transaction_id",
+        "amount": "amount",
+        "settled_at": "settled_at"
+    }
+
+    REPORT_COLUMNS = [
+        "category", "line_number", "transaction_id", "settled_amount", "settled_at",
+        "payment_amount", "paid_at", "payment_status", "payment_method"
+    ]
+
+    def __init__(self, gateway, output_dir="reconciliation", date_tolerance_days=1):
+        self.gateway = gateway
+        self.output_dir = output_dir
+        self.date_tolerance_days = date_tolerance_days
+
+    def read_settlement(self, csv_path, column_map=None):
+        """Load and normalize a settlement CSV into transaction_id / amount / settled_at"""
+        column_map = column_map or self.DEFAULT_COLUMNS
+        df = pd.read_csv(
+            csv_path,
+            usecols=list(column_map.values()),
+            dtype={column_map["transaction_id"]: "string"}
+        )
+        df = df.rename(columns={source: target for target, source in column_map.items()})
+
+        df["transaction_id"] = df["transaction_id"].str.strip()
+        df["amount"] = pd.to_numeric(df["amount"], errors="coerce").round(2)
+        df["settled_at"] = pd.to_datetime(df["settled_at"], errors="coerce")
+        df["line_number"] = range(1, len(df) + 1)
+        return df
+
+    def load(self, df, provider, batch_id=None):
+        """Bulk-load a normalized settlement frame into staging with COPY"""
+        batch_id = batch_id or uuid.uuid4().hex
+        staged = pd.DataFrame({
+            "batch_id": batch_id,
+            "provider": provider,
+            "transaction_id": df["transaction_id"],
+            "amount": df["amount"],
+            "settled_at": df["settled_at"],
+            "line_number": df["line_number"]
+        })
+
+        buffer = io.StringIO()
+        staged.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S")
+        buffer.seek(0)
+
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.copy_expert(
+                """
+                COPY settlement_staging (batch_id, provider, transaction_id, amount, settled_at, line_number)
+                FROM STDIN WITH (FORMAT csv)
+                """,
+                buffer
+            )
+            conn.commit()
+            return batch_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def match(self, batch_id, day, payment_methods=None):
+        """Classify every settlement line and every unsettled payment for the day"""
+        method_filter = ""
+        params = [batch_id, self.date_tolerance_days, day, day + timedelta(days=1), batch_id]
+        if payment_methods:
+            method_filter = "AND p.payment_method = ANY(%s)"
+            params.append(list(payment_methods))
+
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                f"""
+                WITH lines AS (
+                    SELECT s.*, COUNT(*) OVER (PARTITION BY s.transaction_id) AS occurrences
+                    FROM settlement_staging s
+                    WHERE s.batch_id = %s
+                )
+                SELECT
+                    CASE
+                        WHEN l.transaction_id IS NULL OR l.amount IS NULL THEN 'invalid_line'
+                        WHEN l.occurrences > 1 THEN 'duplicate_settlement'
+                        WHEN p.id IS NULL THEN 'missing_payment'
+                        WHEN p.status <> 'Completed' THEN 'status_mismatch'
+                        WHEN p.amount <> l.amount THEN 'amount_mismatch'
+                        WHEN l.settled_at IS NULL
+                          OR ABS(l.settled_at::date - p.paid_at::date) > tolerance.days THEN 'date_mismatch'
+                        ELSE 'matched'
+                    END,
+                    l.line_number, l.transaction_id, l.amount, l.settled_at,
+                    p.amount, p.paid_at, p.status, p.payment_method
+                FROM lines l
+                CROSS JOIN (SELECT %s::int AS days) tolerance
+                LEFT JOIN payments p ON p.transaction_id = l.transaction_id
+
+                UNION ALL
+
+                SELECT 'missing_settlement', NULL, p.transaction_id, NULL, NULL,
+                       p.amount, p.paid_at, p.status, p.payment_method
+                FROM payments p
+                WHERE p.paid_at >= %s AND p.paid_at < %s
+                  AND p.status = 'Completed'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM settlement_staging s
+                      WHERE s.batch_id = %s AND s.transaction_id = p.transaction_id
+                  )
+                  {method_filter}
+                """,
+                params
+            )
+            return pd.DataFrame(cursor.fetchall(), columns=self.REPORT_COLUMNS)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def discard(self, batch_id):
+        """Remove a batch from staging"""
+        conn = self.gateway.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("DELETE FROM settlement_staging WHERE batch_id = %s", (batch_id,))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def write_reports(self, results, provider, day):
+        """Write matched / unmatched / mismatch CSVs and return their paths"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{provider}_{day.isoformat()}")
+
+        matched = results["category"] == "matched"
+        unmatched = results["category"].isin(["missing_payment", "missing_settlement", "invalid_line"])
+        mismatched = ~(matched | unmatched)
+
+        paths = {
+            "matched": f"{prefix}_matched.csv",
+            "unmatched": f"{prefix}_unmatched.csv",
+            "mismatch": f"{prefix}_mismatch.csv"
+        }
+        results[matched].to_csv(paths["matched"], index=False)
+        results[unmatched].to_csv(paths["unmatched"], index=False)
+        results[mismatched].to_csv(paths["mismatch"], index=False)
+        return paths
+
+    def reconcile(self, csv_path, provider, day, column_map=None, payment_methods=None, keep_staging=False):
+        """Run the full pipeline for one settlement file"""
+        try:
+            df = self.read_settlement(csv_path, column_map)
+            batch_id = self.load(df, provider)
+            try:
+                results = self.match(batch_id, day, payment_methods)
+            finally:
+                if not keep_staging:
+                    self.discard(batch_id)
+
+            reports = self.write_reports(results, provider, day)
+            summary = results["category"].value_counts().to_dict()
+
+            return {
+                "success": True,
+                "batch_id": batch_id,
+                "lines": len(df),
+                "summary": summary,
+                "reports": reports,
+                "message": f"Reconciled {len(df)} settlement lines: "
+                           f"{summary.get('matched', 0)} matched"
+            }
+        except Exception as e:
+            return {"success": False, "message": f"Reconciliation failed: {str(e)}"}
+
+
+def main():
+    """Command-line entry point: python -m payment_system.reconciliation FILE --provider NAME"""
+    from .gateway import PaymentGateway
+
+    parser = argparse.ArgumentParser(description="Reconcile a settlement file against payments")
+    parser.add_argument("csv_path")
+    parser.add_argument("--provider", required=True)
+    parser.add_argument("--date", default=(date.today() - timedelta(days=1)).isoformat())
+    parser.add_argument("--methods", nargs="*", help="Payment methods settled by this provider")
+    parser.add_argument("--output-dir", default="reconciliation")
+    args = parser.parse_args()
+
+    gateway = PaymentGateway(
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_NAME", "canconnect"),
+        os.getenv("DB_USER", "postgres"),
+        os.getenv("DB_PASS", "password")
+    )
+    reconciler = SettlementReconciler(gateway, output_dir=args.output_dir)
+    result = reconciler.reconcile(
+        args.csv_path, args.provider, date.fromisoformat(args.date), payment_methods=args.methods
+    )
+    print(result["message"])
+    for category, count in result.get("summary", {}).items():
+        print(f"  {category}: {count}")
+
+
+if __name__ == "__main__":
+    main()
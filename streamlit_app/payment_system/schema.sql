@@ -39,6 +39,167 @@ CREATE TABLE IF NOT EXISTS receipts (
         REFERENCES payments(id) ON DELETE CASCADE
 );
 
+-- Create receipt rendering job queue (consumed by payment_system.receipt_queue workers)
+CREATE TABLE IF NOT EXISTS receipt_jobs (
+    id SERIAL PRIMARY KEY,
+    transaction_id VARCHAR(100) UNIQUE NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, processing, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    filepath VARCHAR(255),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Create idempotency key table (one stored result per client-supplied key)
+CREATE TABLE IF NOT EXISTS payment_idempotency_keys (
+    idempotency_key VARCHAR(255) PRIMARY KEY,
+    request_id INTEGER NOT NULL,
+    request_fingerprint VARCHAR(64) NOT NULL,
+    response JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create daily revenue rollup (maintained incrementally by trg_payment_daily_rollup)
+CREATE TABLE IF NOT EXISTS payment_daily_rollup (
+    day DATE NOT NULL,
+    payment_method VARCHAR(50) NOT NULL,
+    status VARCHAR(30) NOT NULL,
+    payment_count INTEGER NOT NULL DEFAULT 0,
+    total_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, payment_method, status)
+);
+
+CREATE OR REPLACE FUNCTION payment_daily_rollup_apply() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE payment_daily_rollup
+        SET payment_count = payment_count - 1,
+            total_amount = total_amount - OLD.amount
+        WHERE day = COALESCE(OLD.paid_at, OLD.created_at)::date
+          AND payment_method = OLD.payment_method
+          AND status = OLD.status;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO payment_daily_rollup (day, payment_method, status, payment_count, total_amount)
+        VALUES (COALESCE(NEW.paid_at, NEW.created_at)::date, NEW.payment_method, NEW.status, 1, NEW.amount)
+        ON CONFLICT (day, payment_method, status) DO UPDATE
+        SET payment_count = payment_daily_rollup.payment_count + 1,
+            total_amount = payment_daily_rollup.total_amount + EXCLUDED.total_amount;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_payment_daily_rollup ON payments;
+CREATE TRIGGER trg_payment_daily_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF amount, payment_method, status, paid_at ON payments
+    FOR EACH ROW EXECUTE FUNCTION payment_daily_rollup_apply();
+
+-- Create append-only payment ledger (one row per event, range-partitioned by month)
+CREATE TABLE IF NOT EXISTS payment_ledger (
+    id BIGSERIAL,
+    transaction_id VARCHAR(100) NOT NULL,
+    request_id INTEGER NOT NULL,
+    service_id INTEGER,
+    event_type VARCHAR(20) NOT NULL, -- attempted, completed, failed, refunded
+    amount DECIMAL(10,2) NOT NULL,
+    payment_method VARCHAR(50) NOT NULL,
+    provider_reference VARCHAR(100),
+    remarks TEXT,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (recorded_at, id)
+) PARTITION BY RANGE (recorded_at);
+
+-- Catches events outside the pre-created months (e.g. backfilled history, or a
+-- month reached before `python -m payment_system.ledger partitions` ran)
+CREATE TABLE IF NOT EXISTS payment_ledger_default PARTITION OF payment_ledger DEFAULT;
+
+-- Creates the month's partition. Rows for that month already in the default
+-- partition would make CREATE ... PARTITION OF fail, so the partition is built
+-- detached, the rows are moved into it, and it is attached afterwards.
+CREATE OR REPLACE FUNCTION payment_ledger_ensure_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::date;
+    month_end DATE := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    partition_name TEXT := 'payment_ledger_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    -- Serializes with concurrent inserts into the default partition while rows move
+    LOCK TABLE payment_ledger_default IN SHARE ROW EXCLUSIVE MODE;
+
+    EXECUTE format('CREATE TABLE %I (LIKE payment_ledger INCLUDING DEFAULTS)', partition_name);
+    PERFORM set_config('payment_ledger.moving_partition', 'on', true);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM payment_ledger_default WHERE recorded_at >= %L AND recorded_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        month_start, month_end, partition_name
+    );
+    PERFORM set_config('payment_ledger.moving_partition', 'off', true);
+    EXECUTE format(
+        'ALTER TABLE payment_ledger ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_end
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT payment_ledger_ensure_partition(CURRENT_DATE);
+SELECT payment_ledger_ensure_partition((CURRENT_DATE + INTERVAL '1 month')::date);
+
+CREATE OR REPLACE FUNCTION payment_ledger_reject_change() RETURNS TRIGGER AS $$
+BEGIN
+    -- payment_ledger_ensure_partition moving rows out of the default partition
+    IF TG_OP = 'DELETE' AND current_setting('payment_ledger.moving_partition', true) = 'on' THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'payment_ledger is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_payment_ledger_append_only ON payment_ledger;
+CREATE TRIGGER trg_payment_ledger_append_only
+    BEFORE UPDATE OR DELETE ON payment_ledger
+    FOR EACH ROW EXECUTE FUNCTION payment_ledger_reject_change();
+
+-- Create per-day, per-service ledger balance snapshots (written by PaymentLedger.snapshot_pending)
+CREATE TABLE IF NOT EXISTS payment_ledger_snapshots (
+    day DATE NOT NULL,
+    service_id INTEGER NOT NULL, -- 0 when the request no longer exists
+    payment_method VARCHAR(50) NOT NULL,
+    attempted_count INTEGER NOT NULL DEFAULT 0,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    refunded_count INTEGER NOT NULL DEFAULT 0,
+    collected_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    refunded_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, service_id, payment_method)
+);
+
+-- Days already folded into snapshots; balances read ledger events only after the latest one
+CREATE TABLE IF NOT EXISTS payment_ledger_snapshot_days (
+    day DATE PRIMARY KEY,
+    snapshot_rows INTEGER NOT NULL,
+    taken_at TIMESTAMP NOT NULL
+);
+
+-- Create settlement staging table (bulk-loaded with COPY by payment_system.reconciliation)
+CREATE UNLOGGED TABLE IF NOT EXISTS settlement_staging (
+    batch_id VARCHAR(64) NOT NULL,
+    provider VARCHAR(50) NOT NULL,
+    transaction_id VARCHAR(100),
+    amount DECIMAL(10,2),
+    settled_at TIMESTAMP,
+    line_number INTEGER NOT NULL
+);
+
 -- Create payment statistics view
 CREATE OR REPLACE VIEW payment_statistics AS
 SELECT 
@@ -57,7 +218,18 @@ ORDER BY payment_date DESC;
 
 -- Create indexes for performance
 CREATE INDEX IF NOT EXISTS idx_payments_request_id ON payments(request_id);
-CREATE INDEX IF NOT EXISTS idx_payments_transaction_id ON payments(transaction_id);
+-- transaction_id lookups use the index behind its UNIQUE constraint
+DROP INDEX IF EXISTS idx_payments_transaction_id;
+CREATE UNIQUE INDEX IF NOT EXISTS payments_transaction_id_key ON payments(transaction_id);
 CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
-CREATE INDEX IF NOT EXISTS idx_payments_paid_at ON payments(paid_at);
+-- Composite indexes backing keyset-paginated history on (paid_at, id)
+DROP INDEX IF EXISTS idx_payments_paid_at;
+CREATE INDEX IF NOT EXISTS idx_payments_paid_at_id ON payments(paid_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_payments_request_paid_at ON payments(request_id, paid_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_payments_status_paid_at ON payments(status, paid_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_payments_method_paid_at ON payments(payment_method, paid_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_payment_history_payment_id ON payment_history(payment_id);
+CREATE INDEX IF NOT EXISTS idx_receipt_jobs_status ON receipt_jobs(status, id);
+CREATE INDEX IF NOT EXISTS idx_settlement_staging_batch ON settlement_staging(batch_id, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_payment_idempotency_created ON payment_idempotency_keys(created_at);
+CREATE INDEX IF NOT EXISTS idx_payment_ledger_transaction ON payment_ledger(transaction_id);
@@ -0,0 +1,272 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import secrets
+from typing import Dict, List, Optional
+
+from user_management.manager import UserManager
+
+class AsyncUserManager(UserManager):
+    """UserManager for asyncio servers, backed by a psycopg 3 AsyncConnectionPool
+
+    Same methods and return values as UserManager, as coroutines. bcrypt is
+    CPU-bound, so hashing and checking run on a thread pool instead of the
+    event loop.
+    """
+
+    def __init__(self, pool, executor=None):
+        self.pool = pool
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="bcrypt")
+
+    async def _run_cpu(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def create_user(self, username: str, email: str, password: str, full_name: str,
+                          phone: str = None, user_type: str = 'citizen') -> Dict:
+        """Create new user account"""
+        async with self.pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    # Check if user exists
+                    await cursor.execute(
+                        "SELECT id FROM users WHERE username = %s OR email = %s",
+                        (username, email)
+                    )
+                    if await cursor.fetchone():
+                        return {"success": False, "message": "Username or email already exists"}
+
+                    # Hash password
+                    password_hash = await self._run_cpu(self.hash_password, password)
+
+                    # Create user
+                    await cursor.execute("""
+                        INSERT INTO users
+                        (username, email, password_hash, full_name, phone, user_type, status)
+                        VALUES (%s, %s, %s, %s, %s, %s, 'active')
+                        RETURNING id
+                    """, (username, email, password_hash, full_name, phone, user_type))
+
+                    user_id = (await cursor.fetchone())[0]
+
+                    # Create user preferences
+                    await cursor.execute("INSERT INTO user_preferences (user_id) VALUES (%s)", (user_id,))
+
+                await conn.commit()
+
+                return {
+                    "success": True,
+                    "user_id": user_id,
+                    "message": "User created successfully"
+                }
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def login(self, username_or_email: str, password: str, ip_address: str = None) -> Dict:
+        """Authenticate user and create session"""
+        async with self.pool.connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    # Find user
+                    await cursor.execute("""
+                        SELECT id, password_hash, status, user_type
+                        FROM users
+                        WHERE (username = %s OR email = %s) AND status = 'active'
+                    """, (username_or_email, username_or_email))
+
+                    result = await cursor.fetchone()
+                    if not result:
+                        return {"success": False, "message": "Invalid credentials"}
+
+                    user_id, password_hash, status, user_type = result
+
+                # Verify password off the event loop, without holding a transaction open
+                await conn.rollback()
+                if not await self._run_cpu(self.verify_password, password, password_hash):
+                    return {"success": False, "message": "Invalid credentials"}
+
+                # Create session
+                token = secrets.token_urlsafe(32)
+                expires_at = datetime.now() + timedelta(days=7)
+
+                async with conn.cursor() as cursor:
+                    await cursor.execute("""
+                        INSERT INTO user_sessions
+                        (user_id, token, ip_address, expires_at)
+                        VALUES (%s, %s, %s, %s)
+                    """, (user_id, token, ip_address, expires_at))
+
+                    # Update last login
+                    await cursor.execute("UPDATE users SET last_login = NOW() WHERE id = %s", (user_id,))
+
+                await conn.commit()
+
+                return {
+                    "success": True,
+                    "user_id": user_id,
+                    "token": token,
+                    "user_type": user_type,
+                    "expires_at": expires_at.isoformat(),
+                    "message": "Login successful"
+                }
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def verify_token(self, token: str) -> Optional[Dict]:
+        """Verify session token"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("""
+                    SELECT us.user_id, u.username, u.email, u.full_name, u.user_type, us.expires_at
+                    FROM user_sessions us
+                    JOIN users u ON us.user_id = u.id
+                    WHERE us.token = %s AND us.expires_at > NOW()
+                """, (token,))
+
+                result = await cursor.fetchone()
+                if result:
+                    return {
+                        "user_id": result[0],
+                        "username": result[1],
+                        "email": result[2],
+                        "full_name": result[3],
+                        "user_type": result[4],
+                        "expires_at": result[5]
+                    }
+                return None
+
+    async def logout(self, token: str) -> Dict:
+        """Invalidate session"""
+        async with self.pool.connection() as conn:
+            try:
+                await conn.execute("DELETE FROM user_sessions WHERE token = %s", (token,))
+                await conn.commit()
+                return {"success": True, "message": "Logged out successfully"}
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def get_user_profile(self, user_id: int, fields=None) -> Optional[Dict]:
+        """Get user profile information (only the given fields when fields is set)"""
+        query, names = self._profile_query(fields)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, (user_id,))
+
+                result = await cursor.fetchone()
+                if result:
+                    return self._profile_from_row(names, result)
+                return None
+
+    async def update_user_profile(self, user_id: int, updates: Dict) -> Dict:
+        """Update user profile information"""
+        update_fields = []
+        values = []
+
+        allowed_fields = ['full_name', 'phone', 'address', 'barangay', 'municipality', 'province']
+        for field in allowed_fields:
+            if field in updates:
+                update_fields.append(f"{field} = %s")
+                values.append(updates[field])
+
+        async with self.pool.connection() as conn:
+            try:
+                if update_fields:
+                    values.append(user_id)
+                    query = f"UPDATE users SET {', '.join(update_fields)}, updated_at = NOW() WHERE id = %s"
+                    await conn.execute(query, values)
+                    await conn.commit()
+
+                return {"success": True, "message": "Profile updated successfully"}
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def change_password(self, user_id: int, old_password: str, new_password: str) -> Dict:
+        """Change user password"""
+        async with self.pool.connection() as conn:
+            try:
+                # Get current password hash
+                cursor = await conn.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
+                result = await cursor.fetchone()
+                await conn.rollback()
+                if not result:
+                    return {"success": False, "message": "User not found"}
+
+                # Verify old password and hash the new one off the event loop
+                if not await self._run_cpu(self.verify_password, old_password, result[0]):
+                    return {"success": False, "message": "Current password is incorrect"}
+                new_hash = await self._run_cpu(self.hash_password, new_password)
+
+                # Update password
+                await conn.execute(
+                    "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE id = %s",
+                    (new_hash, user_id)
+                )
+                await conn.commit()
+
+                return {"success": True, "message": "Password changed successfully"}
+
+            except Exception as e:
+                await conn.rollback()
+                return {"success": False, "message": str(e)}
+
+    async def list_staff(self, department_id: int = None) -> List[Dict]:
+        """List staff members"""
+        query = """
+            SELECT u.id, u.username, u.full_name, sr.role, d.name, u.status
+            FROM users u
+            LEFT JOIN staff_roles sr ON u.id = sr.user_id
+            LEFT JOIN departments d ON sr.department_id = d.id
+            WHERE u.user_type IN ('staff', 'admin') {department_filter}
+            ORDER BY u.full_name
+        """
+        async with self.pool.connection() as conn:
+            if department_id:
+                cursor = await conn.execute(query.format(department_filter="AND d.id = %s"), (department_id,))
+            else:
+                cursor = await conn.execute(query.format(department_filter=""))
+
+            return [
+                {
+                    "id": row[0],
+                    "username": row[1],
+                    "full_name": row[2],
+                    "role": row[3],
+                    "department": row[4],
+                    "status": row[5]
+                }
+                for row in await cursor.fetchall()
+            ]
+
+    async def get_user_statistics(self) -> Dict:
+        """Get user statistics"""
+        async with self.pool.connection() as conn:
+            # Total users by type
+            cursor = await conn.execute("""
+                SELECT user_type, COUNT(*) FROM users WHERE status = 'active'
+                GROUP BY user_type
+            """)
+
+            stats = {
+                "total_active": 0,
+                "by_type": {},
+                "new_users_this_month": 0
+            }
+
+            for row in await cursor.fetchall():
+                stats["by_type"][row[0]] = row[1]
+                stats["total_active"] += row[1]
+
+            # New users this month
+            cursor = await conn.execute("""
+                SELECT COUNT(*) FROM users
+                WHERE created_at >= DATE_TRUNC('month', NOW())
+            """)
+            stats["new_users_this_month"] = (await cursor.fetchone())[0]
+
+            return stats
@@ -1,9 +1,31 @@
-import psycopg2
+from database.instrumentation import timed
+from database.pool import connect
+from database.projection import column_list, select_fields
 from datetime import datetime, timedelta
 import bcrypt
 import secrets
 from typing import Dict, List, Optional, Tuple
 
+PREFERENCE_KEYS = ("notification_email", "notification_sms", "language", "timezone")
+
+# Profile fields selectable with fields=..., in response order
+PROFILE_COLUMNS = {
+    "id": "u.id",
+    "username": "u.username",
+    "email": "u.email",
+    "full_name": "u.full_name",
+    "phone": "u.phone",
+    "address": "u.address",
+    "barangay": "u.barangay",
+    "municipality": "u.municipality",
+    "province": "u.province",
+    "user_type": "u.user_type",
+    "status": "u.status",
+    "created_at": "u.created_at",
+    "last_login": "u.last_login",
+    "preferences": ", ".join(f"up.{key}" for key in PREFERENCE_KEYS)
+}
+
 class UserManager:
     """Manage user accounts, authentication, and sessions"""
     
@@ -14,8 +36,8 @@ class UserManager:
         self.db_pass = db_pass
     
     def get_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(
+        """Create database connection (pooled when database.pool is configured)"""
+        return connect(
             host=self.db_host,
             database=self.db_name,
             user=self.db_user,
@@ -24,11 +46,13 @@ class UserManager:
     
     def hash_password(self, password: str) -> str:
         """Hash password with bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with timed("bcrypt_seconds"):
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
     def verify_password(self, password: str, hash_value: str) -> bool:
         """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hash_value.encode('utf-8'))
+        with timed("bcrypt_seconds"):
+            return bcrypt.checkpw(password.encode('utf-8'), hash_value.encode('utf-8'))
     
     def create_user(self, username: str, email: str, password: str, full_name: str,
                    phone: str = None, user_type: str = 'citizen') -> Dict:
@@ -183,45 +207,42 @@ class UserManager:
             cursor.close()
             conn.close()
     
-    def get_user_profile(self, user_id: int) -> Optional[Dict]:
-        """Get user profile information"""
+    def _profile_query(self, fields=None) -> Tuple[str, List[str]]:
+        """SELECT for get_user_profile limited to fields, and the field names it returns"""
+        names = select_fields(PROFILE_COLUMNS, fields, required=("id",))
+        # The preferences join is only paid for when preferences are asked for
+        join = "LEFT JOIN user_preferences up ON u.id = up.user_id" if "preferences" in names else ""
+        query = f"""
+            SELECT {column_list(PROFILE_COLUMNS, names)}
+            FROM users u
+            {join}
+            WHERE u.id = %s
+        """
+        return query, names
+    
+    @staticmethod
+    def _profile_from_row(names: List[str], row) -> Dict:
+        values = iter(row)
+        profile = {}
+        for name in names:
+            if name == "preferences":
+                profile["preferences"] = {key: next(values) for key in PREFERENCE_KEYS}
+            else:
+                profile[name] = next(values)
+        return profile
+    
+    def get_user_profile(self, user_id: int, fields=None) -> Optional[Dict]:
+        """Get user profile information (only the given fields when fields is set)"""
+        query, names = self._profile_query(fields)
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute("""
-                SELECT u.id, u.username, u.email, u.full_name, u.phone,
-                       u.address, u.barangay, u.municipality, u.province,
-                       u.user_type, u.status, u.created_at, u.last_login,
-                       up.notification_email, up.notification_sms, up.language, up.timezone
-                FROM users u
-                LEFT JOIN user_preferences up ON u.id = up.user_id
-                WHERE u.id = %s
-            """, (user_id,))
+            cursor.execute(query, (user_id,))
             
             result = cursor.fetchone()
             if result:
-                return {
-                    "id": result[0],
-                    "username": result[1],
-                    "email": result[2],
-                    "full_name": result[3],
-                    "phone": result[4],
-                    "address": result[5],
-                    "barangay": result[6],
-                    "municipality": result[7],
-                    "province": result[8],
-                    "user_type": result[9],
-                    "status": result[10],
-                    "created_at": result[11],
-                    "last_login": result[12],
-                    "preferences": {
-                        "notification_email": result[13],
-                        "notification_sms": result[14],
-                        "language": result[15],
-                        "timezone": result[16]
-                    }
-                }
+                return self._profile_from_row(names, result)
             return None
         finally:
             cursor.close()